@@ -0,0 +1,120 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+#
+# Linux mount table read from /proc/self/mountinfo.
+import os
+import re
+import select
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+MountEntry = namedtuple('MountEntry', ['mountpoint', 'source', 'fstype'])
+
+
+def _unescape_mountinfo(value):
+    """Mountinfo escape space, tab, newline and backslash using octal notation."""
+    return re.sub(r'\\([0-7]{3})', lambda m: chr(int(m[1], 8)), value)
+
+
+def _parse_mountinfo(data):
+    """
+    Parse content of /proc/self/mountinfo into a list of MountEntry.
+    Format: <id> <parent> <major:minor> <root> <mountpoint> <options> [<optional>...] - <fstype> <source> <super options>
+    """
+    entries = []
+    for line in data.splitlines():
+        fields = line.split(' ')
+        try:
+            sep = fields.index('-', 6)
+            entries.append(
+                MountEntry(
+                    Path(_unescape_mountinfo(fields[4])),
+                    _unescape_mountinfo(fields[sep + 2]),
+                    _unescape_mountinfo(fields[sep + 1]),
+                )
+            )
+        except (ValueError, IndexError):
+            continue  # Ignore invalid line
+    return entries
+
+
+class _MountTable:
+    """
+    In-memory copy of the mount table read from /proc/self/mountinfo. The
+    kernel signal any change to the mount table by raising POLLPRI on the
+    file, so the table and the device information derived from it are
+    only read again when a filesystem get mounted or unmounted.
+    """
+
+    MOUNTINFO = '/proc/self/mountinfo'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fd = None
+        self._poll = None
+        self._entries = None
+        self._devices = {}
+
+    def _changed(self):
+        if self._entries is None or self._poll is None:
+            return True
+        return bool(self._poll.poll(0))
+
+    def _reload(self):
+        if self._fd is None:
+            try:
+                self._fd = os.open(self.MOUNTINFO, os.O_RDONLY)
+                self._poll = select.poll()
+                self._poll.register(self._fd, select.POLLPRI | select.POLLERR)
+            except OSError:
+                self._fd = self._poll = None
+        if self._fd is not None:
+            # Reading the file from the start acknowledge the change.
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            chunks = []
+            while True:
+                chunk = os.read(self._fd, 65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            data = b''.join(chunks).decode('utf-8', errors='surrogateescape')
+        else:
+            data = Path(self.MOUNTINFO).read_text(errors='surrogateescape')
+        self._entries = _parse_mountinfo(data)
+        self._devices = {}
+
+    def entries(self):
+        with self._lock:
+            if self._changed():
+                self._reload()
+            return self._entries
+
+    def find(self, path):
+        """
+        Return the mount entry of the file system hosting `path` using the
+        longest mount point containing it. When stacked, the last one is visible.
+        """
+        path = Path(path)
+        found = None
+        for entry in self.entries():
+            if entry.mountpoint == path or entry.mountpoint in path.parents:
+                if found is None or len(entry.mountpoint.parts) >= len(found.mountpoint.parts):
+                    found = entry
+        return found
+
+    def device_info(self, entry, func):
+        """
+        Return device information of the mount entry computed by `func` and
+        cached until the mount table change. The cache is keyed on the entry
+        since the same source may be mounted multiple times.
+        """
+        self.entries()
+        devices = self._devices
+        if entry not in devices:
+            devices[entry] = func(entry)
+        return devices[entry]
+
+
+_mount_table = _MountTable()
@@ -251,7 +251,7 @@ class Backup:
 
         Set `force` to True to link even if the repository name already exists.
         """
-        from minarca_client.core.rdiffweb import Rdiffweb
+        from minarca_client.core.rdiffweb import AsyncRdiffweb, Rdiffweb
 
         logger.debug(
             f"Configuring remote instance with URL: {remoteurl}, username: {username}, repositoryname: {repositoryname}, force: {force}"
@@ -260,9 +260,10 @@ class Backup:
         _check_repositoryname(repositoryname)
 
         # Connect to remote server to get more information.
-        conn = Rdiffweb(remoteurl)
-        conn.auth = (username, password)
-        current_user = await asyncio.get_running_loop().run_in_executor(None, conn.get_current_user_info)
+        client = Rdiffweb(remoteurl)
+        client.auth = (username, password)
+        conn = AsyncRdiffweb(client)
+        current_user = await conn.get_current_user_info()
 
         # Check if the settings already exist.
         others = [
@@ -292,7 +293,7 @@ class Backup:
         await instance._push_identity(conn, repositoryname)
 
         # Store minarca identity
-        minarca_info = await asyncio.get_running_loop().run_in_executor(None, conn.get_minarca_info)
+        minarca_info = await conn.get_minarca_info()
         await file_write_async(instance.known_hosts, minarca_info['identity'])
 
         # Create default config
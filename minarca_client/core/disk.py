@@ -21,6 +21,33 @@ logger = logging.getLogger(__name__)
 
 DeviceInfo = namedtuple('DeviceInfo', ['caption', 'device_type', 'fstype'])
 
+# Network file systems that may hang when the server is not reachable.
+REMOTE_FSTYPES = {'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afpfs', 'fuse.sshfs', 'sshfs', 'davfs', 'webdav', '9p'}
+
+# Virtual file systems that never contains a backup destination.
+PSEUDO_FSTYPES = {
+    'autofs',
+    'binfmt_misc',
+    'bpf',
+    'cgroup',
+    'cgroup2',
+    'configfs',
+    'debugfs',
+    'devfs',
+    'devpts',
+    'devtmpfs',
+    'efivarfs',
+    'fusectl',
+    'hugetlbfs',
+    'mqueue',
+    'nsfs',
+    'proc',
+    'pstore',
+    'securityfs',
+    'sysfs',
+    'tracefs',
+}
+
 
 class LocationInfo(
     namedtuple('LocationInfo', ['mountpoint', 'relpath', 'caption', 'free', 'used', 'size', 'fstype', 'device_type'])
@@ -120,26 +147,35 @@ if IS_WINDOWS:
 
 elif IS_LINUX:
 
-    def _get_device_fstype_linux(device):
-        """Return the file system type."""
-        # On Linux the most reliable source for fstype is findmntcommand line.
-        data = subprocess.check_output(["findmnt", "-no", "FSTYPE", str(device)], env={'LANG': 'en_US'}, text=True)
-        return data.strip()
+    from ._disk_linux import _mount_table  # noqa
+
+    def _get_device_linux(filename):
+        """Return the mount entry of the file system hosting a file."""
+        assert isinstance(filename, Path)
+        # Resolve symlinks to lookup the file system of the target. The mount point may not be in the mount table
+        # for unmounted btrfs subvolume, in which case the mount point containing it is used.
+        return _mount_table.find(_get_mountpoint_posix(filename.resolve()))
 
-    def _get_device_info_linux(device):
+    def _get_device_info_linux(entry):
         """Return detail information about the device hosting this file. .e.g.: fstype, caption and removable."""
+        if entry is None:
+            return None
+        return _mount_table.device_info(entry, _read_device_info_linux)
 
-        # On MacOS and Linux, psutil is working well to get fstype
-        fstype = _get_device_fstype_linux(device)
+    def _read_device_info_linux(entry):
+        # The file system type is taken from the mount entry since the same
+        # source (e.g.: tmpfs, none or bind mount) may be mounted multiple times.
+        device = entry.source
+        fstype = entry.fstype
 
         # On Linux will get block device information from /sys
         try:
             # The given device is a partition, so get the parent block device from /sys
             device_name = (Path('/sys/class/block') / Path(device).name).readlink().parent.resolve().name
             device_path = Path('/sys/class/block/') / device_name
-        except FileNotFoundError:
+        except (FileNotFoundError, OSError):
             # This happen for non-block device like remote share.
-            return DeviceInfo(device, LocationInfo.REMOTE, 'unknown')
+            return DeviceInfo(device, LocationInfo.REMOTE, fstype or 'unknown')
 
         # Determine the device_type using /sys/class/block/*/removable
         try:
@@ -158,7 +194,7 @@ elif IS_LINUX:
         return DeviceInfo(caption, device_type, fstype)
 
     _get_mountpoint = _get_mountpoint_posix
-    _get_device = _get_device_posix
+    _get_device = _get_device_linux
     _get_device_info = _get_device_info_linux
 
 if IS_MAC:
@@ -214,16 +250,21 @@ if IS_MAC:
     _get_device_info = _get_device_info_macos
 
 
-def list_disks():
+def list_disks(local_only=False):
     """
     Try to list external disk drive.
+    Set `local_only` to exclude network and virtual file systems.
     """
     disks = []
     parts = psutil.disk_partitions()
     for part in parts:
-        if 'ro' in part.opts.split(','):
+        opts = part.opts.split(',')
+        if 'ro' in opts:
             # Ignore readonly partition
             continue
+        if local_only and (part.fstype.lower() in REMOTE_FSTYPES | PSEUDO_FSTYPES or 'remote' in opts):
+            # Ignore network share and virtual file system
+            continue
         disks.append(Path(part.mountpoint))
     return disks
 
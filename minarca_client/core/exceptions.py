@@ -56,13 +56,15 @@ def handle_http_errors(func):
     """
 
     async def wrapper(self, *args, **kwargs):
-        from requests.exceptions import ConnectionError, HTTPError, InvalidSchema, MissingSchema
+        from requests.exceptions import ConnectionError, HTTPError, InvalidSchema, MissingSchema, Timeout
 
         try:
             return await func(self, *args, **kwargs)
         except ConnectionError as e:
             cause = _find_exception_with(e, 'strerror')
             raise HttpConnectionError(cause or str(e)) from e
+        except Timeout as e:
+            raise HttpConnectionError(str(e)) from e
         except (MissingSchema, InvalidSchema) as e:
             raise HttpInvalidUrlError(str(e)) from e
         except HTTPError as e:
@@ -170,10 +172,24 @@ class KivyError(Exception):
 
 class RestoreFail(BackupError):
     """
-    Reserved for future use.
+    Raised when multiple restore operations executed concurrently fail.
+
+    Each group of files and folders is restored independently. The errors
+    raised by every failing group are available in `errors`. Check the logs
+    for more details.
     """
 
     error_code = 109
+    message = _('%s of %s restore operations failed: %s')
+
+    def __init__(self, errors, total):
+        self.errors = errors
+        details = []
+        for e in errors:
+            detail = getattr(e, 'message', None) or str(e)
+            if detail not in details:
+                details.append(detail)
+        self.message = RestoreFail.message % (len(errors), total, ' '.join(details))
 
 
 class InterruptedError(Exception):
@@ -706,6 +722,13 @@ class CaptureException:
     exception = None
     _priority = -1
 
+    @classmethod
+    def matches(cls, line):
+        """
+        Return True if the log line matches a known exception.
+        """
+        return any(error._matches(line) for error in cls._error_priorities)
+
     def parse(self, line):
         """
         Search for error in given log line. If an error is found, an exception is created in `self.exception`.
@@ -2,13 +2,16 @@
 # IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
 # Use is subject to license terms.
 import argparse
-import email
 import fnmatch
 import imaplib
+import json
 import logging
+import os
 import re
+import sqlite3
 import sys
 from email.header import decode_header as _decode
+from email.parser import BytesHeaderParser
 from email.utils import parsedate_to_datetime
 from pathlib import Path
 
@@ -19,6 +22,13 @@ from .exceptions import BackupError, IMAPListFolderError
 
 LAST_UID_FILE = '.last_uid'
 
+FOLDER_STATE_FILE = '.folder_state'
+
+ARCHIVE_INDEX_FILE = '.imap_index.db'
+
+# Messages are fetched by range of this size to keep memory usage bounded.
+FETCH_CHUNK_SIZE = 1024 * 1024
+
 logger = logging.getLogger(__name__)
 
 CHAR_MAP = str.maketrans(
@@ -88,10 +98,221 @@ def save_last_uid(folder, uid, output_dir):
     path.write_text(str(uid))
 
 
-def save_eml_file(folder, uid, msg, output_dir):
+def folder_state_file(imap_folder, output_dir):
+    return output_dir / sanitize_folder(imap_folder) / FOLDER_STATE_FILE
+
+
+def load_folder_state(imap_folder, output_dir):
+    """Return the mailbox status recorded after the last successful sync of this folder."""
+    path = folder_state_file(imap_folder, output_dir)
+    if path.exists():
+        try:
+            state = json.loads(path.read_text())
+            if isinstance(state, dict):
+                return state
+        except ValueError:
+            pass  # Ignore invalid state
+    return None
+
+
+def save_folder_state(imap_folder, state, output_dir):
+    path = folder_state_file(imap_folder, output_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(state))
+
+
+def move_previous_archive(imap_folder, uidvalidity, output_dir, index=None):
+    """
+    Move messages archived under a previous UIDVALIDITY into a sub-folder named
+    after it. UIDs are reused by the server once UIDVALIDITY change, so keeping
+    the previous messages in place would mix them with the new ones or get
+    them overwritten.
+    """
+    folder_path = output_dir / sanitize_folder(imap_folder)
+    dest = folder_path / f'uidvalidity-{uidvalidity}'
+    for path in folder_path.glob('*.eml'):
+        dest.mkdir(exist_ok=True)
+        os.replace(path, dest / path.name)
+    if index:
+        index.move(imap_folder, uidvalidity, dest.relative_to(output_dir))
+    uid_state_file(imap_folder, output_dir).unlink(missing_ok=True)
+
+
+def refresh_capabilities(conn):
+    """
+    Read again the capabilities of the server once authenticated. Some servers
+    only advertise extensions like CONDSTORE after login and imaplib doesn't
+    refresh them.
+    """
+    try:
+        result, data = conn.capability()
+    except imaplib.IMAP4.error:
+        return
+    if result == 'OK' and data and isinstance(data[0], bytes):
+        conn.capabilities = tuple(data[0].decode().upper().split())
+
+
+def folder_status(conn, imap_folder):
+    """
+    Query UIDNEXT, UIDVALIDITY and, when the server support CONDSTORE, HIGHESTMODSEQ
+    of a folder without selecting it. Return None if the server doesn't answer.
+    """
+    items = ['UIDNEXT', 'UIDVALIDITY']
+    if 'CONDSTORE' in conn.capabilities:
+        items.append('HIGHESTMODSEQ')
+    try:
+        result, data = conn.status(f'"{imap_folder}"', '(%s)' % ' '.join(items))
+    except imaplib.IMAP4.error:
+        return None
+    if result != 'OK' or not data or not isinstance(data[0], bytes):
+        return None
+    # Response look like: "INBOX" (UIDNEXT 43 UIDVALIDITY 1 HIGHESTMODSEQ 1234)
+    m = re.search(rb'\(([^()]*)\)\s*$', data[0])
+    if not m:
+        return None
+    status = {key.decode().upper(): int(value) for key, value in re.findall(rb'([A-Za-z]+) (\d+)', m[1])}
+    if 'UIDNEXT' not in status or 'UIDVALIDITY' not in status:
+        return None
+    return status
+
+
+def folder_unchanged(status, state):
+    """
+    Return True when the folder doesn't contain any new message since the last sync.
+
+    New message always get a new UID, so an identical UIDNEXT within the same
+    UIDVALIDITY means nothing need to be archived. A change of HIGHESTMODSEQ alone
+    only represent flag changes or expunges which doesn't affect the archive.
+    """
+    if not status or not state:
+        return False
+    return status['UIDVALIDITY'] == state.get('UIDVALIDITY') and status['UIDNEXT'] == state.get('UIDNEXT')
+
+
+class ArchiveIndex:
+    """
+    Index of archived messages stored in the output directory. Used to check
+    if a message was already archived and to search archived messages without
+    scanning every `.eml` files.
+    """
+
+    def __init__(self, output_dir):
+        self._conn = sqlite3.connect(str(output_dir / ARCHIVE_INDEX_FILE))
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            '''CREATE TABLE IF NOT EXISTS messages (
+                folder TEXT NOT NULL,
+                uidvalidity INTEGER NOT NULL DEFAULT 0,
+                uid INTEGER NOT NULL,
+                message_id TEXT,
+                size INTEGER,
+                date TEXT,
+                filename TEXT NOT NULL,
+                PRIMARY KEY (folder, uidvalidity, uid)
+            )'''
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS messages_message_id ON messages (message_id)')
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def contains(self, folder, uidvalidity, uid):
+        """Check if the given message was already archived."""
+        row = self._conn.execute(
+            'SELECT 1 FROM messages WHERE folder=? AND uidvalidity=? AND uid=?', (folder, uidvalidity or 0, int(uid))
+        ).fetchone()
+        return row is not None
+
+    def last_uid(self, folder, uidvalidity):
+        """Return the highest archived UID of the given folder or None."""
+        row = self._conn.execute(
+            'SELECT MAX(uid) FROM messages WHERE folder=? AND uidvalidity=?', (folder, uidvalidity or 0)
+        ).fetchone()
+        return row[0]
+
+    def add(self, folder, uidvalidity, uid, message_id, size, date, filename):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (folder, uidvalidity or 0, int(uid), message_id, size, date, str(filename)),
+        )
+        self._conn.commit()
+
+    def move(self, folder, uidvalidity, dest):
+        """Update the filename of messages archived with the given UIDVALIDITY after they got moved into `dest`."""
+        rows = self._conn.execute(
+            'SELECT uid, filename FROM messages WHERE folder=? AND uidvalidity=?', (folder, uidvalidity or 0)
+        ).fetchall()
+        self._conn.executemany(
+            'UPDATE messages SET filename=? WHERE folder=? AND uidvalidity=? AND uid=?',
+            [(str(Path(dest) / Path(filename).name), folder, uidvalidity or 0, uid) for uid, filename in rows],
+        )
+        self._conn.commit()
+
+    def search(self, folder=None, message_id=None, text=None):
+        """
+        Search archived messages. `text` is matched against the stored filename
+        which contains the date, sender and subject of the message.
+        """
+        where, args = [], []
+        if folder is not None:
+            where.append('folder=?')
+            args.append(folder)
+        if message_id is not None:
+            where.append('message_id=?')
+            args.append(message_id)
+        if text:
+            where.append('filename LIKE ?')
+            args.append(f'%{text}%')
+        query = 'SELECT folder, uidvalidity, uid, message_id, size, date, filename FROM messages'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        query += ' ORDER BY folder, uidvalidity, uid'
+        return self._conn.execute(query, args).fetchall()
+
+
+def read_eml_headers(path):
+    """Parse only the headers of the given message file."""
+    lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                break
+            lines.append(line)
+    return BytesHeaderParser().parsebytes(b''.join(lines))
+
+
+def save_eml_file(folder, uid, msg, output_dir, data=None):
+    """
+    Write the message into the folder. When `data` is defined, it must be an
+    iterable of raw bytes written as-is in place of the message. In that case
+    `msg` may be None to read the headers from the written data.
+    """
     folder_path = output_dir / sanitize_folder(folder)
     folder_path.mkdir(parents=True, exist_ok=True)
 
+    # Write into a temporary file.
+    tmp_path = folder_path / f'.{uid}.eml.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            if data is None:
+                f.write(msg.as_bytes())
+            else:
+                for chunk in data:
+                    f.write(chunk)
+        if msg is None:
+            msg = read_eml_headers(tmp_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
     # Extract <Date>
     try:
         dt = parsedate_to_datetime(msg.get('Date'))
@@ -113,11 +334,54 @@ def save_eml_file(folder, uid, msg, output_dir):
 
     filename = f'{uid}-{date_str}-{from_part}-{subject_part}.eml'
 
-    # Write file to disk compress or not
-    with open(folder_path / filename, 'wb') as f:
-        f.write(msg.as_bytes())
+    # Rename the temporary file once complete.
+    try:
+        os.replace(tmp_path, folder_path / filename)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
     logger.info(f'Saved: {folder_path / filename}')
+    return folder_path / filename
+
+
+def fetch_message_chunk(conn, uid, offset, length=None):
+    """
+    Fetch a range of the raw message. Return a tuple with the size of the
+    message as reported by the server (if any) and the data. Return None on error.
+    """
+    items = f'BODY.PEEK[]<{offset}.{length or FETCH_CHUNK_SIZE}>'
+    if offset == 0:
+        items = f'RFC822.SIZE {items}'
+    result, data = conn.uid('fetch', uid, f'({items})')
+    if result != 'OK' or not data or data[0] is None:
+        return None
+    size = None
+    chunk = b''
+    for item in data:
+        if isinstance(item, tuple):
+            meta, chunk = item[0], item[1]
+        else:
+            meta = item
+        m = re.search(rb'RFC822\.SIZE (\d+)', meta or b'')
+        if m:
+            size = int(m[1])
+    return size, chunk
+
+
+def _iter_message_chunks(conn, uid, chunk, size):
+    """Yield the first chunk then fetch the remaining part of the message."""
+    yield chunk
+    offset = len(chunk)
+    while len(chunk) >= FETCH_CHUNK_SIZE and (size is None or offset < size):
+        response = fetch_message_chunk(conn, uid, offset)
+        if response is None:
+            raise imaplib.IMAP4.error(f'fail to fetch UID {uid.decode()} at offset {offset}')
+        _unused, chunk = response
+        if not chunk:
+            break
+        yield chunk
+        offset += len(chunk)
 
 
 def list_folders(conn):
@@ -133,17 +397,83 @@ def list_folders(conn):
         yield parts[1].strip('"')
 
 
-def fetch_and_store(conn, imap_folder, output_dir):
+def store_message(conn, imap_folder, uid, uidvalidity, output_dir, index=None):
+    """
+    Fetch a single message and write it to disk. The first chunk of the message
+    is used to get the headers, then the remaining part is streamed to disk.
+    Return False if the message could not be fetched.
+    """
+    uid_str = uid.decode()
+    response = fetch_message_chunk(conn, uid, 0)
+    if response is None:
+        logger.error(_("Failed to fetch UID %s"), uid_str)
+        return False
+    size, chunk = response
+    # Headers may not fit in the first chunk of very large messages.
+    msg = None
+    m = re.search(rb'\r?\n\r?\n', chunk)
+    if m or len(chunk) < FETCH_CHUNK_SIZE:
+        msg = BytesHeaderParser().parsebytes(chunk[: m.end()] if m else chunk)
+    try:
+        filename = save_eml_file(
+            imap_folder, uid_str, msg, output_dir, data=_iter_message_chunks(conn, uid, chunk, size)
+        )
+    except imaplib.IMAP4.error:
+        logger.error(_("Failed to fetch UID %s"), uid_str, exc_info=1)
+        return False
+    if index:
+        if msg is None:
+            msg = read_eml_headers(filename)
+        try:
+            date = parsedate_to_datetime(msg.get('Date')).isoformat()
+        except Exception:
+            date = None
+        message_id = msg.get('Message-ID')
+        index.add(
+            imap_folder,
+            uidvalidity,
+            uid_str,
+            str(message_id).strip() if message_id else None,
+            filename.stat().st_size,
+            date,
+            filename.relative_to(output_dir),
+        )
+    return True
+
+
+def fetch_and_store(conn, imap_folder, output_dir, index=None):
     logger.info(_("Syncing folder: %s"), imap_folder)
+
+    # Use STATUS to skip folder without new messages without selecting it.
+    status = folder_status(conn, imap_folder)
+    state = load_folder_state(imap_folder, output_dir)
+    if folder_unchanged(status, state):
+        logger.info(_("No new messages in folder %s"), imap_folder)
+        return
+
     result, data = conn.select(f'"{imap_folder}"', readonly=True)
     if result != 'OK':
         logger.error(_("Error selecting folder %s: %s"), imap_folder, data[0].decode())
         return
 
+    uidvalidity = status['UIDVALIDITY'] if status else None
+    if status and state and state.get('UIDVALIDITY') is not None and uidvalidity != state['UIDVALIDITY']:
+        # UIDs from previous sync are meaningless when UIDVALIDITY changed.
+        logger.warning(_("UIDVALIDITY of folder %s changed, fetching all messages"), imap_folder)
+        move_previous_archive(imap_folder, state['UIDVALIDITY'], output_dir, index)
+        # Record the new UIDVALIDITY right away to not move new messages if the sync get interrupted.
+        state = {'UIDVALIDITY': uidvalidity}
+        save_folder_state(imap_folder, state, output_dir)
     last_uid = load_last_uid(imap_folder, output_dir)
+    if index and not last_uid:
+        # Resume from the index when UID state file is missing.
+        last_uid = index.last_uid(imap_folder, uidvalidity)
     if last_uid:
         new_uid = int(last_uid) + 1
         criteria = f'(UID {new_uid}:*)'
+        # With CONDSTORE, let the server only return messages modified since the last sync.
+        if status and 'HIGHESTMODSEQ' in status and state and state.get('HIGHESTMODSEQ'):
+            criteria = f'(UID {new_uid}:* MODSEQ {int(state["HIGHESTMODSEQ"]) + 1})'
     else:
         criteria = 'ALL'
 
@@ -157,21 +487,27 @@ def fetch_and_store(conn, imap_folder, output_dir):
     uids = data[0].split()
     if not uids or (len(uids) == 1 and uids[0].decode() == str(last_uid)):
         logger.info(_("No new messages in folder %s"), imap_folder)
+        if status:
+            save_folder_state(imap_folder, status, output_dir)
         return
 
+    failed = False
     for uid in uids:
         uid_str = uid.decode()
-        result, msg_data = conn.uid('fetch', uid, '(BODY.PEEK[])')
-        if result != 'OK' or msg_data is None or msg_data[0] is None:
-            logger.error(_("Failed to fetch UID %s"), uid_str)
+        if index and index.contains(imap_folder, uidvalidity, uid_str):
+            logger.debug("Skip already archived UID %s", uid_str)
+            continue
+        if not store_message(conn, imap_folder, uid, uidvalidity, output_dir, index):
+            failed = True
             continue
 
-        raw = msg_data[0][1]
-        msg = email.message_from_bytes(raw)
-        save_eml_file(imap_folder, uid_str, msg, output_dir)
+        # Save the Last UID on every email until one fails to be retried on next sync.
+        if not failed:
+            save_last_uid(imap_folder, uid.decode(), output_dir)
 
-        # Save the Last UID on every email.
-        save_last_uid(imap_folder, uid.decode(), output_dir)
+    # Record folder status only once every message got archived.
+    if status and not failed:
+        save_folder_state(imap_folder, status, output_dir)
 
     logger.info(_("Synced %s message(s) from folder %s."), len(uids), imap_folder)
 
@@ -250,11 +586,13 @@ def main_run(args):
     imap = imaplib.IMAP4 if cfg.no_ssl else imaplib.IMAP4_SSL
     conn = imap(cfg.server, cfg.port)
     conn.login(cfg.username, cfg.password)
+    refresh_capabilities(conn)
+    index = ArchiveIndex(output_dir)
 
     try:
         for folder in list_folders(conn):
             if should_sync_folder(folder, cfg.include_folder, cfg.exclude_folder):
-                fetch_and_store(conn, folder, output_dir)
+                fetch_and_store(conn, folder, output_dir, index=index)
             else:
                 logger.info(_("Ignore excluded folder %s"), folder)
         logger.info(_("Done"))
@@ -271,6 +609,7 @@ def main_run(args):
         logger.error(str(e), exc_info=1)
         exit(BackupError.error_code)
     finally:
+        index.close()
         conn.logout()
 
 
@@ -7,19 +7,29 @@ Created on Jun. 7, 2021
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
 import asyncio
+import atexit
+import base64
+import concurrent.futures
 import contextlib
 import datetime
-import functools
+import hashlib
+import hmac
 import logging
 import os
+import shutil
+import socket
 import subprocess
+import tempfile
+import threading
 import time
 from pathlib import Path
 
 from minarca_client.core import compat
 from minarca_client.core.compat import IS_WINDOWS
 from minarca_client.core.exceptions import (
+    BackupError,
     CaptureException,
+    ConnectException,
     LocalDestinationNotFound,
     NoPatternsError,
     NotConfiguredError,
@@ -28,15 +38,107 @@ from minarca_client.core.exceptions import (
     RdiffBackupException,
     RdiffBackupExitError,
     RemoteRepositoryNotFound,
+    RestoreFail,
     RunningError,
+    UnknownHostException,
+    UnknownHostKeyError,
     handle_http_errors,
 )
+from minarca_client.core.logs import RunLog, list_archives, read_history
 from minarca_client.core.pattern import Pattern, Patterns
+from minarca_client.core.selection import path_parts
 from minarca_client.core.settings import Datetime, Settings
 from minarca_client.core.status import Status, UpdateStatus, UpdateStatusNotification
 
 logger = logging.getLogger(__name__)
 
+# Delay in seconds during which a resolved local destination is reused without probing the disk.
+LOCAL_DESTINATION_TTL = 5
+
+# Maximum delay in seconds to wait for a disk to answer while searching the local destination.
+LOCAL_DESTINATION_TIMEOUT = 2
+
+# Maximum delay in seconds to wait for the disk where the local destination was last found, e.g.: USB disk spinning up.
+LOCAL_MOUNTPOINT_TIMEOUT = 60
+
+# Mount point where each local destination (by uuid) was last found. Shared between instances.
+_local_mountpoints = {}
+
+# Pending read of the destination identifier by filename. Shared so a hung disk is only read by a single thread.
+_local_probes = {}
+_local_probes_lock = threading.Lock()
+
+# Idle delay in seconds before the multiplexed SSH connection get closed by itself.
+SSH_CONTROL_PERSIST = 60
+
+# Maximum delay in seconds to establish the multiplexed SSH connection.
+SSH_MASTER_TIMEOUT = 30
+
+# Maximum delay in seconds to connect and read the SSH banner of the remote server.
+SSH_PROBE_TIMEOUT = 5
+
+# Levels of connection probe from the cheapest to the most complete:
+# TCP connection with known host key, authenticated SSH connection and rdiff-backup test.
+PROBE_TCP = 'tcp'
+PROBE_SSH = 'ssh'
+PROBE_FULL = 'full'
+PROBE_LEVELS = [PROBE_TCP, PROBE_SSH, PROBE_FULL]
+
+# Delay in seconds during which the result of a connection probe is reused.
+PROBE_CACHE_TTL = 60
+
+# Maximum number of paths restored by a single rdiff-backup invocation to keep the command line short.
+RESTORE_BATCH_SIZE = 200
+
+# Minimum number of concurrent restore writing to the same disk when jobs are shared between multiple disks.
+RESTORE_MIN_JOBS_PER_DISK = 2
+
+# Maximum delay to keep the list of increments in cache. Old increments may get removed by the retention period.
+INCREMENTS_CACHE_TTL = datetime.timedelta(hours=24)
+
+# Number of levels kept in memory below a folder listed by list_dir(). Deeper levels are listed on demand.
+LIST_DIR_DEPTH = 2
+
+
+async def _read_ssh_banner(host, port):
+    """
+    Connect to the SSH server and return its identification line.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        # Server may send other lines before the identification.
+        for unused in range(10):
+            line = await reader.readline()
+            if not line or line.startswith(b'SSH-'):
+                break
+        return line
+    finally:
+        writer.close()
+
+
+def _is_known_host(known_hosts, host, port):
+    """
+    Check if the known hosts file contains a key for the given host, including hashed entries.
+    """
+    name = host if port == 22 else f"[{host}]:{port}"
+    try:
+        with open(known_hosts, 'r', encoding='latin-1') as f:
+            for line in f:
+                patterns = line.split(' ', 1)[0]
+                if patterns.startswith('|1|'):
+                    unused, unused, salt, digest = patterns.split('|', 3)
+                    try:
+                        mac = hmac.new(base64.b64decode(salt), name.encode(), hashlib.sha1).digest()
+                        if mac == base64.b64decode(digest):
+                            return True
+                    except ValueError:
+                        continue
+                elif name in patterns.split(','):
+                    return True
+    except FileNotFoundError:
+        pass
+    return False
+
 
 def _sh_quote(args):
     """
@@ -91,17 +193,286 @@ async def _read_stream(stream, capture, callback):
 def reduce_path(paths):
     """
     Remove already included files from the list.
+
+    A path is removed when the path itself or one of its parents appears
+    earlier in the list. Order is preserved. Previously kept paths are stored
+    in a set so each path only need a lookup per component.
     """
     reduced_paths = []
+    included = set()
 
     for path in paths:
+        parts = path_parts(path)
         # Check if the path is already encompassed by any in reduced_paths
-        if not any(os.path.commonpath([path, included]) == included for included in reduced_paths):
+        if not any(parts[:i] in included for i in range(1, len(parts) + 1)):
+            included.add(parts)
             reduced_paths.append(path)
 
     return reduced_paths
 
 
+def _escape_glob(path):
+    """
+    Escape special characters so rdiff-backup match the path literally.
+    """
+    return ''.join('[%s]' % c if c in '*?[' else c for c in path)
+
+
+def _selection_path(path):
+    """
+    Return the path as matched by rdiff-backup selection patterns, using `/` as separator.
+    """
+    path = str(path)
+    if IS_WINDOWS:
+        path = path.replace('\\', '/')
+    return path
+
+
+def _selection_args(root, includes):
+    """
+    Return the arguments to select only the basename of `includes` within `root`.
+    """
+    root = _selection_path(root).rstrip('/')
+    args = []
+    for include in includes:
+        args += ["--include", _escape_glob(root + '/' + os.path.basename(include))]
+    args += ["--exclude", _escape_glob(root) + '/**']
+    return args
+
+
+def restore_groups(paths, destination=None, jobs=1):
+    """
+    Group the paths to be restored to reduce the number of rdiff-backup
+    invocations. Yield tuples of (source, target, includes). Paths sharing the
+    same parent directory are restored together from that parent, so files
+    outside the selection are never part of the restore. The paths of a
+    parent are split in up to `jobs` groups with disjoint selection so they
+    can be restored concurrently.
+    When restoring into `destination`, a single path is restored into
+    `destination/<basename>`. A group of paths is restored with `destination`
+    as target and must be restored into a staging folder then moved to avoid
+    replacing the metadata of `destination` by the one of the parent
+    directory. `includes` is None when a single path is restored, otherwise
+    the list of paths to be selected within source.
+    """
+    groups = {}
+    for path in reduce_path([str(p) for p in paths]):
+        groups.setdefault(os.path.dirname(path), []).append(path)
+    for group in groups.values():
+        batch_size = min(RESTORE_BATCH_SIZE, -(-len(group) // jobs))
+        for i in range(0, len(group), batch_size):
+            batch = group[i : i + batch_size]
+            if len(batch) == 1:
+                path = batch[0]
+                target = os.path.join(str(destination), os.path.basename(path)) if destination else path
+                yield path, target, None
+                continue
+            source = os.path.dirname(batch[0])
+            target = str(destination) if destination else source
+            includes = list(batch)
+            if IS_WINDOWS:
+                source = source.replace('\\', '/')
+                includes = [include.replace('\\', '/') for include in includes]
+            yield source, target, includes
+
+
+def _move_staged(staging, target, includes):
+    """
+    Move the restored paths from `staging` into `target`, replacing existing files, then delete `staging`.
+    """
+    try:
+        for include in includes:
+            name = os.path.basename(include)
+            src = os.path.join(staging, name)
+            dst = os.path.join(target, name)
+            if not os.path.lexists(src):
+                continue
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            elif os.path.lexists(dst):
+                os.unlink(dst)
+            os.replace(src, dst)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _device_id(path):
+    """
+    Return an identifier of the disk where `path` is or will be created.
+    """
+    path = os.path.abspath(str(path))
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+
+def _read_destination_id(mountpoint, relpath):
+    """
+    Return a future with the identifier of the local destination found on
+    `mountpoint`. The file is read in a daemon thread. While a read is
+    pending, the same future is returned so threads blocked on a hung mount
+    point don't pile up.
+    """
+    uuid_fn = Path(mountpoint) / relpath / '..' / '.minarca-id'
+    key = str(uuid_fn)
+    with _local_probes_lock:
+        future = _local_probes.get(key)
+        if future is not None:
+            return future
+        future = _local_probes[key] = concurrent.futures.Future()
+
+    def _read():
+        try:
+            value = compat.file_read(uuid_fn)
+        except BaseException as e:
+            value = e
+        with _local_probes_lock:
+            _local_probes.pop(key, None)
+        if isinstance(value, BaseException):
+            future.set_exception(value)
+        else:
+            future.set_result(value)
+
+    threading.Thread(target=_read, daemon=True).start()
+    return future
+
+
+def _probe_local_destination(mountpoints, relpath, localuuid, timeout=None):
+    """
+    Search concurrently the mount point containing the local destination
+    identified by `localuuid`. Each disk is probed in a daemon thread so a
+    hung mount point doesn't block the caller longer than `timeout`.
+    """
+    if not mountpoints:
+        return None
+    futures = {_read_destination_id(mountpoint, relpath): mountpoint for mountpoint in mountpoints}
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=timeout or LOCAL_DESTINATION_TIMEOUT):
+            if future.exception() is None and future.result() == localuuid:
+                return futures[future]
+    except concurrent.futures.TimeoutError:
+        logger.debug("timeout while probing local destination")
+    return None
+
+
+class _Destination:
+    """
+    Location of the backup resolved once per operation. Either the local disk
+    or the remote repository with the remote schema used to reach it.
+    """
+
+    def __init__(self, disk=None, remote_host=None, repositoryname=None, remote_schema=None):
+        self.disk = disk
+        self.remote_host = remote_host
+        self.repositoryname = repositoryname
+        self.remote_schema = remote_schema
+
+    def args(self):
+        """Return rdiff-backup arguments required to reach the destination."""
+        if self.remote_schema:
+            return ["--remote-schema", self.remote_schema]
+        return []
+
+    def path(self, path=None):
+        """
+        Return the path defining the location of the backup. Either remote or local.
+        """
+        assert path is None or isinstance(path, str)
+        if path is not None and IS_WINDOWS:
+            path = f"/{path[0]}/{path[3:]}"
+        if self.disk is None:
+            if path is not None:
+                return f"minarca@{self.remote_host}::{self.repositoryname}{path}"
+            return f"minarca@{self.remote_host}::."
+        if path is not None:
+            return self.disk / path.lstrip('/').lstrip('\\')
+        return self.disk
+
+
+class _SSHMaster:
+    """
+    Multiplexed SSH connection (OpenSSH ControlMaster) shared by every
+    rdiff-backup invocation of an instance to avoid a new handshake for each
+    of them. The master exit by itself once idle for SSH_CONTROL_PERSIST
+    seconds or when `close()` get called. The control socket is created in a
+    private temporary directory removed on close.
+    """
+
+    def __init__(self, ssh_command, target):
+        self.ssh_command = ssh_command
+        self.target = target
+        self._tempdir = tempfile.mkdtemp(prefix='minarca-ssh-')
+        self.control_path = os.path.join(self._tempdir, 'control')
+        # Error reported by SSH when the connection cannot be established.
+        self.error = None
+        atexit.register(self.close)
+
+    def is_alive(self):
+        return os.path.exists(self.control_path)
+
+    async def start(self):
+        """
+        Start the master connection in background. Return True if the connection is established.
+        """
+        command = (
+            f"{self.ssh_command} -oControlMaster=yes -oControlPath={_escape_path(self.control_path)}"
+            f" -oControlPersist={SSH_CONTROL_PERSIST} -N -f {self.target}"
+        )
+        logger.debug(f"starting ssh master connection: {command}")
+        process = None
+        # Once in background, SSH may keep stderr open. Use a file instead of a pipe.
+        stderr_file = os.path.join(self._tempdir, 'stderr')
+        try:
+            with open(stderr_file, 'wb') as stderr:
+                process = await asyncio.create_subprocess_shell(
+                    command,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=stderr,
+                )
+                await asyncio.wait_for(process.wait(), SSH_MASTER_TIMEOUT)
+        except Exception:
+            logger.debug("fail to start ssh master connection", exc_info=1)
+            if process and process.returncode is None:
+                process.kill()
+        if self.is_alive():
+            self.error = None
+            return True
+        capture = CaptureException()
+        try:
+            with open(stderr_file, 'rb') as f:
+                for line in f:
+                    capture.parse(line)
+        except OSError:
+            pass
+        self.error = capture.exception
+        return False
+
+    def close(self):
+        """
+        Stop the master connection and delete the control socket.
+        """
+        atexit.unregister(self.close)
+        if self.is_alive():
+            try:
+                subprocess.run(
+                    f"{self.ssh_command} -oControlPath={_escape_path(self.control_path)} -O exit {self.target}",
+                    shell=True,
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=5,
+                )
+            except Exception:
+                logger.debug("fail to stop ssh master connection", exc_info=1)
+        shutil.rmtree(self._tempdir, ignore_errors=True)
+
+
 @contextlib.contextmanager
 def safe_keepawake():
     """Safe implementation of keepawake"""
@@ -144,10 +515,18 @@ class BackupInstance:
         self.status_file = data_home / f"status{id}.properties"
         self.backup_log_file = data_home / f"backup{id}.log"
         self.restore_log_file = data_home / f"restore{id}.log"
+        self.log_archive_dir = data_home / "logs"
+        self.history_file = data_home / f"history{id}.jsonl"
         # Create wrapper around config files.
         self.patterns = Patterns(self.patterns_file)
         self.status = Status(self.status_file)
         self.settings = Settings(self.config_file)
+        # Cache (destination, expiry) of find_local_destination()
+        self._local_destination = None
+        # Multiplexed SSH connection shared by rdiff-backup invocations.
+        self._ssh_master = None
+        # Cache (increment, {folder: content}) of list_dir()
+        self._list_dir_cache = None
 
     async def _run_hooks(self, command, ignore_errors, log_file):
         # No command, leave function.
@@ -201,7 +580,8 @@ class BackupInstance:
         with safe_keepawake():
             with UpdateStatusNotification(instance=self):
                 async with UpdateStatus(instance=self):
-                    with open(self.backup_log_file, 'wb', buffering=0) as log_file:
+                    run_log = RunLog(self.backup_log_file, self.log_archive_dir, self.history_file, 'backup')
+                    async with run_log as log_file:
                         now = Datetime()
                         log_file.write(b'starting backup at %s\n' % now.strftime().encode())
                         # Copy patterns
@@ -215,14 +595,20 @@ class BackupInstance:
                             log_file=log_file,
                         )
 
+                        # Resolve the destination once pre-hooks are completed.
+                        await self._start_ssh_master()
+                        repo = self._destination()
+
                         # If Local, exclude destination to avoid infinite recursion.
                         if self.is_local():
-                            dest = self._backup_path(None)
+                            dest = repo.path(None)
                             patterns.append(Pattern(False, dest, None))
 
                         # Execute the actual backup with rdiff-backup for each drive.
                         for drive, drive_patterns in Patterns.group_by_roots(patterns):
-                            await self._backup_drive(drive, drive_patterns, log_file=log_file)
+                            await self._backup_drive(
+                                drive, drive_patterns, log_file=log_file, repo=repo, statistics=run_log.statistics
+                            )
 
                         # Execute post-hooks
                         await self._run_hooks(
@@ -233,16 +619,14 @@ class BackupInstance:
 
         logger.debug(f"{self.log_id}: backup process completed successfully")
 
-    async def _backup_drive(self, drive, patterns, log_file):
+    async def _backup_drive(self, drive, patterns, log_file, repo=None, statistics=None):
         # On Windows operating system, the computer may have multiple Root
         # (C:\, D:\, etc). To support this scenario, we need to run
         # rdiff-backup multiple time on the same computer. Once for each Root
         # to be backup (if required).
-        args = []
+        repo = repo or self._destination()
         # If required add remote-schema to define how to connect to SSH Server
-        if self.is_remote():
-            args.append("--remote-schema")
-            args.append(self._remote_schema())
+        args = repo.args()
         args.append("backup")
         if IS_WINDOWS:
             args.extend(
@@ -255,6 +639,8 @@ class BackupInstance:
         else:
             args.append("--exclude-sockets")
         args.append("--no-compression")
+        # Print session statistics to be recorded in the run history.
+        args.append("--print-statistics")
         # Add Include exclude patterns. Those are already sorted.
         for p in patterns:
             args.append("--include" if p.include else "--exclude")
@@ -262,8 +648,14 @@ class BackupInstance:
         # Exclude everything else
         args.extend(["--exclude", f"{drive}**"])
         # Call rdiff-backup
-        dest = self._backup_path(drive)
-        await self._rdiff_backup(*args, drive, dest, callback=log_file.write)
+        dest = repo.path(drive)
+
+        def callback(line):
+            log_file.write(line)
+            if statistics is not None:
+                statistics.parse(line)
+
+        await self._rdiff_backup(*args, drive, dest, callback=callback)
         # For local disk, make sure to "flush" disk cache
         if self.is_local():
             logger.debug(f"{self.log_id}: flushing changes to disk")
@@ -280,6 +672,14 @@ class BackupInstance:
                 dest,
                 callback=log_file.write,
             )
+            with self.status as t:
+                t.increments = None
+
+    def get_history(self, action=None):
+        """
+        Return the previous backup and restore runs from the oldest to the most recent.
+        """
+        return read_history(self.history_file, action=action)
 
     def get_repo_url(self, page="browse"):
         """
@@ -288,19 +688,25 @@ class BackupInstance:
         logger.debug(f"{self.log_id}: generating repo URL for page: {page}")
         if self.is_remote():
             assert page in ['browse', 'settings']
-            if IS_WINDOWS:
-                # On Windows, we append a drive letter.
-                drive_letter, _ = next(self.patterns.group_by_roots(), (None, []))
-                if not drive_letter:
-                    return self.settings.remoteurl
-                repo = f"{self.settings.repositoryname}/{drive_letter[0]}"
-            else:
-                repo = self.settings.repositoryname
+            repo = self._remote_repo_name()
+            if not repo:
+                return self.settings.remoteurl
             return f"{self.settings.remoteurl}/{page}/{self.settings.username}/{repo}"
         else:
             assert page in ['browse']
             return f"file://{self._backup_path(None)}"
 
+    def _remote_repo_name(self):
+        """
+        Return the name of the first remote repository. On Windows, a drive letter is appended.
+        """
+        if IS_WINDOWS:
+            drive_letter, _ = next(self.patterns.group_by_roots(), (None, []))
+            if not drive_letter:
+                return None
+            return f"{self.settings.repositoryname}/{drive_letter[0]}"
+        return self.settings.repositoryname
+
     def get_help_url(self):
         """
         Return a URL to help.
@@ -364,13 +770,13 @@ class BackupInstance:
         try:
             with open(self.public_key_file, encoding='latin-1') as f:
                 logger.debug(f"{self.log_id}: exchanging SSH identity with server")
-                await asyncio.get_running_loop().run_in_executor(None, conn.post_ssh_key, name, f.read())
+                await conn.post_ssh_key(name, f.read())
         except Exception:
             logger.debug(f"{self.log_id}: generating new SSH identity after failure")
             compat.ssh_keygen(self.public_key_file, self.private_key_file)
             with open(self.public_key_file, encoding='latin-1') as f:
                 logger.debug(f"{self.log_id}: exchanging new SSH identity with server")
-                await asyncio.get_running_loop().run_in_executor(None, conn.post_ssh_key, name, f.read())
+                await conn.post_ssh_key(name, f.read())
 
     async def _rdiff_backup(self, *extra_args, callback=None):
         """
@@ -422,46 +828,85 @@ class BackupInstance:
             if process and process.pid:
                 compat.stop_process(process.pid)
 
-    async def restore(self, restore_time=None, paths=[], destination=None):
+    async def restore(self, restore_time=None, paths=[], destination=None, jobs=None):
         """
         Used to run a complete restore of data backup for the given date or latest date if not defined.
+        Up to `jobs` groups of paths are restored concurrently, default to the `restore_jobs` settings.
+        When the groups are restored to multiple disks, the jobs are shared between the disks.
         """
         assert restore_time is None or isinstance(restore_time, str)
         assert isinstance(paths, list) and all(isinstance(p, (str, Path)) for p in paths)
         assert destination is None or isinstance(destination, (str, Path))
+        assert jobs is None or (isinstance(jobs, int) and jobs > 0)
         if self.is_running():
             raise RunningError()
+        jobs = jobs or self.settings.restore_jobs or 1
         with safe_keepawake():
             async with UpdateStatus(instance=self, action='restore'):
-                with open(self.restore_log_file, 'wb', buffering=0) as log_file:
+                async with RunLog(
+                    self.restore_log_file, self.log_archive_dir, self.history_file, 'restore'
+                ) as log_file:
                     now = Datetime()
                     log_file.write(b'starting restore at %s\n' % now.strftime().encode())
-                    # Loop on each pattern to be restored and execute rdiff-backup.
-                    for path in reduce_path(paths):
-                        if destination:
-                            # Restore into different location
-                            final_destination = os.path.join(str(destination), os.path.basename(str(path)))
-                        else:
-                            # Restore in place
-                            final_destination = path
+                    await self._start_ssh_master()
+                    repo = self._destination()
+                    # Restore each group of paths with a single rdiff-backup session.
+                    groups = list(restore_groups(paths, destination, jobs))
+                    # Limit the number of concurrent restore globally and share them between destination disks.
+                    semaphore = asyncio.Semaphore(jobs)
+                    disks = {_device_id(target) for source, target, includes in groups}
+                    jobs_per_disk = max(min(jobs, RESTORE_MIN_JOBS_PER_DISK), -(-jobs // len(disks or [None])))
+                    disk_semaphores = {disk: asyncio.Semaphore(jobs_per_disk) for disk in disks}
+
+                    async def _restore_group(number, source, target, includes):
                         # Force is required to replace folder
                         args = ["--force"]
                         # If required add remote-schema to define how to connect to SSH Server
-                        if self.is_remote():
-                            args.append("--remote-schema")
-                            args.append(self._remote_schema())
-                        args += [
-                            "restore",
-                            "--at",
-                            restore_time or "now",
-                            self._backup_path(str(path)),
-                            str(final_destination),
-                        ]
-                        # FIXME For full restore we should add exclude pattern, but rdiff-backup raise an error.
-                        await self._rdiff_backup(
-                            *args,
-                            callback=log_file.write,
-                        )
+                        args += repo.args()
+                        args += ["restore", "--at", restore_time or "now"]
+                        async with semaphore, disk_semaphores[_device_id(target)]:
+                            if includes and destination:
+                                # Restore the group into a staging folder to keep the metadata of destination.
+                                os.makedirs(target, exist_ok=True)
+                                staging = tempfile.mkdtemp(prefix='.minarca-restore-', dir=target)
+                                try:
+                                    await _restore_rdiff_backup(number, args, source, staging, includes)
+                                except BaseException:
+                                    shutil.rmtree(staging, ignore_errors=True)
+                                    raise
+                                await asyncio.get_running_loop().run_in_executor(
+                                    None, _move_staged, staging, target, includes
+                                )
+                            else:
+                                await _restore_rdiff_backup(number, args, source, target, includes)
+
+                    async def _restore_rdiff_backup(number, args, source, target, includes):
+                        # Selection patterns are matched against the target.
+                        if includes:
+                            args += _selection_args(target, includes)
+                        args += [repo.path(source), target]
+                        if len(groups) == 1:
+                            await self._rdiff_backup(*args, callback=log_file.write)
+                            return
+                        # Prefix the output of each group to tell them apart in the shared log.
+                        prefix = b'[%d/%d] ' % (number, len(groups))
+                        log_file.write(prefix + b'restoring %s\n' % target.encode('utf-8', errors='replace'))
+                        try:
+                            await self._rdiff_backup(*args, callback=lambda line: log_file.write(prefix + line))
+                        except BaseException as e:
+                            log_file.write(prefix + b'restore failed: %s\n' % str(e).encode('utf-8', errors='replace'))
+                            raise
+                        log_file.write(prefix + b'restore completed\n')
+
+                    results = await asyncio.gather(
+                        *[_restore_group(i, *group) for i, group in enumerate(groups, 1)],
+                        return_exceptions=True,
+                    )
+                    errors = [e for e in results if isinstance(e, BaseException)]
+                    if len(errors) == 1:
+                        raise errors[0]
+                    elif errors:
+                        raise RestoreFail(errors, len(groups))
 
     def start_backup(self, force=False):
         """
@@ -474,7 +919,7 @@ class BackupInstance:
         child = compat.detach_call(args)
         logger.debug(f"{self.log_id}: subprocess {child.pid} started for backup: {_sh_quote(args)}")
 
-    def start_restore(self, restore_time=None, paths=[], destination=None):
+    def start_restore(self, restore_time=None, paths=[], destination=None, jobs=None):
         assert restore_time is None or isinstance(restore_time, int)
         assert isinstance(paths, (list, str))
         if isinstance(paths, str):
@@ -489,6 +934,8 @@ class BackupInstance:
             args += ['--restore-time', str(restore_time)]
         if destination:
             args += ['--destination', str(destination)]
+        if jobs:
+            args += ['--jobs', str(jobs)]
         args += paths
         child = compat.detach_call(args)
         logger.debug(f"{self.log_id}: subprocess {child.pid} started for restore: {args}")
@@ -523,20 +970,111 @@ class BackupInstance:
         if self.is_remote():
             # Since v2.2.x, we need to pass an existing repository for test.
             # Otherwise the test fail if the folder doesn't exist on the remote server.
-            args = []
-            args.append("--remote-schema")
-            args.append(self._remote_schema())
+            repo = self._destination()
+            args = repo.args()
             args.append("test")
-            args.append(self._backup_path(None))
+            args.append(repo.path(None))
             await self._rdiff_backup(*args)
         elif self.is_local():
             self.find_local_destination()
 
+    async def probe_connection(self, level=PROBE_SSH, max_age=PROBE_CACHE_TTL):
+        """
+        Check connectivity to the remote server or local disk, running the
+        cheapest checks first: a TCP connection to the server with a known
+        host key, an authenticated SSH connection, then a rdiff-backup test
+        when `level` is PROBE_FULL. For remote instances, the result is kept
+        in the status file for `max_age` seconds and shared between processes.
+        """
+        assert level in PROBE_LEVELS
+        if not self.is_remote():
+            if self.is_local():
+                self.find_local_destination()
+            return
+        cached = self._cached_probe(level, max_age)
+        if cached is True:
+            return
+        elif cached:
+            raise cached
+        logger.debug(f"{self.log_id}: probing connection with level {level}")
+        reached = None
+        try:
+            await self._probe_tcp()
+            reached = PROBE_TCP
+            if level != PROBE_TCP and not IS_WINDOWS:
+                # SSH multiplexing is not available on Windows, rely on rdiff-backup test.
+                await self._probe_ssh()
+                reached = PROBE_SSH
+            if level == PROBE_FULL or (level == PROBE_SSH and IS_WINDOWS):
+                await self.test_connection()
+                reached = PROBE_FULL
+        except BackupError as e:
+            self._save_probe(PROBE_LEVELS[PROBE_LEVELS.index(reached) + 1 if reached else 0], e)
+            raise
+        self._save_probe(reached, None)
+
+    def _cached_probe(self, level, max_age):
+        """
+        Return True if a previous probe succeeded at this level or higher, the
+        exception if a previous probe failed at this level or lower, or None.
+        """
+        status = self.status
+        status.reload()
+        if not max_age or not status.probe_date or status.probe_level not in PROBE_LEVELS:
+            return None
+        if Datetime() - status.probe_date > datetime.timedelta(seconds=max_age):
+            return None
+        if not status.probe_error:
+            return PROBE_LEVELS.index(status.probe_level) >= PROBE_LEVELS.index(level) or None
+        if PROBE_LEVELS.index(status.probe_level) > PROBE_LEVELS.index(level):
+            return None
+        from minarca_client.core import exceptions
+
+        cls = getattr(exceptions, status.probe_error, None)
+        try:
+            return cls() if isinstance(cls, type) and issubclass(cls, BackupError) else None
+        except TypeError:
+            return None
+
+    def _save_probe(self, level, error):
+        with self.status as t:
+            t.probe_level = level
+            t.probe_error = error.__class__.__name__ if error else None
+            t.probe_date = Datetime()
+
+    async def _probe_tcp(self, timeout=SSH_PROBE_TIMEOUT):
+        """
+        Connect to the remote server and read the SSH banner. Also verify the host key is known.
+        """
+        remote_host, unused, remote_port = self.settings.remotehost.partition(":")
+        remote_port = int(remote_port or 22)
+        try:
+            banner = await asyncio.wait_for(_read_ssh_banner(remote_host, remote_port), timeout)
+        except socket.gaierror as e:
+            raise UnknownHostException() from e
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ConnectException() from e
+        if not banner.startswith(b'SSH-'):
+            raise ConnectException()
+        accept_host_key = os.environ.get("MINARCA_ACCEPT_HOST_KEY", False) in ["true", "1", "True"]
+        if not accept_host_key and not _is_known_host(self.known_hosts, remote_host, remote_port):
+            raise UnknownHostKeyError()
+
+    async def _probe_ssh(self):
+        """
+        Establish an authenticated SSH connection without running any command.
+        The connection is kept alive to be reused by rdiff-backup.
+        """
+        await self._start_ssh_master()
+        if not (self._ssh_master and self._ssh_master.is_alive()):
+            raise (self._ssh_master and self._ssh_master.error) or ConnectException()
+
     def forget(self):
         """
         Disconnect this client from server.
         """
         logger.debug(f"{self.log_id}: forgetting this instance from server")
+        self._stop_ssh_master()
         # Delete configuration file (support deleting readonly file).
         for fn in [
             self.public_key_file,
@@ -544,6 +1082,7 @@ class BackupInstance:
             self.known_hosts,
             self.patterns_file,
             self.status_file,
+            self.history_file,
             self.config_file,
         ]:
             if not fn.is_file():
@@ -554,37 +1093,53 @@ class BackupInstance:
                 logger.debug(f"{self.log_id}: deleted file: {fn}")
             except OSError:
                 logger.warning(f"{self.log_id}: cannot delete file: {fn}", exc_info=1)
+        # Delete logs of previous runs.
+        for fn in list_archives(self.backup_log_file, self.log_archive_dir) + list_archives(
+            self.restore_log_file, self.log_archive_dir
+        ):
+            try:
+                fn.unlink()
+                logger.debug(f"{self.log_id}: deleted file: {fn}")
+            except OSError:
+                logger.warning(f"{self.log_id}: cannot delete file: {fn}", exc_info=1)
 
     def __eq__(self, other: object) -> bool:
         return isinstance(other, BackupInstance) and self.id == other.id
 
+    def _destination(self):
+        """
+        Resolve the location of the backup. Should be called once per operation
+        to avoid searching the local disk or building the remote schema repeatedly.
+        """
+        if self.is_remote():
+            remote_host, unused, unused = self.settings.remotehost.partition(":")
+            control_path = None
+            if self._ssh_master and self._ssh_master.is_alive():
+                control_path = self._ssh_master.control_path
+            repo = _Destination(
+                remote_host=remote_host,
+                repositoryname=self.settings.repositoryname,
+                remote_schema=self._remote_schema(control_path=control_path),
+            )
+            logger.debug(f"{self.log_id}: remote backup path: {repo.path(None)}")
+            return repo
+        elif self.is_local():
+            # For local destination, we need to lookup the external drive
+            repo = _Destination(disk=self.find_local_destination())
+            logger.debug(f"{self.log_id}: local backup path: {repo.path(None)}")
+            return repo
+        raise NotConfiguredError()
+
     def _backup_path(self, path):
         """
         Return the path defining the location of the backup. Either remote or local.
         """
         assert path is None or isinstance(path, str)
-        logger.debug(f"{self.log_id}: constructing backup path for {path}")
-        if path is not None and IS_WINDOWS:
-            path = f"/{path[0]}/{path[3:]}"
         if self.is_remote():
             remote_host, unused, unused = self.settings.remotehost.partition(":")
-            repositoryname = self.settings.repositoryname
-            if path is not None:
-                backup_path = f"minarca@{remote_host}::{repositoryname}{path}"
-                logger.debug(f"{self.log_id}: remote backup path: {backup_path}")
-                return backup_path
-            backup_path = f"minarca@{remote_host}::."
-            logger.debug(f"{self.log_id}: remote backup path: {backup_path}")
-            return backup_path
+            return _Destination(remote_host=remote_host, repositoryname=self.settings.repositoryname).path(path)
         elif self.is_local():
-            # For local destination, we need to lookup the external drive
-            disk = self.find_local_destination()
-            if path is not None:
-                backup_path = disk / path.lstrip('/').lstrip('\\')
-                logger.debug(f"{self.log_id}: local backup path: {backup_path}")
-                return backup_path
-            logger.debug(f"{self.log_id}: local backup path: {disk}")
-            return disk
+            return _Destination(disk=self.find_local_destination()).path(path)
         raise NotConfiguredError()
 
     def find_local_destination(self):
@@ -594,48 +1149,69 @@ class BackupInstance:
         from minarca_client.core.disk import list_disks
 
         assert self.settings.localrelpath and self.settings.localuuid, 'only supported for local backup'
-        logger.debug(f"{self.log_id}: finding local destination")
-
-        # Let start by searching our previous location (if any)
-        if self.settings.localmountpoint:
-            uuid_fn = Path(self.settings.localmountpoint) / self.settings.localrelpath / '..' / '.minarca-id'
-            if compat.file_read(uuid_fn) == self.settings.localuuid:
-                destination = Path(self.settings.localmountpoint) / self.settings.localrelpath
-                logger.debug(f"{self.log_id}: found local destination: {destination}")
-                return destination
 
-        # Otherwise look on all disks and search our UUID.
-        for disk in list_disks():
-            uuid_fn = disk / self.settings.localrelpath / '..' / '.minarca-id'
-            if compat.file_read(uuid_fn) == self.settings.localuuid:
-                destination = Path(disk) / self.settings.localrelpath
-                logger.debug(f"{self.log_id}: found local destination: {destination}")
-                return destination
+        # Reuse the destination recently found.
+        now = time.monotonic()
+        if self._local_destination and self._local_destination[1] > now:
+            return self._local_destination[0]
 
-        raise LocalDestinationNotFound()
+        logger.debug(f"{self.log_id}: finding local destination")
+        localuuid = self.settings.localuuid
+        localrelpath = self.settings.localrelpath
 
-    def _remote_schema(self):
+        # Let start by searching our previous location (if any)
+        previous = []
+        for mountpoint in [_local_mountpoints.get(localuuid), self.settings.localmountpoint]:
+            if mountpoint and Path(mountpoint) not in previous:
+                previous.append(Path(mountpoint))
+        # Wait longer for a known disk to answer since it may need to spin up.
+        mountpoint = _probe_local_destination(previous, localrelpath, localuuid, timeout=LOCAL_MOUNTPOINT_TIMEOUT)
+
+        # Otherwise look on all local disks and search our UUID.
+        if mountpoint is None:
+            disks = [disk for disk in list_disks(local_only=True) if Path(disk) not in previous]
+            mountpoint = _probe_local_destination(disks, localrelpath, localuuid)
+        if mountpoint is None:
+            raise LocalDestinationNotFound()
+
+        _local_mountpoints[localuuid] = Path(mountpoint)
+        destination = Path(mountpoint) / localrelpath
+        self._local_destination = (destination, now + LOCAL_DESTINATION_TTL)
+        logger.debug(f"{self.log_id}: found local destination: {destination}")
+        return destination
+
+    def _ssh_command(self):
         """
-        Return the remote schema to be passed to rdiff-backup command line argument.
+        Return the SSH command line with the options required to connect to the remote server.
         """
         if not self.settings.remotehost:
             raise NotConfiguredError()
 
         unused, unused, remote_port = self.settings.remotehost.partition(":")
-        remote_schema = _escape_path(compat.get_ssh())
+        ssh_command = _escape_path(compat.get_ssh())
         # Enforce a null config file to avoid reading system wide configuration
         if not IS_WINDOWS:
-            remote_schema += " -F /dev/null"
-        remote_schema += " -oBatchMode=yes -oPreferredAuthentications=publickey"
+            ssh_command += " -F /dev/null"
+        ssh_command += " -oBatchMode=yes -oPreferredAuthentications=publickey"
         if os.environ.get("MINARCA_ACCEPT_HOST_KEY", False) in ["true", "1", "True"]:
-            remote_schema += " -oStrictHostKeyChecking=no"
+            ssh_command += " -oStrictHostKeyChecking=no"
         if remote_port:
-            remote_schema += " -p %s" % remote_port
+            ssh_command += " -p %s" % remote_port
         # SSH options need extra escaping
-        remote_schema += " -oUserKnownHostsFile=%s" % _escape_path(self.known_hosts).replace(" ", "\\ ")
-        remote_schema += " -oIdentitiesOnly=yes"
+        ssh_command += " -oUserKnownHostsFile=%s" % _escape_path(self.known_hosts).replace(" ", "\\ ")
+        ssh_command += " -oIdentitiesOnly=yes"
         # Identity file must be escaped if it contains spaces
-        remote_schema += " -i %s" % _escape_path(self.private_key_file)
+        ssh_command += " -i %s" % _escape_path(self.private_key_file)
+        return ssh_command
+
+    def _remote_schema(self, control_path=None):
+        """
+        Return the remote schema to be passed to rdiff-backup command line argument.
+        When `control_path` is defined, SSH reuse the multiplexed connection.
+        """
+        remote_schema = self._ssh_command()
+        if control_path:
+            remote_schema += " -oControlMaster=no -oControlPath=%s" % _escape_path(control_path)
         # Literal "%s" will get replaced by rdiff-backup
         remote_schema += " %s"
         # Add user agent as command line
@@ -643,14 +1219,36 @@ class BackupInstance:
         logger.debug(f"{self.log_id}: remote schema: {remote_schema}")
         return remote_schema
 
-    async def verify(self):
-        args = []
-        if self.is_remote():
-            args.append("--remote-schema")
-            args.append(self._remote_schema())
+    async def _start_ssh_master(self):
+        """
+        Open the multiplexed SSH connection used by following rdiff-backup
+        invocations, unless one is already alive. Not supported on Windows.
+        """
+        if IS_WINDOWS or not self.is_remote():
+            return
+        if self._ssh_master and self._ssh_master.is_alive():
+            return
+        if self._ssh_master:
+            self._ssh_master.close()
+        remote_host, unused, unused = self.settings.remotehost.partition(":")
+        try:
+            self._ssh_master = _SSHMaster(self._ssh_command(), f"minarca@{remote_host}")
+        except FileNotFoundError:
+            logger.debug(f"{self.log_id}: ssh not found", exc_info=1)
+            return
+        if not await self._ssh_master.start():
+            logger.debug(f"{self.log_id}: ssh master connection not available")
+
+    def _stop_ssh_master(self):
+        if self._ssh_master:
+            self._ssh_master.close()
+            self._ssh_master = None
 
+    async def verify(self):
+        repo = self._destination()
+        args = repo.args()
         args.append("verify")
-        args.append(self._backup_path(None))
+        args.append(repo.path(None))
         logger.debug(f"{self.log_id}: verify instance with : {args}")
         await self._rdiff_backup(*args)
 
@@ -666,7 +1264,7 @@ class BackupInstance:
             # Get quota from server - on authentication failure it's
             # most likely an older minarca server not supporting minarcaid.
             conn = self._remote_conn()
-            current_user = await asyncio.get_running_loop().run_in_executor(None, conn.get_current_user_info)
+            current_user = await conn.get_current_user_info()
             if 'disk_usage' in current_user and 'disk_quota' in current_user:
                 disk_usage = (current_user['disk_usage'], current_user['disk_quota'])
                 logger.debug(f"{self.log_id}: remote disk usage: {disk_usage}")
@@ -681,15 +1279,13 @@ class BackupInstance:
 
     def _remote_conn(self):
         """
-        Return a new connection to Rdiffweb server.
+        Return a connection to Rdiffweb server shared with other instances using the same server and identity.
         """
-        from minarca_client.core.rdiffweb import Rdiffweb
+        from minarca_client.core.rdiffweb import AsyncRdiffweb, get_client
 
         with open(self.private_key_file, 'rb') as f:
             private_key_data = f.read()
-        conn = Rdiffweb(self.settings.remoteurl)
-        conn.auth = private_key_data
-        return conn
+        return AsyncRdiffweb(get_client(self.settings.remoteurl, private_key_data))
 
     @handle_http_errors
     async def save_remote_settings(self, wait=False, timeout=30):
@@ -703,34 +1299,25 @@ class BackupInstance:
         logger.debug(f"{self.log_id}: saving remote settings with wait={wait} and timeout={timeout}")
         conn = self._remote_conn()
         # Wait for repositories to be created
+        if wait and self._remote_repo_name():
+            await conn.wait_for_repo(self._remote_repo_name(), timeout)
+        # Repository may have just been created, do not rely on cached user information.
         repo_name = self.settings.repositoryname
-        repo_name_found = False
-        start_time = time.time()
-        while True:
-            current_user = await asyncio.get_running_loop().run_in_executor(None, conn.get_current_user_info)
-            repo_name_found = [
-                r.get('name')
-                for r in current_user.get('repos', [])
-                if repo_name == r.get('name') or r.get('name').startswith(repo_name + '/')
-            ]
-            if repo_name_found:
-                break
-            elif not wait:
-                raise RemoteRepositoryNotFound(repo_name)
-            elif time.time() > (start_time + timeout):
-                raise TimeoutError()
-            await asyncio.sleep(0.2)
+        current_user = await conn.get_current_user_info(max_age=0)
+        repo_name_found = [
+            r.get('name')
+            for r in current_user.get('repos', [])
+            if repo_name == r.get('name') or r.get('name').startswith(repo_name + '/')
+        ]
+        if not repo_name_found:
+            raise RemoteRepositoryNotFound(repo_name)
         # For each repo, update the settings.
         for repo_name in repo_name_found:
-            await asyncio.get_running_loop().run_in_executor(
-                None,
-                functools.partial(
-                    conn.post_repo_settings,
-                    repo_name,
-                    maxage=self.settings.maxage,
-                    keepdays=self.settings.keepdays,
-                    ignore_weekday=self.settings.ignore_weekday,
-                ),
+            await conn.post_repo_settings(
+                repo_name,
+                maxage=self.settings.maxage,
+                keepdays=self.settings.keepdays,
+                ignore_weekday=self.settings.ignore_weekday,
             )
             logger.debug(f"{self.log_id}: updated remote repository settings for: {repo_name}")
 
@@ -743,7 +1330,7 @@ class BackupInstance:
         conn = self._remote_conn()
         # Get reference to remote repo
         repo_name = self.settings.repositoryname
-        current_user = await asyncio.get_running_loop().run_in_executor(None, conn.get_current_user_info)
+        current_user = await conn.get_current_user_info()
         repo_name_found = [
             r.get('name')
             for r in current_user.get('repos', [])
@@ -753,7 +1340,7 @@ class BackupInstance:
             raise RemoteRepositoryNotFound(repo_name)
 
         # Get first repo settings.
-        data = await asyncio.get_running_loop().run_in_executor(None, conn.get_repo_settings, repo_name_found[0])
+        data = await conn.get_repo_settings(repo_name_found[0])
         if 'maxage' in data:
             self.settings.maxage = int(data['maxage'])
         if 'keepdays' in data:
@@ -765,35 +1352,71 @@ class BackupInstance:
             self.settings.remoterole = int(current_user['role'])
         logger.debug(f"{self.log_id}: loaded remote settings: {self.settings}")
 
-    async def list_increments(self):
+    def _increments_marker(self):
+        """
+        Return a value changing when new increments are created. For local
+        destination, the name of the current_mirror files are used.
+        """
+        marker = str(self.status.lastsuccess)
+        if self.is_local():
+            repo = self._destination()
+            for drive, unused in self.patterns.group_by_roots():
+                try:
+                    with os.scandir(repo.path(drive) / 'rdiff-backup-data') as entries:
+                        marker += ''.join(sorted(' ' + e.name for e in entries if e.name.startswith('current_mirror.')))
+                except OSError:
+                    pass
+        return marker
+
+    async def list_increments(self, force=False):
         """
         Fetch the increment list from remote server.
         Raise an error if the disk or remote server is not reachable.
         Return dates
+
+        The result is kept in the status file until a new backup is completed.
+        Use `force` to bypass the cache.
         """
         from tzlocal import get_localzone
 
         logger.debug(f"{self.log_id}: listing increments")
 
         local_tz = get_localzone()
-        all_increments = []
+
+        # Check if increments are cached.
+        status = self.status
+        status.reload()
+        marker = self._increments_marker()
+        if (
+            not force
+            and status.increments is not None
+            and status.increments_marker == marker
+            and status.increments_date
+            and Datetime() - status.increments_date < INCREMENTS_CACHE_TTL
+        ):
+            logger.debug(f"{self.log_id}: using cached increments")
+            return [
+                datetime.datetime.fromtimestamp(epoch_value, datetime.timezone.utc).astimezone(local_tz)
+                for epoch_value in status.increments
+            ]
 
         # On Windows operating system, the computer may have multiple Root
         # (C:\, D:\, etc). To support this scenario, we need to run
-        # rdiff-backup multiple time. Once for each Root.
-        for drive, patterns in self.patterns.group_by_roots():
+        # rdiff-backup multiple time. Once for each Root, concurrently.
+        await self._start_ssh_master()
+        repo = self._destination()
+
+        async def _list_increments(drive):
+            increments = []
             # Build command line
-            args = []
-            if self.is_remote():
-                # If required add remote-schema to define how to connect to SSH Server
-                args.append("--remote-schema")
-                args.append(self._remote_schema())
+            # If required add remote-schema to define how to connect to SSH Server
+            args = repo.args()
             args.append('--api-version')
             args.append('201')
             args.append('--parsable-output')
             args.append('list')
             args.append('increments')
-            args.append(self._backup_path(drive))
+            args.append(repo.path(drive))
 
             def collect_increments(line):
                 """
@@ -806,65 +1429,141 @@ class BackupInstance:
                     epoch_value = int(line[8:])
                 except ValueError:
                     logger.warning(f"{self.log_id}: invalid increment time: {line[8:]}")
-                date_value = datetime.datetime.fromtimestamp(epoch_value, datetime.timezone.utc).astimezone(local_tz)
-                all_increments.append(date_value)
+                    return
+                increments.append(epoch_value)
 
             # Call rdiff-backup
             await self._rdiff_backup(*args, callback=collect_increments)
+            return increments
+
+        results = await asyncio.gather(*[_list_increments(drive) for drive, unused in self.patterns.group_by_roots()])
+        # Merge increments of every roots.
+        all_increments = [
+            datetime.datetime.fromtimestamp(epoch_value, datetime.timezone.utc).astimezone(local_tz)
+            for epoch_value in sorted(set().union(*results))
+        ]
 
         logger.debug(f"{self.log_id}: found {len(all_increments)} increments")
+        # Keep increments in cache.
+        with self.status as t:
+            t.increments = [int(d.timestamp()) for d in all_increments]
+            t.increments_marker = marker
+            t.increments_date = Datetime()
         return all_increments
 
-    async def list_files(self, increment_datetime):
+    async def list_files(self, increment_datetime, path=None):
         """
         Fetch the files list from backup for the given increment date.
+        When `path` is defined, only the files within this folder are listed.
         Raise an error if the disk or remote server is not reachable.
         Return files
         """
         assert increment_datetime and isinstance(increment_datetime, datetime.datetime)
+        assert path is None or isinstance(path, str)
         logger.debug(f"{self.log_id}: listing files for increment date: {increment_datetime}")
 
-        all_files = []
-
         # On Windows operating system, the computer may have multiple Root
         # (C:\, D:\, etc). To support this scenario, we need to run
-        # rdiff-backup multiple time. Once for each Root.
-        for drive, patterns in self.patterns.group_by_roots():
-            # Build command line
-            args = []
-            if self.is_remote():
-                # If required add remote-schema to define how to connect to SSH Server
-                args.append("--remote-schema")
-                args.append(self._remote_schema())
-            args.append('--api-version')
-            args.append('201')
-            args.append('--parsable-output')
-            args.append('list')
-            args.append('files')
-            args.append('--at')
-            args.append(str(int(increment_datetime.timestamp())))
-            args.append(self._backup_path(drive))
+        # rdiff-backup multiple time. Once for each Root, concurrently.
+        await self._start_ssh_master()
+        if path:
+            roots = [path]
+        else:
+            roots = [drive for drive, unused in self.patterns.group_by_roots()]
+        repo = self._destination()
 
-            collect = False
+        async def _list_files(root):
+            files = []
+            await self._list_files(repo, increment_datetime, root, lambda name: files.append(os.path.join(root, name)))
+            return files
 
-            def collect_files(line, drive=drive):
-                """
-                Collect the file names. Everything between `.` and `*        Cleaning up`
-                """
-                nonlocal collect
-                if b'Cleaning up' in line:
-                    collect = False
-                elif line == b'.\n' or line == b'.\r\n':
-                    collect = True
-                elif collect:
-                    # TODO Fix handling of invalid encoding. rdiff-backup replace everything by U+FFFD
-                    # Ref.: https://github.com/rdiff-backup/rdiff-backup/issues/1050
-                    line = line.decode('utf-8', errors='replace').rstrip('\r\n')
-                    path = os.path.join(drive, line)
-                    all_files.append(path)
-
-            # Execute command line and collect filenames
-            await self._rdiff_backup(*args, callback=collect_files)
+        # Keep files grouped by root.
+        all_files = []
+        for files in await asyncio.gather(*[_list_files(root) for root in roots]):
+            all_files.extend(files)
 
         logger.debug(f"{self.log_id}: found {len(all_files)} files")
         return all_files
+
+    async def _list_files(self, repo, increment_datetime, root, callback):
+        """
+        Call rdiff-backup to list the files of `root` and call `callback` with
+        the name of each file relative to `root`.
+        """
+        # Build command line
+        # If required add remote-schema to define how to connect to SSH Server
+        args = repo.args()
+        args.append('--api-version')
+        args.append('201')
+        args.append('--parsable-output')
+        args.append('list')
+        args.append('files')
+        args.append('--at')
+        args.append(str(int(increment_datetime.timestamp())))
+        args.append(repo.path(root))
+
+        collect = False
+
+        def collect_files(line):
+            """
+            Collect the file names. Everything between `.` and `*        Cleaning up`
+            """
+            nonlocal collect
+            if b'Cleaning up' in line:
+                collect = False
+            elif line == b'.\n' or line == b'.\r\n':
+                collect = True
+            elif collect:
+                # TODO Fix handling of invalid encoding. rdiff-backup replace everything by U+FFFD
+                # Ref.: https://github.com/rdiff-backup/rdiff-backup/issues/1050
+                callback(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+        # Execute command line and collect filenames
+        await self._rdiff_backup(*args, callback=collect_files)
+
+    async def list_dir(self, increment_datetime, path=None):
+        """
+        Return the content of a single folder from backup for the given
+        increment date as a list of tuples (path, is_dir). When `path` is not
+        defined, return the folders included in the backup.
+
+        The content of the folder and of its sub folders, up to
+        LIST_DIR_DEPTH levels, is kept in memory so expanding a sub folder
+        doesn't require another call to rdiff-backup. Deeper levels are
+        listed when displayed. Only the last increment get cached.
+        """
+        assert increment_datetime and isinstance(increment_datetime, datetime.datetime)
+        assert path is None or isinstance(path, str)
+        if path is None:
+            return [(p.pattern, True) for p in self.patterns if p.include and not p.is_wildcard()]
+        key = int(increment_datetime.timestamp())
+        if self._list_dir_cache is None or self._list_dir_cache[0] != key:
+            self._list_dir_cache = (key, {})
+        folders = self._list_dir_cache[1]
+        if path not in folders:
+            await self._start_ssh_master()
+            repo = self._destination()
+            # rdiff-backup doesn't report the file type. A folder is detected
+            # when files are listed below it.
+            subtree = {path: []}
+            dirs = set()
+
+            def collect(name):
+                parts = name.split('/')
+                if len(parts) > LIST_DIR_DEPTH:
+                    dirs.add(os.path.join(path, '/'.join(parts[:LIST_DIR_DEPTH])))
+                    return
+                fn = os.path.join(path, name)
+                subtree.setdefault(os.path.dirname(fn), []).append(fn)
+
+            await self._list_files(repo, increment_datetime, path, collect)
+
+            def _is_dir(fn):
+                if fn in subtree or fn in dirs:
+                    return True
+                # Empty folders can only be detected from a local mirror.
+                return repo.disk is not None and os.path.isdir(repo.path(fn))
+
+            for folder, children in subtree.items():
+                folders[folder] = sorted((fn, _is_dir(fn)) for fn in children)
+        return folders[path]
@@ -6,53 +6,125 @@ Created on Oct. 22, 2021
 
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
+import datetime
+import logging
+import threading
+
 from minarca_client.core import compat
+from minarca_client.core.config import Datetime, KeyValueConfigFile
 from packaging import version
 
 LATEST_VERSION_URL = 'https://latest.ikus-soft.com/minarca/latest_version'
 
+# Delay between two queries of the latest version.
+LATEST_CHECK_INTERVAL = datetime.timedelta(days=1)
+
+logger = logging.getLogger(__name__)
+
 
 class LatestCheckFailed(Exception):
     pass
 
 
+class LatestStatus(KeyValueConfigFile):
+    """
+    Latest version known with the validators required to revalidate it.
+    """
+
+    _fields = [
+        ('version', str, None),
+        ('etag', str, None),
+        ('last_modified', str, None),
+        ('lastcheck', lambda x: Datetime(x) if x else None, None),
+    ]
+
+
 class LatestCheck:
     """
-    Responsible to check if current version is up-to-date.
+    Responsible to check if current version is up-to-date. The latest version
+    is kept on disk and revalidated at most once a day using a conditional
+    request.
     """
 
-    _latest_version = None
+    def __init__(self, filename=None):
+        self.status = LatestStatus(filename or compat.get_data_home() / 'latest.properties')
+
+    def is_stale(self):
+        """
+        True if the latest version should be queried again.
+        """
+        lastcheck = self.status.lastcheck
+        return not self.status.version or lastcheck is None or Datetime() - lastcheck > LATEST_CHECK_INTERVAL
 
-    def get_latest_version(self, timeout=0.5):
+    def refresh(self, timeout=0.5):
         """
-        Query the latest version of minarca.
+        Query the latest version of minarca. Send the validators of the
+        previous response, if any, so the server may reply "304 Not Modified".
         """
         import requests
 
-        # Check if the latest version was already queried.
-        if self._latest_version is not None:
-            return self._latest_version
-        try:
+        with self.status as t:
             # Replace User agent by something meaningful.
             headers = {
                 'User-Agent': compat.get_user_agent(),
             }
-            # Query data
-            response = requests.get(LATEST_VERSION_URL, headers=headers, timeout=timeout)
-            # Check status
-            response.raise_for_status()
-            # Parse data as json
-            self._latest_version = response.text
-            return self._latest_version
-        except requests.exceptions.RequestException as e:
-            raise LatestCheckFailed(e)
+            if t.version and t.etag:
+                headers['If-None-Match'] = t.etag
+            if t.version and t.last_modified:
+                headers['If-Modified-Since'] = t.last_modified
+            try:
+                # Query data
+                response = requests.get(LATEST_VERSION_URL, headers=headers, timeout=timeout)
+                # Check status
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                raise LatestCheckFailed(e)
+            if response.status_code != 304:
+                t.version = response.text.strip()
+                t.etag = response.headers.get('ETag')
+                t.last_modified = response.headers.get('Last-Modified')
+            t.lastcheck = Datetime()
+            return t.version
+
+    def start_refresh(self, timeout=0.5):
+        """
+        Revalidate the latest version in background if stale. Return the thread or None.
+        """
+        if not self.is_stale():
+            return None
+
+        def _task():
+            try:
+                self.refresh(timeout=timeout)
+            except LatestCheckFailed:
+                logger.debug('fail to check for latest version', exc_info=1)
+
+        thread = threading.Thread(target=_task, name='LatestCheck', daemon=True)
+        thread.start()
+        return thread
+
+    def get_latest_version(self, timeout=0.5, cached=False):
+        """
+        Return the latest version of minarca. The version is queried only if
+        stale, unless `cached` is True.
+        """
+        if self.is_stale() and not cached:
+            try:
+                return self.refresh(timeout=timeout)
+            except LatestCheckFailed:
+                # Fallback to previous value if available.
+                if not self.status.version:
+                    raise
+        if not self.status.version:
+            raise LatestCheckFailed('latest version unknown')
+        return self.status.version
 
     def get_current_version(self):
         import minarca_client
 
         return minarca_client.__version__
 
-    def is_latest(self):
+    def is_latest(self, cached=False):
         """
         Check if the current minarca client is up to date.
         """
@@ -66,7 +138,7 @@ class LatestCheck:
             raise LatestCheckFailed('invalid current_version: ' + current_version)
 
         # Get latest version
-        latest_version = self.get_latest_version()
+        latest_version = self.get_latest_version(cached=cached)
         try:
             latest_version = version.Version(latest_version)
         except version.InvalidVersion:
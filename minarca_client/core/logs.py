@@ -0,0 +1,474 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+'''
+Read, follow and index backup and restore logs while they get written.
+
+@author: Patrik Dufresne <patrik@ikus-soft.com>
+'''
+import array
+import asyncio
+import bisect
+import collections
+import contextlib
+import gzip
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from minarca_client.core.exceptions import CaptureException
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of lines kept in memory while following a log file.
+LOG_MAX_LINES = 10000
+
+# Number of bytes read from the end of the file when we start following it or when we fall behind.
+LOG_TAIL_SIZE = 256 * 1024
+
+# Level of log lines from the least to the most severe.
+LEVEL_INFO = 0
+LEVEL_WARNING = 1
+LEVEL_ERROR = 2
+
+# Number of bytes read at once while indexing a log file.
+LOG_INDEX_CHUNK_SIZE = 1024 * 1024
+
+# Number of bytes at the beginning of a log file compared to detect a new run written in the same file.
+LOG_HEAD_SIZE = 256
+
+# Number of compressed logs of previous runs to keep for each log file.
+LOG_ARCHIVE_RUNS = 10
+
+# Maximum number of runs kept in the history file.
+LOG_HISTORY_SIZE = 500
+
+# Index of log files shared by every view of the process.
+_indexes = {}
+
+_WARNING_PREFIXES = (b'WARNING', b'Warning:')
+_ERROR_PREFIXES = (b'ERROR', b'Error:', b'CRITICAL', b'Fatal Error', b'Traceback', b'command failed')
+
+
+class LogFollower:
+    """
+    Follow a log file as it grows. Only the bytes appended since the
+    previous read are decoded and added to a bounded buffer of lines. When
+    the file get replaced or truncated, the buffer is cleared and reading
+    restart from the end of the new file.
+    """
+
+    def __init__(self, filename, max_lines=LOG_MAX_LINES, tail_size=LOG_TAIL_SIZE):
+        self.filename = filename
+        self.tail_size = tail_size
+        self.lines = collections.deque(maxlen=max_lines)
+        # True when the beginning of the file was skipped.
+        self.truncated = False
+        self._file_id = None
+        self._offset = None
+        self._partial = b''
+
+    def _reset(self, file_id=None, offset=None):
+        self.lines.clear()
+        self.truncated = bool(offset)
+        self._file_id = file_id
+        self._offset = offset
+        self._partial = b''
+
+    def read(self):
+        """
+        Read the lines appended to the file. Return a tuple (reset, lines)
+        where `reset` is True when the previous lines were discarded and
+        `lines` is the list of new lines.
+        """
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            reset = self._file_id is not None
+            self._reset()
+            return reset, []
+        file_id = (st.st_dev, st.st_ino)
+        reset = False
+        if file_id != self._file_id or st.st_size < self._offset or st.st_size - self._offset > self.tail_size:
+            # New file, truncated or too far behind. Start with the end of the file.
+            self._reset(file_id, max(0, st.st_size - self.tail_size))
+            reset = True
+        if st.st_size == self._offset:
+            return reset, []
+        with open(self.filename, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read(st.st_size - self._offset)
+        if reset and self.truncated:
+            # Skip the partial first line.
+            idx = data.find(b'\n')
+            self._offset += idx + 1 if idx >= 0 else len(data)
+            data = data[idx + 1 :] if idx >= 0 else b''
+        self._offset += len(data)
+        data = self._partial + data
+        *complete, self._partial = data.split(b'\n')
+        lines = [line.rstrip(b'\r').decode('utf-8', errors='replace') for line in complete]
+        self.lines.extend(lines)
+        return reset, lines[-self.lines.maxlen :]
+
+
+def _line_level(line):
+    """
+    Return the level of a log line using the known exceptions and rdiff-backup prefixes.
+    """
+    line = line.lstrip()
+    if line.startswith(_ERROR_PREFIXES) or CaptureException.matches(line):
+        return LEVEL_ERROR
+    if line.startswith(_WARNING_PREFIXES):
+        return LEVEL_WARNING
+    return LEVEL_INFO
+
+
+class LogIndex:
+    """
+    Index of a log file with the offset of every line and the level of the
+    lines that are not informative. The index is updated incrementally by
+    reading only the bytes appended since the previous update. Lines and
+    search results are read from the file using mmap, without loading the
+    whole file in memory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Allow the index to be updated and queried from different threads.
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self, file_id=None):
+        # Offset of the beginning of every complete line.
+        self._offsets = array.array('q')
+        # Line numbers of warnings and errors.
+        self._levels = {}
+        self._file_id = file_id
+        # Offset of the end of the last complete line.
+        self._end = 0
+        # First bytes of the file used to detect a file rewritten in place.
+        self._head = b''
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def update(self):
+        """
+        Index the lines appended to the file. Return True if the index was rebuilt from the beginning.
+        """
+        with self._lock:
+            return self._update()
+
+    def _update(self):
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            reset = self._file_id is not None
+            self._reset()
+            return reset
+        file_id = (st.st_dev, st.st_ino)
+        reset = False
+        if file_id != self._file_id or st.st_size < self._end:
+            self._reset(file_id)
+            reset = True
+        with open(self.filename, 'rb') as f:
+            if self._head and f.read(len(self._head)) != self._head:
+                self._reset(file_id)
+                reset = True
+            f.seek(self._end)
+            partial = b''
+            while True:
+                data = f.read(LOG_INDEX_CHUNK_SIZE)
+                if not data:
+                    break
+                data = partial + data
+                start = 0
+                end = data.find(b'\n')
+                while end >= 0:
+                    self._add_line(self._end, data[start:end])
+                    self._end += end + 1 - start
+                    start = end + 1
+                    end = data.find(b'\n', start)
+                partial = data[start:]
+            if not self._head and self._end:
+                f.seek(0)
+                self._head = f.read(min(self._end, LOG_HEAD_SIZE))
+        return reset
+
+    def _add_line(self, offset, line):
+        level = _line_level(line)
+        if level:
+            self._levels[len(self._offsets)] = level
+        self._offsets.append(offset)
+
+    def level(self, lineno):
+        with self._lock:
+            return self._levels.get(lineno, LEVEL_INFO)
+
+    def filter(self, level):
+        """
+        Return the line numbers with the given level or higher.
+        """
+        with self._lock:
+            if level <= LEVEL_INFO:
+                return range(len(self._offsets))
+            return [lineno for lineno, value in self._levels.items() if value >= level]
+
+    def errors(self):
+        return self.filter(LEVEL_ERROR)
+
+    def lines(self, linenos):
+        """
+        Return the text of the given line numbers.
+        """
+        linenos = list(linenos)
+        if not linenos:
+            return []
+        with self._lock, self._mmap() as m:
+            return [self._line(m, lineno) for lineno in linenos]
+
+    def _line(self, m, lineno):
+        start = self._offsets[lineno]
+        end = self._offsets[lineno + 1] - 1 if lineno + 1 < len(self._offsets) else self._end - 1
+        return m[start:end].rstrip(b'\r').decode('utf-8', errors='replace')
+
+    def search(self, text, level=LEVEL_INFO, limit=None):
+        """
+        Return the line numbers containing the given text, case-insensitive for ASCII, with the given level or higher.
+        """
+        pattern = re.compile(re.escape(text.encode('utf-8')), re.IGNORECASE)
+        result = []
+        if not text or not self._offsets:
+            return result
+        with self._lock, self._mmap() as m:
+            pos = 0
+            while limit is None or len(result) < limit:
+                match = pattern.search(m, pos, self._end)
+                if match is None:
+                    break
+                lineno = bisect.bisect_right(self._offsets, match.start()) - 1
+                if self.level(lineno) >= level:
+                    result.append(lineno)
+                # Continue with next line.
+                pos = self._offsets[lineno + 1] if lineno + 1 < len(self._offsets) else self._end
+        return result
+
+    @contextlib.contextmanager
+    def _mmap(self):
+        with open(self.filename, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                yield m
+
+
+def get_log_index(filename):
+    """
+    Return the index of the given log file. The same index is returned for
+    the same file so it only get updated with the lines appended since it
+    was last used, instead of being rebuilt.
+    """
+    key = str(filename)
+    index = _indexes.get(key)
+    if index is None:
+        index = _indexes[key] = LogIndex(filename)
+    return index
+
+
+class SessionStatistics:
+    """
+    Collect the session statistics printed by rdiff-backup with
+    `--print-statistics`. Integer values of multiple sessions are added.
+    """
+
+    def __init__(self):
+        self.values = {}
+        self._collect = False
+
+    def parse(self, line):
+        if line.startswith(b'--------------[ Session statistics ]'):
+            self._collect = True
+        elif not self._collect:
+            return
+        elif line.startswith(b'-----'):
+            self._collect = False
+        else:
+            # e.g.: "SourceFileSize 1234 (1.21 KB)"
+            name, unused, value = line.decode('ascii', errors='replace').partition(' ')
+            try:
+                value = int(value.split(' ', 1)[0])
+            except ValueError:
+                return
+            self.values[name] = self.values.get(name, 0) + value
+
+
+def list_archives(filename, archive_dir):
+    """
+    Return the compressed logs of previous runs of the given log file from the oldest to the most recent.
+    """
+    stem = Path(filename).stem
+
+    def _key(fn):
+        # e.g.: "backup1-20250101T120000-1.log.gz"
+        ts, unused, counter = fn.name[len(stem) + 1 : -len('.log.gz')].partition('-')
+        return ts, int(counter) if counter.isdigit() else 0
+
+    return sorted(Path(archive_dir).glob(f"{stem}-*.log.gz"), key=_key)
+
+
+class RunLog:
+    """
+    Log file of a single backup or restore run. When opened, the log of the
+    previous run is compressed with gzip into `archive_dir`, keeping only
+    the `keep` most recent runs. Used with `async with`, the compression
+    run in a thread while the run get started. When closed, the run is recorded in the
+    history file with its result, duration and the session statistics
+    collected in `statistics`.
+    """
+
+    def __init__(self, filename, archive_dir, history_file, action, keep=LOG_ARCHIVE_RUNS):
+        self.filename = Path(filename)
+        self.archive_dir = Path(archive_dir)
+        self.history_file = Path(history_file)
+        self.action = action
+        self.keep = keep
+        self.statistics = SessionStatistics()
+        self._file = None
+        self._start = None
+        self._compress_task = None
+
+    def _rotate(self):
+        """
+        Move the log of the previous run aside. Return the moved file and the
+        archive to be created or None.
+        """
+        try:
+            mtime = os.path.getmtime(self.filename)
+        except FileNotFoundError:
+            return None
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        stem = self.filename.stem
+        ts = time.strftime('%Y%m%dT%H%M%S', time.localtime(mtime))
+        # Add a counter to the name to never replace another archive created within the same second.
+        counter = 1
+        while True:
+            try:
+                dst = self.archive_dir / f"{stem}-{ts}-{counter}.log.gz"
+                open(dst, 'xb').close()
+                break
+            except FileExistsError:
+                counter += 1
+        # Rename within the same directory to be quick.
+        src = self.filename.with_name('.' + dst.name[: -len('.gz')])
+        os.replace(self.filename, src)
+        return src, dst
+
+    def _compress(self, src, dst):
+        """
+        Compress the log of the previous run and remove the oldest archives.
+        """
+        try:
+            with open(dst, 'wb') as f, open(src, 'rb') as s, gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                shutil.copyfileobj(s, gz)
+            src.unlink()
+            # Remove the oldest archives.
+            archives = list_archives(self.filename, self.archive_dir)
+            for fn in archives[: max(0, len(archives) - self.keep)]:
+                fn.unlink()
+        except OSError:
+            logger.warning(f"fail to archive log file: {src}", exc_info=1)
+
+    def _open(self):
+        try:
+            pending = self._rotate()
+        except OSError:
+            logger.warning(f"fail to archive log file: {self.filename}", exc_info=1)
+            pending = None
+        self._start = time.time()
+        self._file = open(self.filename, 'wb', buffering=0)
+        return pending
+
+    def __enter__(self):
+        pending = self._open()
+        if pending:
+            self._compress(*pending)
+        return self._file
+
+    async def __aenter__(self):
+        # Compress the previous log in a thread to not block the event loop with large log file.
+        pending = self._open()
+        if pending:
+            self._compress_task = asyncio.get_running_loop().run_in_executor(None, self._compress, *pending)
+        return self._file
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self._compress_task:
+                await self._compress_task
+        finally:
+            self.__exit__(exc_type, exc_val, exc_tb)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        end = time.time()
+        if exc_type is None:
+            result = 'SUCCESS'
+        elif issubclass(exc_type, (KeyboardInterrupt, asyncio.CancelledError)):
+            result = 'INTERRUPT'
+        else:
+            result = 'FAILURE'
+        stats = self.statistics.values
+        entry = {
+            'action': self.action,
+            'start': int(self._start * 1000),
+            'end': int(end * 1000),
+            'duration': round(end - self._start, 3),
+            'result': result,
+            'details': str(exc_val) if exc_val else '',
+            # Size of the source files and size added to the destination, when reported by rdiff-backup.
+            'source_size': stats.get('SourceFileSize'),
+            'bytes': stats.get('TotalDestinationSizeChange'),
+            'log_size': os.path.getsize(self.filename),
+        }
+        try:
+            append_history(self.history_file, entry)
+        except OSError:
+            logger.warning(f"fail to update run history: {self.history_file}", exc_info=1)
+
+
+def append_history(filename, entry, size=LOG_HISTORY_SIZE):
+    """
+    Append an entry to the run history, keeping only the `size` most recent entries.
+    """
+    entries = read_history(filename)
+    entries.append(entry)
+    if len(entries) > size:
+        # Rewrite the file once it grows too much.
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(e) + '\n' for e in entries[-size:])
+    else:
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+
+def read_history(filename, action=None):
+    """
+    Return the entries of the run history from the oldest to the most recent, ignoring invalid lines.
+    """
+    entries = []
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(entry, dict) and (action is None or entry.get('action') == action):
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
@@ -7,17 +7,81 @@ Created on Oct. 13, 2023
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
 
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import random
 import ssl
 import subprocess
+import threading
+import time
 
 import requests
 from requests.adapters import HTTPAdapter
-from requests.compat import urljoin
+from requests.compat import urljoin, urlparse
 from requests.exceptions import ConnectionError
 
 from minarca_client.core import compat
 from minarca_client.core.minarcaid import gen_minarcaid_v1
 
+# Connect and read timeout in seconds of every HTTP request.
+TIMEOUT = (10, 30)
+
+# Delay in seconds during which the current user information is reused.
+USER_INFO_TTL = 10
+
+# Initial and maximum delay in seconds between two checks while waiting for a repository.
+REPO_POLL_DELAY = 0.2
+REPO_POLL_MAX_DELAY = 5
+
+# Maximum number of HTTP requests executed concurrently by the asynchronous interface for each server.
+HTTP_MAX_WORKERS = 8
+
+# Thread pools dedicated to HTTP requests by server, to avoid starving the default executor
+# and to keep an unresponsive server from blocking requests sent to other servers.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(remoteurl):
+    """
+    Return the thread pool used to send HTTP requests to the given server.
+    """
+    host = urlparse(remoteurl).netloc
+    with _executors_lock:
+        executor = _executors.get(host)
+        if executor is None:
+            executor = _executors[host] = concurrent.futures.ThreadPoolExecutor(
+                max_workers=HTTP_MAX_WORKERS, thread_name_prefix='rdiffweb'
+            )
+        return executor
+
+
+@functools.lru_cache(maxsize=1)
+def _system_ssl_context():
+    """
+    Return SSL context using Operating System certificate. Created only once per process.
+    """
+    context = ssl.create_default_context()
+    if compat.IS_MAC:
+        # On Mac, we need to inject the root CA into the context.
+        # Because the default context is not doing it.
+        try:
+            system_certs = subprocess.check_output(
+                [
+                    "/usr/bin/security",
+                    "find-certificate",
+                    "-a",
+                    "-p",
+                    "/System/Library/Keychains/SystemRootCertificates.keychain",
+                ]
+            ).decode()
+            context.load_verify_locations(cadata=system_certs)
+        except Exception:
+            pass
+    return context
+
 
 class SystemCertsAdapter(HTTPAdapter):
     """
@@ -26,24 +90,7 @@ class SystemCertsAdapter(HTTPAdapter):
 
     def init_poolmanager(self, *args, **kwargs):
         # Uses system certs
-        context = ssl.create_default_context()
-        if compat.IS_MAC:
-            # On Mac, we need to inject the root CA into the context.
-            # Because the default context is not doing it.
-            try:
-                system_certs = subprocess.check_output(
-                    [
-                        "/usr/bin/security",
-                        "find-certificate",
-                        "-a",
-                        "-p",
-                        "/System/Library/Keychains/SystemRootCertificates.keychain",
-                    ]
-                ).decode()
-                context.load_verify_locations(cadata=system_certs)
-            except Exception:
-                pass
-        kwargs['ssl_context'] = context
+        kwargs['ssl_context'] = _system_ssl_context()
         return super().init_poolmanager(*args, **kwargs)
 
 
@@ -63,15 +110,26 @@ class MinarcaidAuth:
 
 
 class Rdiffweb:
-    def __init__(self, remoteurl):
+    def __init__(self, remoteurl, timeout=TIMEOUT):
         assert remoteurl, 'require a remote url'
         self.remoteurl = remoteurl
+        self.timeout = timeout
+        # Current user information (time, data) and pending request, managed by AsyncRdiffweb.
+        self._user_info = None
+        self._user_info_task = None
+        # Pending wait for repository creation by name, managed by AsyncRdiffweb.
+        self._repo_waits = {}
+        # True if the server support the repository endpoint. None until known.
+        self._repo_endpoint = None
         # Create HTTP(s) Session using authentication
         self._session = requests.Session()
         self._session.allow_redirects = False
         self._session.mount('https://', SystemCertsAdapter())
         self._session.headers['User-Agent'] = compat.get_user_agent()
 
+    def close(self):
+        self._session.close()
+
     @property
     def auth(self):
         return self._session.auth
@@ -96,14 +154,14 @@ class Rdiffweb:
             return
         # Resolve URL Redirection.
         query_url = urljoin(self.remoteurl + '/', '/api/')
-        response = self._session.get(query_url, allow_redirects=True)
+        response = self._session.get(query_url, allow_redirects=True, timeout=self.timeout)
 
         if not response.url.endswith('/api/'):
             # If redirection change the path, make it fail.
             raise ConnectionError('Invalid Backup Server')
         if query_url != response.url:
             # Session was redirected, query using new location.
-            response = self._session.get(response.url)
+            response = self._session.get(response.url, timeout=self.timeout)
         response.raise_for_status()
         self.remoteurl = response.url[0:-4]
         self._tested = True
@@ -113,6 +171,7 @@ class Rdiffweb:
         response = self._session.post(
             self.remoteurl + 'api/currentuser/sshkeys',
             data={'title': title, 'key': public_key},
+            timeout=self.timeout,
         )
         response.raise_for_status()
 
@@ -121,7 +180,7 @@ class Rdiffweb:
         Return current user information.
         """
         self._test()
-        response = self._session.get(self.remoteurl + 'api/currentuser/')
+        response = self._session.get(self.remoteurl + 'api/currentuser/', timeout=self.timeout)
         response.raise_for_status()
         return response.json()
 
@@ -130,7 +189,7 @@ class Rdiffweb:
         Return a dict with `version`, `remotehost`, `identity`
         """
         self._test()
-        response = self._session.get(self.remoteurl + 'api/minarca/')
+        response = self._session.get(self.remoteurl + 'api/minarca/', timeout=self.timeout)
         response.raise_for_status()
         return response.json()
 
@@ -149,6 +208,7 @@ class Rdiffweb:
         response = self._session.post(
             f'{self.remoteurl}api/currentuser/repos/{id_or_name}',
             data=data,
+            timeout=self.timeout,
         )
         response.raise_for_status()
 
@@ -159,6 +219,165 @@ class Rdiffweb:
         self._test()
         response = self._session.get(
             f'{self.remoteurl}api/currentuser/repos/{id_or_name}',
+            timeout=self.timeout,
         )
         response.raise_for_status()
         return response.json()
+
+
+class AsyncRdiffweb:
+    """
+    Asynchronous interface of `Rdiffweb` with the same methods. Requests are
+    executed by a thread pool dedicated to the server and bounded by
+    `TIMEOUT`. When the caller get cancelled, requests not yet started are
+    dropped. A request already sent cannot be interrupted: it keeps its
+    thread until it completes or times out and its result is discarded.
+    """
+
+    def __init__(self, client):
+        assert isinstance(client, Rdiffweb)
+        self.client = client
+
+    @property
+    def remoteurl(self):
+        return self.client.remoteurl
+
+    async def _call(self, func, *args, **kwargs):
+        executor = _get_executor(self.client.remoteurl)
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def post_ssh_key(self, title, public_key):
+        self.client._user_info = None
+        return await self._call(self.client.post_ssh_key, title, public_key)
+
+    async def get_current_user_info(self, max_age=USER_INFO_TTL):
+        """
+        Return current user information. The information is shared by every
+        caller using the same client for `max_age` seconds. Concurrent
+        callers wait for the same request.
+        """
+        client = self.client
+        if max_age and client._user_info and time.monotonic() - client._user_info[0] < max_age:
+            return client._user_info[1]
+        loop = asyncio.get_running_loop()
+        task = client._user_info_task
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = client._user_info_task = loop.create_task(self._fetch_current_user_info())
+        # Cancelling one caller must not cancel the request shared with others.
+        return await asyncio.shield(task)
+
+    async def _fetch_current_user_info(self):
+        data = await self._call(self.client.get_current_user_info)
+        self.client._user_info = (time.monotonic(), data)
+        return data
+
+    async def get_minarca_info(self):
+        return await self._call(self.client.get_minarca_info)
+
+    async def post_repo_settings(self, id_or_name, maxage=None, keepdays=None, ignore_weekday=None):
+        self.client._user_info = None
+        return await self._call(
+            self.client.post_repo_settings, id_or_name, maxage=maxage, keepdays=keepdays, ignore_weekday=ignore_weekday
+        )
+
+    async def get_repo_settings(self, id_or_name):
+        return await self._call(self.client.get_repo_settings, id_or_name)
+
+    async def wait_for_repo(self, id_or_name, timeout):
+        """
+        Wait until the repository exists on the server for `timeout` seconds.
+        Check the repository endpoint with an exponential backoff and jitter
+        instead of the full user information. The user information is only
+        used with older servers without repository endpoint. Concurrent
+        callers waiting for the same repository share the same checks.
+        Raise TimeoutError.
+        """
+        loop = asyncio.get_running_loop()
+        waits = self.client._repo_waits
+        task = waits.get(id_or_name)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = waits[id_or_name] = loop.create_task(self._poll_repo(id_or_name, timeout))
+        return await asyncio.shield(task)
+
+    async def _poll_repo(self, id_or_name, timeout):
+        deadline = time.monotonic() + timeout
+        delay = REPO_POLL_DELAY
+        try:
+            while True:
+                if await self._repo_exists(id_or_name):
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError()
+                await asyncio.sleep(min(random.uniform(delay / 2, delay), remaining))
+                delay = min(delay * 2, REPO_POLL_MAX_DELAY)
+        finally:
+            # Forget the wait once completed.
+            if self.client._repo_waits.get(id_or_name) is asyncio.current_task():
+                del self.client._repo_waits[id_or_name]
+
+    async def _repo_exists(self, id_or_name):
+        if self.client._repo_endpoint is not False:
+            try:
+                await self.get_repo_settings(id_or_name)
+                return True
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+            if await self._has_repo_endpoint():
+                return False
+        # Older server without repository endpoint, search the repository in user information.
+        data = await self.get_current_user_info(max_age=REPO_POLL_DELAY)
+        return any(r.get('name') == id_or_name for r in data.get('repos', []))
+
+    async def _has_repo_endpoint(self):
+        """
+        Check if the server support the repository endpoint using an existing repository.
+        """
+        client = self.client
+        if client._repo_endpoint is None:
+            repos = [r.get('name') for r in (await self.get_current_user_info(max_age=0)).get('repos', [])]
+            if not repos:
+                # Cannot tell without repository.
+                return False
+            try:
+                await self.get_repo_settings(repos[0])
+                client._repo_endpoint = True
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code != 404:
+                    raise
+                client._repo_endpoint = False
+        return client._repo_endpoint
+
+
+# Clients shared by every instances, by remote url and credentials.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(remoteurl, auth):
+    """
+    Return a client shared within the process for the given remote url and
+    credentials. Sharing the client keep the HTTP connections alive and the
+    server URL resolved between calls.
+    """
+    if isinstance(auth, bytes):
+        key = (remoteurl, hashlib.sha256(auth).hexdigest())
+    else:
+        key = (remoteurl, tuple(auth))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = Rdiffweb(remoteurl)
+            client.auth = auth
+        return client
+
+
+def clear_clients():
+    """
+    Close and forget every shared clients.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
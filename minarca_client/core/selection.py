@@ -0,0 +1,146 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+'''
+Selection of files and folders to be restored.
+
+@author: Patrik Dufresne <patrik@ikus-soft.com>
+'''
+import itertools
+import os
+
+
+def path_parts(path):
+    """
+    Split the path into a tuple of components, starting with the drive and root, ignoring empty and `.` components.
+    """
+    path = os.path.normcase(os.fspath(path))
+    drive, path = os.path.splitdrive(path)
+    if os.altsep:
+        path = path.replace(os.altsep, os.sep)
+    root = drive + (os.sep if path.startswith(os.sep) else '')
+    return (root,) + tuple(part for part in path.split(os.sep) if part and part != '.')
+
+
+class _Node:
+    __slots__ = ('children', 'selected')
+
+    def __init__(self):
+        self.children = {}
+        self.selected = False
+
+
+class PathSelection:
+    """
+    Set of selected files and folders stored as a tree. Selecting a folder
+    implicitly select everything below it without enumerating the
+    descendants. The selection never contains a path and one of its parents,
+    so `paths()` is already reduced. Every operation is proportional to the
+    depth of the path, except `select()` of a folder which also drop the
+    descendants previously selected.
+    """
+
+    def __init__(self, paths=[]):
+        self._root = _Node()
+        # Selected path by parts, in selection order.
+        self._selected = {}
+        for path in paths:
+            self.select(path)
+
+    def __len__(self):
+        return len(self._selected)
+
+    def __bool__(self):
+        return bool(self._selected)
+
+    def __iter__(self):
+        return iter(self._selected.values())
+
+    def __contains__(self, path):
+        """True if the path is selected by itself or by one of its parents."""
+        node = self._root
+        for part in path_parts(path):
+            node = node.children.get(part)
+            if node is None:
+                return False
+            if node.selected:
+                return True
+        return False
+
+    def _find(self, parts):
+        node = self._root
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def is_selected(self, path):
+        """True if the path itself is selected."""
+        node = self._find(path_parts(path))
+        return bool(node and node.selected)
+
+    def is_parent_selected(self, path):
+        """True if one of the parents of the path is selected."""
+        node = self._root
+        for part in path_parts(path)[:-1]:
+            node = node.children.get(part)
+            if node is None:
+                return False
+            if node.selected:
+                return True
+        return False
+
+    def select(self, path):
+        """
+        Select the path and everything below it. Return False if the path was already selected.
+        """
+        parts = path_parts(path)
+        node = self._root
+        for part in parts:
+            node = node.children.setdefault(part, _Node())
+            if node.selected:
+                return False
+        # Forget about descendants already covered by this path.
+        stack = [(parts, node)]
+        while stack:
+            prefix, parent = stack.pop()
+            for part, child in parent.children.items():
+                if child.selected:
+                    del self._selected[prefix + (part,)]
+                stack.append((prefix + (part,), child))
+        node.children = {}
+        node.selected = True
+        self._selected[parts] = path
+        return True
+
+    def unselect(self, path):
+        """
+        Unselect the path. Return False if the path itself was not selected.
+        """
+        parts = path_parts(path)
+        node = self._find(parts)
+        if node is None or not node.selected:
+            return False
+        node.selected = False
+        del self._selected[parts]
+        return True
+
+    def toggle(self, path):
+        """
+        Select or unselect the path. Return True if the path is selected.
+        """
+        if self.unselect(path):
+            return False
+        self.select(path)
+        return True
+
+    def clear(self):
+        self._root = _Node()
+        self._selected = {}
+
+    def paths(self, limit=None):
+        """
+        Return the selected paths in selection order. Only the first `limit` paths are returned if defined.
+        """
+        return list(itertools.islice(self._selected.values(), limit))
@@ -64,6 +64,7 @@ class Settings(KeyValueConfigFile):
         ('pre_hook_command', str, None),
         ('post_hook_command', str, None),
         ('ignore_hook_errors', _bool, False),
+        ('restore_jobs', int, None),
     ]
 
     @property
@@ -21,6 +21,19 @@ logger = logging.getLogger(__name__)
 LAST_RESULTS = ['SUCCESS', 'FAILURE', 'RUNNING', 'STALE', 'INTERRUPT']
 
 
+def _epoch_list(value):
+    """
+    Convert string "[1712947549, 1712947555]" to a list of epoch. Raise ValueError if the value is incomplete.
+    """
+    if value is None or isinstance(value, list):
+        return value
+    value = value.strip()
+    if not value.startswith('[') or not value.endswith(']'):
+        raise ValueError(value)
+    value = value[1:-1].strip()
+    return [int(v) for v in value.split(',')] if value else []
+
+
 class Status(KeyValueConfigFile):
     RUNNING_DELAY = 5  # When running status file get updated every 5 seconds.
 
@@ -33,6 +46,14 @@ class Status(KeyValueConfigFile):
         ('action', lambda x: x if x in ['backup', 'restore'] else None, None),
         ('lastnotificationid', str, None),
         ('lastnotificationdate', lambda x: Datetime(x) if x else None, None),
+        # Cache of increments with the marker used to validate it.
+        ('increments', _epoch_list, None),
+        ('increments_marker', str, None),
+        ('increments_date', lambda x: Datetime(x) if x else None, None),
+        # Result of the last connection probe.
+        ('probe_level', lambda x: x or None, None),
+        ('probe_error', lambda x: x or None, None),
+        ('probe_date', lambda x: Datetime(x) if x else None, None),
     ]
 
     @property
@@ -106,6 +127,9 @@ class UpdateStatus:
                 t.lastsuccess = Datetime()
                 t.lastdate = self.status.lastsuccess
                 t.details = ''
+                # A new increment is available.
+                if self.action == 'backup':
+                    t.increments = None
         else:
             logger.error(f"{self.instance.log_id}: {self.action} FAILED")
             with self.status as t:
@@ -2,9 +2,13 @@
 # IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
 # Use is subject to license terms.
 import os
+import tempfile
 import unittest
+from collections import namedtuple
 from pathlib import Path
+from unittest import mock
 
+from minarca_client.core._disk_linux import MountEntry, _mount_table, _parse_mountinfo
 from minarca_client.core.compat import IS_LINUX, IS_WINDOWS
 from minarca_client.core.disk import get_location_info, list_disk_with_location_info, list_disks, splitmountpoint
 
@@ -37,6 +41,24 @@ class TestDisk(unittest.TestCase):
         disk = disks[0]
         self.assertIsInstance(disk, Path)
 
+    @mock.patch('psutil.disk_partitions')
+    def test_list_disks_local_only(self, mock_partitions):
+        # Given a list of partitions
+        sdiskpart = namedtuple('sdiskpart', ['device', 'mountpoint', 'fstype', 'opts'])
+        mock_partitions.return_value = [
+            sdiskpart('/dev/sda1', '/', 'ext4', 'rw,relatime'),
+            sdiskpart('/dev/sdb1', '/media/usb', 'vfat', 'rw,nosuid'),
+            sdiskpart('server:/share', '/mnt/nfs', 'nfs4', 'rw,relatime'),
+            sdiskpart('/dev/sr0', '/media/cdrom', 'iso9660', 'ro'),
+        ]
+        # When listing local disks only
+        disks = list_disks(local_only=True)
+        # Then network share and readonly disks are excluded
+        self.assertEqual([Path('/'), Path('/media/usb')], disks)
+        # When listing all disks
+        # Then network share are included
+        self.assertEqual([Path('/'), Path('/media/usb'), Path('/mnt/nfs')], list_disks())
+
     def test_list_disk_with_location_info_removable(self):
         # Not sure how to test this in a controlled environment.
         # We don't have removable disk in CICD.
@@ -63,3 +85,87 @@ class TestDisk(unittest.TestCase):
             mountpoint, relpath = splitmountpoint("q:/")
             self.assertEqual(Path('q:/'), mountpoint)
             self.assertEqual(Path('.'), relpath)
+
+    @unittest.skipUnless(IS_LINUX, 'mountinfo only available on Linux')
+    def test_parse_mountinfo(self):
+        # Given the content of mountinfo with escaped characters
+        data = (
+            '23 28 0:22 / /proc rw,relatime - proc proc rw\n'
+            '36 28 8:17 / /media/user/My\\040Disk rw,nosuid shared:1 master:2 - vfat /dev/sdb1 rw\n'
+            'invalid line\n'
+        )
+        # When parsing the data
+        entries = _parse_mountinfo(data)
+        # Then mount entries are returned
+        self.assertEqual(
+            [
+                MountEntry(Path('/proc'), 'proc', 'proc'),
+                MountEntry(Path('/media/user/My Disk'), '/dev/sdb1', 'vfat'),
+            ],
+            entries,
+        )
+
+    @unittest.skipUnless(IS_LINUX, 'mountinfo only available on Linux')
+    def test_get_location_info_without_subprocess(self):
+        # Given a mount table loaded in memory
+        _mount_table.entries()
+        # When getting location info
+        with mock.patch('subprocess.check_output', side_effect=AssertionError('subprocess not expected')):
+            with mock.patch.object(_mount_table, '_reload', wraps=_mount_table._reload) as reload:
+                info1 = get_location_info(Path(os.getcwd()))
+                info2 = get_location_info(Path(os.getcwd()))
+        # Then the information is read from the mount table
+        self.assertTrue(info1.fstype)
+        self.assertEqual(info1.fstype, info2.fstype)
+        # Then the mount table is not read again
+        reload.assert_not_called()
+
+    @unittest.skipUnless(IS_LINUX, 'mountinfo only available on Linux')
+    def test_get_location_info_same_source(self):
+        # Given two file systems mounted from the same source
+        data = (
+            '23 28 0:22 / /tmp rw,relatime - tmpfs tmpfs rw\n'
+            '24 28 0:23 / /run/user/1000 rw,relatime - ramfs tmpfs rw\n'
+        )
+        # When getting location info of each mount point
+        entries = _parse_mountinfo(data)
+        with mock.patch.object(_mount_table, 'entries', return_value=entries), mock.patch.object(
+            _mount_table, '_devices', {}
+        ), mock.patch('minarca_client.core.disk._get_mountpoint', side_effect=Path), mock.patch(
+            'minarca_client.core.disk._get_mountpoint_posix', side_effect=Path
+        ):
+            info1 = get_location_info(Path('/tmp'))
+            info2 = get_location_info(Path('/run/user/1000'))
+        # Then the file system type of each mount entry is returned
+        self.assertEqual('tmpfs', info1.fstype)
+        self.assertEqual('ramfs', info2.fstype)
+
+    @unittest.skipUnless(IS_LINUX, 'mountinfo only available on Linux')
+    def test_mount_table_find(self):
+        # Given a mount table
+        entries = _parse_mountinfo(
+            '21 1 8:1 / / rw - ext4 /dev/sda1 rw\n'
+            '22 21 0:20 / /home rw - btrfs /dev/sda2 rw\n'
+            '23 21 0:21 / /home/user/mnt rw - tmpfs tmpfs rw\n'
+            '24 21 0:22 / /home/user/mnt rw - ramfs none rw\n'
+        )
+        with mock.patch.object(_mount_table, 'entries', return_value=entries):
+            # When looking for a mount point
+            # Then the last mounted entry is returned
+            self.assertEqual('ramfs', _mount_table.find('/home/user/mnt').fstype)
+            # When looking for a path that is not a mount point, e.g.: btrfs subvolume
+            # Then the longest mount point containing it is returned
+            self.assertEqual('btrfs', _mount_table.find('/home/user/subvolume').fstype)
+            self.assertEqual('ext4', _mount_table.find('/var').fstype)
+
+    @unittest.skipUnless(IS_LINUX, 'mountinfo only available on Linux')
+    def test_get_location_info_symlink(self):
+        # Given a symlink to a mount point
+        with tempfile.TemporaryDirectory() as tmp:
+            link = Path(tmp) / 'proclink'
+            link.symlink_to('/proc')
+            # When getting location info
+            info = get_location_info(link)
+        # Then file system of the target is returned
+        self.assertEqual('proc', info.fstype)
+        self.assertIsNotNone(info.device_type)
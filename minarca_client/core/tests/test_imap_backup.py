@@ -4,6 +4,7 @@
 
 import email
 import os
+import re
 import stat
 import tempfile
 import unittest
@@ -12,7 +13,18 @@ from pathlib import Path
 from unittest import mock
 
 from minarca_client.core.compat import secure_file
-from minarca_client.core.imap_backup import decode_header, fetch_and_store, main_run, parse_args, sanitize_folder
+from minarca_client.core.imap_backup import (
+    ArchiveIndex,
+    decode_header,
+    fetch_and_store,
+    load_folder_state,
+    load_last_uid,
+    main_run,
+    parse_args,
+    sanitize_folder,
+    save_folder_state,
+    save_last_uid,
+)
 
 
 class TestIMAPBackup(unittest.TestCase):
@@ -23,6 +35,7 @@ class TestIMAPBackup(unittest.TestCase):
     def test_fetch_and_store_basic(self, mock_load_uid, mock_save_eml, mock_save_uid):
         # Given a mocked IMAP connection with 2 new messages
         conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 1)'])
         conn.select.return_value = ("OK", [b""])
         conn.uid.side_effect = [
             ("OK", [b"101 102"]),  # search
@@ -60,6 +73,212 @@ class TestIMAPBackup(unittest.TestCase):
             self.assertEqual(args1[0], "INBOX")  # folder name
             self.assertIsInstance(args1[2], email.message.Message)
 
+            # Then the folder status is recorded for next run
+            self.assertEqual({'UIDNEXT': 103, 'UIDVALIDITY': 1}, load_folder_state("INBOX", output_dir))
+
+    def test_fetch_and_store_skip_unchanged_folder(self):
+        # Given a folder previously synced
+        conn = mock.MagicMock()
+        conn.capabilities = ('IMAP4REV1', 'CONDSTORE')
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 1 HIGHESTMODSEQ 20)'])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            save_folder_state("INBOX", {'UIDNEXT': 103, 'UIDVALIDITY': 1, 'HIGHESTMODSEQ': 10}, output_dir)
+
+            # When fetching and storing the messages
+            fetch_and_store(conn, "INBOX", output_dir)
+
+            # Then STATUS is queried with HIGHESTMODSEQ
+            conn.status.assert_called_once_with('"INBOX"', '(UIDNEXT UIDVALIDITY HIGHESTMODSEQ)')
+            # Then the folder is not selected since no new message are available
+            conn.select.assert_not_called()
+            conn.uid.assert_not_called()
+
+    def test_fetch_and_store_with_modseq(self):
+        # Given a folder previously synced with new messages available
+        conn = mock.MagicMock()
+        conn.capabilities = ('IMAP4REV1', 'CONDSTORE')
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 104 UIDVALIDITY 1 HIGHESTMODSEQ 20)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.return_value = ("OK", [b""])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            save_folder_state("INBOX", {'UIDNEXT': 103, 'UIDVALIDITY': 1, 'HIGHESTMODSEQ': 10}, output_dir)
+            save_last_uid("INBOX", 102, output_dir)
+
+            # When fetching and storing the messages
+            fetch_and_store(conn, "INBOX", output_dir)
+
+            # Then only messages changed since last MODSEQ are searched
+            conn.uid.assert_called_once_with('search', None, '(UID 103:* MODSEQ 11)')
+            # Then new state is recorded
+            self.assertEqual(
+                {'UIDNEXT': 104, 'UIDVALIDITY': 1, 'HIGHESTMODSEQ': 20}, load_folder_state("INBOX", output_dir)
+            )
+
+    def test_fetch_and_store_uidvalidity_changed(self):
+        # Given a folder previously synced with a different UIDVALIDITY
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 2)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.return_value = ("OK", [b""])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            save_folder_state("INBOX", {'UIDNEXT': 103, 'UIDVALIDITY': 1}, output_dir)
+            save_last_uid("INBOX", 102, output_dir)
+            (output_dir / 'INBOX' / '102-20240101-test@example.com-Hello.eml').write_text('previous')
+
+            # When fetching and storing the messages
+            fetch_and_store(conn, "INBOX", output_dir)
+
+            # Then all messages are searched
+            conn.uid.assert_called_once_with('search', None, 'ALL')
+            # Then previous messages are moved by UIDVALIDITY
+            self.assertEqual([], list((output_dir / 'INBOX').glob('*.eml')))
+            self.assertEqual(
+                'previous',
+                (output_dir / 'INBOX' / 'uidvalidity-1' / '102-20240101-test@example.com-Hello.eml').read_text(),
+            )
+            self.assertEqual(2, load_folder_state("INBOX", output_dir)['UIDVALIDITY'])
+
+    def test_fetch_and_store_uidvalidity_changed_with_index(self):
+        # Given an index with messages archived with a different UIDVALIDITY
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 2)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.return_value = ("OK", [b""])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            save_folder_state("INBOX", {'UIDNEXT': 103, 'UIDVALIDITY': 1}, output_dir)
+            (output_dir / 'INBOX' / '101.eml').write_text('previous')
+            with ArchiveIndex(output_dir) as index:
+                index.add("INBOX", 1, 101, None, 8, None, Path('INBOX/101.eml'))
+
+                # When fetching and storing the messages
+                fetch_and_store(conn, "INBOX", output_dir, index=index)
+
+                # Then the index point to the moved message
+                rows = index.search(folder="INBOX")
+                self.assertEqual(1, len(rows))
+                self.assertEqual(str(Path('INBOX/uidvalidity-1/101.eml')), rows[0][6])
+                self.assertTrue((output_dir / rows[0][6]).exists())
+
+    @mock.patch("minarca_client.core.imap_backup.store_message", side_effect=[False, True])
+    def test_fetch_and_store_failed_message(self, mock_store):
+        # Given a folder with 2 new messages
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 1)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.return_value = ("OK", [b"101 102"])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            save_folder_state("INBOX", {'UIDNEXT': 101, 'UIDVALIDITY': 1}, output_dir)
+            save_last_uid("INBOX", 100, output_dir)
+
+            # When the first message fails to be stored
+            fetch_and_store(conn, "INBOX", output_dir)
+
+            # Then the next message is still stored
+            self.assertEqual(2, mock_store.call_count)
+            # Then the failed message get retried on next sync
+            self.assertEqual(100, load_last_uid("INBOX", output_dir))
+            self.assertEqual({'UIDNEXT': 101, 'UIDVALIDITY': 1}, load_folder_state("INBOX", output_dir))
+
+    def test_fetch_and_store_with_index(self):
+        # Given a mocked IMAP connection with 2 messages, one of them already archived
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 7)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.side_effect = [
+            ("OK", [b"101 102"]),  # search
+            (
+                "OK",
+                [
+                    (
+                        b"102 (BODY[])",
+                        b"From: test2@example.com\r\nSubject: World\r\nMessage-ID: <102@example.com>\r\n"
+                        b"Date: Mon, 2 Jan 2024 00:00:00 +0000\r\n\r\nBody",
+                    )
+                ],
+            ),
+        ]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            with ArchiveIndex(output_dir) as index:
+                index.add("INBOX", 7, 101, '<101@example.com>', 10, None, 'INBOX/101.eml')
+
+                # When fetching and storing the messages
+                fetch_and_store(conn, "INBOX", output_dir, index=index)
+
+                # Then only the missing message is fetched
+                self.assertEqual(2, conn.uid.call_count)
+                conn.uid.assert_called_with('fetch', b'102', '(RFC822.SIZE BODY.PEEK[]<0.1048576>)')
+                # Then the index contains both messages
+                self.assertTrue(index.contains("INBOX", 7, 102))
+                self.assertEqual(102, index.last_uid("INBOX", 7))
+                rows = index.search(message_id='<102@example.com>')
+                self.assertEqual(1, len(rows))
+                folder, uidvalidity, uid, message_id, size, date, filename = rows[0]
+                self.assertEqual(('INBOX', 7, 102), (folder, uidvalidity, uid))
+                self.assertEqual('2024-01-02T00:00:00+00:00', date)
+                self.assertTrue((output_dir / filename).exists())
+                self.assertEqual(1, len(index.search(text='World')))
+
+    def test_fetch_and_store_resume_from_index(self):
+        # Given an index with archived messages but without UID state file
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 103 UIDVALIDITY 7)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.return_value = ("OK", [b""])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            with ArchiveIndex(output_dir) as index:
+                index.add("INBOX", 7, 101, None, 10, None, 'INBOX/101.eml')
+
+                # When fetching and storing the messages
+                fetch_and_store(conn, "INBOX", output_dir, index=index)
+
+                # Then search resume after the last indexed UID
+                conn.uid.assert_called_once_with('search', None, '(UID 102:*)')
+
+    @mock.patch("minarca_client.core.imap_backup.FETCH_CHUNK_SIZE", 16)
+    def test_fetch_and_store_large_message_in_chunks(self):
+        # Given a message larger than the fetch chunk size
+        raw = b"From: test@example.com\r\nSubject: Big\r\nDate: Mon, 1 Jan 2024 00:00:00 +0000\r\n\r\n" + b"x" * 40
+
+        def uid_side_effect(command, uid, criteria):
+            if command == 'search':
+                return ("OK", [b"101"])
+            m = re.match(r'\((?:RFC822\.SIZE )?BODY\.PEEK\[\]<(\d+)\.(\d+)>\)', criteria)
+            offset, length = int(m[1]), int(m[2])
+            return (
+                "OK",
+                [
+                    (
+                        b"1 (UID 101 RFC822.SIZE %d BODY[]<%d> {%d}" % (len(raw), offset, length),
+                        raw[offset : offset + length],
+                    ),
+                    b")",
+                ],
+            )
+
+        conn = mock.MagicMock()
+        conn.status.return_value = ("OK", [b'"INBOX" (UIDNEXT 102 UIDVALIDITY 1)'])
+        conn.select.return_value = ("OK", [b""])
+        conn.uid.side_effect = uid_side_effect
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+
+            # When fetching and storing the message
+            fetch_and_store(conn, "INBOX", output_dir)
+
+            # Then the message is fetched by range
+            self.assertEqual(1 + -(-len(raw) // 16), conn.uid.call_count)
+            # Then the file contains the raw message without temporary file left behind
+            files = os.listdir(output_dir / "INBOX")
+            self.assertEqual(['.folder_state', '.last_uid', '101-20240101-test@example.com-Big.eml'], sorted(files))
+            self.assertEqual(raw, (output_dir / "INBOX" / '101-20240101-test@example.com-Big.eml').read_bytes())
+
     def test_sanitize_folder_removes_invalid_chars(self):
         # Given a folder name with invalid characters
         name = 'INBOX:Test/Folder*?"'
@@ -163,14 +382,16 @@ class TestIMAPBackup(unittest.TestCase):
         self.assertEqual(parsed.include_folder, ['INBOX', 'Work/*'])
         self.assertEqual(parsed.exclude_folder, ['?Gmail*', 'Spam'])
 
+    @mock.patch('minarca_client.core.imap_backup._configure_logging')
     @mock.patch('imaplib.IMAP4_SSL')
-    def test_main_run(self, mock_imap):
+    def test_main_run(self, mock_imap, mock_logging):
         # Given a IMAP Server with 3 folders
         mock_conn = mock_imap.return_value
         mock_conn.list.return_value = (
             'OK',
             [b'(\\HasNoChildren) "/" "INBOX"', b'(\\HasNoChildren) "/" "Spam"', b'(\\HasChildren) "/" "[Gmail]"'],
         )
+        mock_conn.status.return_value = ('OK', [b'"INBOX" (UIDNEXT 4 UIDVALIDITY 1)'])
         mock_conn.select.return_value = ('OK', [b'42'])
 
         def uid_side_effect(command, charset, criteria):
@@ -179,9 +400,18 @@ class TestIMAPBackup(unittest.TestCase):
             return ('NO', [b'Invalid command'])
 
         mock_conn.uid.side_effect = uid_side_effect
+        # Given a server advertising CONDSTORE once authenticated
+        mock_conn.capabilities = ('IMAP4REV1',)
+        mock_conn.capability.return_value = ('OK', [b'IMAP4rev1 CONDSTORE'])
         # When running the script
         # Then no error get raised.
-        main_run(['--server', 'imap.example.com', '--username', 'u', '--password', 'p'])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            main_run(['--server', 'imap.example.com', '--username', 'u', '--password', 'p', '--output', temp_dir])
+            # Then an index get created
+            self.assertTrue((Path(temp_dir) / '.imap_index.db').exists())
+        # Then capabilities are refreshed after login
+        self.assertEqual(('IMAP4REV1', 'CONDSTORE'), mock_conn.capabilities)
+        mock_conn.status.assert_any_call('"INBOX"', '(UIDNEXT UIDVALIDITY HIGHESTMODSEQ)')
 
 
 if __name__ == '__main__':
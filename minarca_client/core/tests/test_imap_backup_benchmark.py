@@ -0,0 +1,236 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+'''
+Throughput benchmark of `imap_backup` against a scripted IMAP server.
+
+The size of the synthetic mailbox may be configured using environment variables:
+
+    MINARCA_BENCH_FOLDERS=20 MINARCA_BENCH_MESSAGES=500 MINARCA_BENCH_LATENCY=0.005 \\
+        pytest -s minarca_client/core/tests/test_imap_backup_benchmark.py
+'''
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import psutil
+
+from minarca_client.core import imap_backup
+from minarca_client.core.imap_backup import main_run
+
+BODY_LINE = b'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do.\r\n'
+
+
+def _env(name, default, type=int):
+    return type(os.environ.get(name, default))
+
+
+class SyntheticMailbox:
+    """
+    Deterministic mailbox generated on demand. Message content is never kept
+    in memory, only their size.
+    """
+
+    def __init__(self, folders=3, messages=20, min_size=1024, max_size=64 * 1024, seed=0):
+        rnd = random.Random(seed)
+        self.folders = {
+            f'Folder{i}': [rnd.randint(min_size, max_size) for _unused in range(messages)] for i in range(folders)
+        }
+
+    def _header(self, folder, uid):
+        return (
+            f'From: sender{uid}@example.com\r\n'
+            f'Subject: Message {uid} of {folder}\r\n'
+            f'Message-ID: <{uid}.{folder}@example.com>\r\n'
+            'Date: Mon, 1 Jan 2024 00:00:00 +0000\r\n\r\n'
+        ).encode()
+
+    def size(self, folder, uid):
+        return len(self._header(folder, uid)) + self.folders[folder][uid - 1]
+
+    def read(self, folder, uid, offset, length):
+        """Return a range of the message."""
+        header = self._header(folder, uid)
+        end = min(offset + length, self.size(folder, uid))
+        data = header[offset:end]
+        body_start = max(offset - len(header), 0)
+        body_end = end - len(header)
+        if body_end > body_start:
+            start = body_start % len(BODY_LINE)
+            count = (body_end - body_start + start) // len(BODY_LINE) + 1
+            data += (BODY_LINE * count)[start : start + body_end - body_start]
+        return data
+
+    @property
+    def total_messages(self):
+        return sum(len(sizes) for sizes in self.folders.values())
+
+    @property
+    def total_bytes(self):
+        return sum(self.size(folder, uid + 1) for folder, sizes in self.folders.items() for uid in range(len(sizes)))
+
+
+class FakeIMAP:
+    """
+    Scripted replacement of `imaplib.IMAP4_SSL` serving a `SyntheticMailbox`
+    with an optional latency added to every command.
+    """
+
+    capabilities = ('IMAP4REV1', 'CONDSTORE')
+
+    def __init__(self, mailbox, latency=0):
+        self.mailbox = mailbox
+        self.latency = latency
+        self.selected = None
+        self.commands = 0
+
+    def __call__(self, host, port):
+        return self
+
+    def _command(self):
+        self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def login(self, username, password):
+        self._command()
+        return 'OK', [b'Logged in']
+
+    def capability(self):
+        self._command()
+        return 'OK', [' '.join(self.capabilities).encode()]
+
+    def logout(self):
+        self._command()
+        return 'BYE', [b'Logging out']
+
+    def list(self):
+        self._command()
+        return 'OK', [b'(\\HasNoChildren) "/" "%s"' % name.encode() for name in self.mailbox.folders]
+
+    def status(self, mailbox, items):
+        self._command()
+        folder = mailbox.strip('"')
+        count = len(self.mailbox.folders[folder])
+        return 'OK', [b'"%s" (UIDNEXT %d UIDVALIDITY 1 HIGHESTMODSEQ %d)' % (folder.encode(), count + 1, count)]
+
+    def select(self, mailbox, readonly=False):
+        self._command()
+        self.selected = mailbox.strip('"')
+        return 'OK', [str(len(self.mailbox.folders[self.selected])).encode()]
+
+    def uid(self, command, *args):
+        self._command()
+        count = len(self.mailbox.folders[self.selected])
+        if command == 'search':
+            m = re.search(r'UID (\d+):\*', args[1])
+            start = int(m[1]) if m else 1
+            return 'OK', [b' '.join(str(uid).encode() for uid in range(start, count + 1))]
+        if command == 'fetch':
+            uid = int(args[0])
+            m = re.search(r'BODY\.PEEK\[\]<(\d+)\.(\d+)>', args[1])
+            offset, length = int(m[1]), int(m[2])
+            data = self.mailbox.read(self.selected, uid, offset, length)
+            size = self.mailbox.size(self.selected, uid)
+            meta = b'1 (UID %d RFC822.SIZE %d BODY[]<%d> {%d}' % (uid, size, offset, len(data))
+            return 'OK', [(meta, data), b')']
+        return 'NO', [b'Invalid command']
+
+
+class PeakRSS:
+    """Sample resident memory of the current process in a background thread."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+
+    def _run(self):
+        process = psutil.Process()
+        while self.running:
+            self.peak = max(self.peak, process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.running = False
+        self.thread.join()
+
+
+class TestIMAPBackupBenchmark(unittest.TestCase):
+
+    def _run(self, fake, output_dir):
+        with mock.patch('imaplib.IMAP4_SSL', fake), mock.patch.object(imap_backup, '_configure_logging'):
+            start = time.perf_counter()
+            main_run(['--server', 'imap.example.com', '--username', 'u', '--password', 'p', '--output', output_dir])
+            return time.perf_counter() - start
+
+    def _report(self, name, mailbox, elapsed, peak=None, peak_label='peak RSS'):
+        msg = '%s: %d messages, %d bytes in %.3fs (%.1f msg/s, %.1f MiB/s)' % (
+            name,
+            mailbox.total_messages,
+            mailbox.total_bytes,
+            elapsed,
+            mailbox.total_messages / elapsed,
+            mailbox.total_bytes / elapsed / 1024 / 1024,
+        )
+        if peak:
+            msg += ', %s %.1f MiB' % (peak_label, peak / 1024 / 1024)
+        print(msg)
+
+    def test_throughput(self):
+        # Given a synthetic mailbox
+        mailbox = SyntheticMailbox(
+            folders=_env('MINARCA_BENCH_FOLDERS', 3),
+            messages=_env('MINARCA_BENCH_MESSAGES', 20),
+            min_size=_env('MINARCA_BENCH_MIN_SIZE', 1024),
+            max_size=_env('MINARCA_BENCH_MAX_SIZE', 64 * 1024),
+        )
+        fake = FakeIMAP(mailbox, latency=_env('MINARCA_BENCH_LATENCY', 0, type=float))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # When running a full backup
+            with PeakRSS() as rss:
+                elapsed = self._run(fake, temp_dir)
+            self._report('full', mailbox, elapsed, rss.peak)
+            # Then every messages get archived
+            count = sum(1 for _unused in Path(temp_dir).glob('*/*.eml'))
+            self.assertEqual(mailbox.total_messages, count)
+
+            # When running an incremental backup
+            fake.commands = 0
+            elapsed = self._run(fake, temp_dir)
+            self._report('incremental', mailbox, elapsed)
+            # Then unchanged folders are not selected: LOGIN, CAPABILITY, LIST, one STATUS per folder and LOGOUT.
+            self.assertEqual(len(mailbox.folders) + 4, fake.commands)
+
+    def test_memory_bounded_with_large_message(self):
+        # Given a mailbox with a single large message
+        mailbox = SyntheticMailbox(folders=1, messages=1, min_size=16 * 1024 * 1024, max_size=16 * 1024 * 1024)
+        fake = FakeIMAP(mailbox)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # When running the backup
+            tracemalloc.start()
+            try:
+                elapsed = self._run(fake, temp_dir)
+                _unused, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self._report('large', mailbox, elapsed, peak, peak_label='peak traced memory')
+            # Then memory usage is bounded by the fetch chunk size, not by the message size.
+            self.assertLess(peak, 8 * imap_backup.FETCH_CHUNK_SIZE)
+            self.assertEqual(mailbox.total_bytes, sum(f.stat().st_size for f in Path(temp_dir).glob('*/*.eml')))
+
+
+if __name__ == '__main__':
+    unittest.main()
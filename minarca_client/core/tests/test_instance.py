@@ -7,12 +7,18 @@ Created on Jun. 7, 2021
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
 import asyncio
+import collections
 import datetime
+import ntpath
 import os
 import shutil
+import socket
 import stat
 import subprocess
 import tempfile
+import threading
+import time
+import types
 import unittest
 from datetime import timedelta
 from pathlib import Path
@@ -21,25 +27,43 @@ from unittest.case import skipIf, skipUnless
 from unittest.mock import MagicMock
 
 import responses
+from parameterized import parameterized
 
 from minarca_client.core import Backup, BackupInstance
 from minarca_client.core.compat import IS_WINDOWS, ssh_keygen
 from minarca_client.core.disk import LocationInfo
 from minarca_client.core.exceptions import (
     BackupError,
+    ConnectException,
     HttpAuthenticationError,
     HttpConnectionError,
     HttpInvalidUrlError,
     HttpServerError,
     InvalidRepositoryName,
+    LocalDestinationNotFound,
     NoPatternsError,
     NotConfiguredError,
     NotScheduleError,
+    PermissionDeniedError,
+    RdiffBackupExitError,
     RepositoryNameExistsError,
+    RestoreFail,
+    RestoreFileNotFound,
     UnknownHostException,
+    UnknownHostKeyError,
+)
+from minarca_client.core.instance import (
+    PROBE_FULL,
+    PROBE_TCP,
+    _Destination,
+    _is_known_host,
+    _selection_args,
+    _sh_quote,
+    reduce_path,
+    restore_groups,
 )
-from minarca_client.core.instance import _sh_quote
 from minarca_client.core.pattern import Pattern, Patterns
+from minarca_client.core.rdiffweb import clear_clients
 from minarca_client.core.settings import Datetime, Settings
 from minarca_client.tests.test import MATCH
 
@@ -95,6 +119,25 @@ def remove_readonly(func, path, excinfo):
         raise
 
 
+class TestReducePath(unittest.TestCase):
+    @parameterized.expand(
+        [
+            (['/a/b', '/a/b/c', '/a/bc'], ['/a/b', '/a/bc']),
+            (['/a/b/c', '/a/b'], ['/a/b/c', '/a/b']),
+            (['/a', '/a/', '/a/./b'], ['/a']),
+            (['/', '/a', 'b'], ['/', 'b']),
+            ([], []),
+        ]
+    )
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    def test_reduce_path(self, paths, expected):
+        self.assertEqual(expected, reduce_path(paths))
+
+    @skipUnless(IS_WINDOWS, 'test paths are windows')
+    def test_reduce_path_windows(self):
+        self.assertEqual(['C:/Users', 'D:/Users'], reduce_path(['C:/Users', 'c:\\users\\foo', 'D:/Users']))
+
+
 class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.cwd = os.getcwd()
@@ -111,6 +154,7 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         self.tmp.cleanup()
         del os.environ['MINARCA_CONFIG_HOME']
         del os.environ['MINARCA_DATA_HOME']
+        clear_clients()
 
     async def test_configure_remote_with_empty_repository_name(self):
         with self.assertRaises(InvalidRepositoryName):
@@ -559,8 +603,16 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
     @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_echo_foo_cmd))
     async def test_backup(self, mock_popen, *unused):
         start_time = Datetime()
+
         # Mock call to rdiff-backup
-        self.instance._rdiff_backup = mock.AsyncMock()
+        async def _rdiff_backup(*args, callback):
+            callback(b'--------------[ Session statistics ]--------------\n')
+            callback(b'ElapsedTime 1.02 (1.02 seconds)\n')
+            callback(b'SourceFileSize 10240 (10.0 KB)\n')
+            callback(b'TotalDestinationSizeChange 2048 (2.00 KB)\n')
+            callback(b'--------------------------------------------------\n')
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
         # Provide default config
         config = self.instance.settings
         config.remotehost = 'remotehost'
@@ -581,6 +633,7 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
                 '--exclude-symbolic-links',
                 '--create-full-path',
                 '--no-compression',
+                '--print-statistics',
                 '--include',
                 _home,
                 '--exclude',
@@ -596,6 +649,7 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
                 'backup',
                 '--exclude-sockets',
                 '--no-compression',
+                '--print-statistics',
                 '--include',
                 _home,
                 '--exclude',
@@ -611,6 +665,24 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(status.lastsuccess > start_time)
         self.assertEqual(status.lastdate, status.lastsuccess)
         self.assertEqual('', status.details)
+        # Check run history
+        history = self.instance.get_history()
+        self.assertEqual(1, len(history))
+        self.assertEqual('backup', history[0]['action'])
+        self.assertEqual('SUCCESS', history[0]['result'])
+        # Then session statistics are recorded in history
+        self.assertEqual(10240, history[0]['source_size'])
+        self.assertEqual(2048, history[0]['bytes'])
+        # When running a second backup
+        await self.instance.backup(force=True)
+        # Then logs of previous run is archived
+        self.assertEqual(1, len(list(self.instance.log_archive_dir.glob('backup1-*.log.gz'))))
+        self.assertEqual(2, len(self.instance.get_history(action='backup')))
+        # When forgetting the instance
+        self.instance.forget()
+        # Then history and archived logs are deleted
+        self.assertEqual([], self.instance.get_history())
+        self.assertEqual([], list(self.instance.log_archive_dir.glob('backup1-*.log.gz')))
 
     async def test_backup_not_scheduled(self):
         status = self.instance.status
@@ -665,6 +737,129 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
             creationflags=subprocess.CREATE_NO_WINDOW if IS_WINDOWS else 0,
         )
 
+    async def _start_ssh_server(self):
+        """Start a server sending an SSH banner. Return the server and the port."""
+
+        async def handle(reader, writer):
+            writer.write(b'SSH-2.0-OpenSSH_9.2\r\n')
+            await writer.drain()
+            writer.close()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        return server, server.sockets[0].getsockname()[1]
+
+    async def test_probe_connection_tcp(self):
+        # Given a remote server sending an SSH banner with a known host key
+        server, port = await self._start_ssh_server()
+        config = self.instance.settings
+        config.remotehost = f'127.0.0.1:{port}'
+        config.repositoryname = 'test-repo'
+        config.save()
+        with open(self.instance.known_hosts, 'w') as f:
+            f.write(
+                f'[127.0.0.1]:{port} ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIK/Qng4S5d75rtYxklVdIkPiz4paf2pdnCEshUoailQO\n'
+            )
+        # When probing the connection
+        # Then no error is raised
+        async with server:
+            await self.instance.probe_connection(level=PROBE_TCP)
+        # Then the result is kept in status file
+        self.instance.status.reload()
+        self.assertEqual(PROBE_TCP, self.instance.status.probe_level)
+        self.assertIsNone(self.instance.status.probe_error)
+
+    async def test_probe_connection_unknown_host_key(self):
+        # Given a remote server without known host key
+        server, port = await self._start_ssh_server()
+        config = self.instance.settings
+        config.remotehost = f'127.0.0.1:{port}'
+        config.repositoryname = 'test-repo'
+        config.save()
+        # When probing the connection
+        # Then an error is raised
+        async with server:
+            with self.assertRaises(UnknownHostKeyError):
+                await self.instance.probe_connection(level=PROBE_TCP)
+
+    async def test_probe_connection_refused(self):
+        # Given a remote server not listening
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        config = self.instance.settings
+        config.remotehost = f'127.0.0.1:{port}'
+        config.repositoryname = 'test-repo'
+        config.save()
+        # When probing the connection
+        # Then an error is raised
+        with self.assertRaises(ConnectException):
+            await self.instance.probe_connection()
+        # When probing again with another instance
+        # Then the error is returned from cache without connecting
+        with mock.patch('minarca_client.core.instance._read_ssh_banner') as mock_read:
+            with self.assertRaises(ConnectException):
+                await BackupInstance('1').probe_connection(level=PROBE_FULL)
+            mock_read.assert_not_called()
+
+    @skipIf(IS_WINDOWS, 'ssh multiplexing not available on Windows')
+    async def test_probe_connection_cached(self):
+        # Given a reachable remote server
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.save()
+        with mock.patch.object(self.instance, '_probe_tcp') as mock_tcp, mock.patch.object(
+            self.instance, '_probe_ssh'
+        ) as mock_ssh, mock.patch.object(self.instance, 'test_connection') as mock_test:
+            # When probing the connection twice
+            await self.instance.probe_connection()
+            await self.instance.probe_connection(level=PROBE_TCP)
+            # Then the checks are executed once
+            mock_tcp.assert_called_once()
+            mock_ssh.assert_called_once()
+            mock_test.assert_not_called()
+            # When requesting a full test
+            await self.instance.probe_connection(level=PROBE_FULL)
+            # Then rdiff-backup test is executed
+            mock_test.assert_called_once()
+
+    @skipIf(IS_WINDOWS, 'ssh multiplexing not available on Windows')
+    async def test_probe_connection_permission_denied(self):
+        # Given a remote server refusing our identity
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.save()
+
+        async def start_ssh_master():
+            self.instance._ssh_master = MagicMock(**{'is_alive.return_value': False, 'error': PermissionDeniedError()})
+
+        with mock.patch.object(self.instance, '_probe_tcp'), mock.patch.object(
+            self.instance, '_start_ssh_master', side_effect=start_ssh_master
+        ):
+            # When probing the connection
+            # Then the error reported by SSH is raised
+            with self.assertRaises(PermissionDeniedError):
+                await self.instance.probe_connection()
+        # Then the failure is kept for the authenticated level
+        self.instance.status.reload()
+        self.assertEqual('ssh', self.instance.status.probe_level)
+        self.assertEqual('PermissionDeniedError', self.instance.status.probe_error)
+
+    def test_is_known_host(self):
+        # Given a known hosts file with plain and hashed entries
+        with open(self.instance.known_hosts, 'w') as f:
+            f.write('[test.minarca.net]:2222 ssh-ed25519 AAAA\n')
+            # Hashed entry for "example.com"
+            f.write('|1|JfKTdBh7rNbXkVAQCRp4OQoPfmI=|hYzATvnouIsB35aHlS/lqWTcF2A= ssh-ed25519 AAAA\n')
+        # When checking if host is known
+        # Then entries are found
+        self.assertTrue(_is_known_host(self.instance.known_hosts, 'test.minarca.net', 2222))
+        self.assertTrue(_is_known_host(self.instance.known_hosts, 'example.com', 22))
+        self.assertFalse(_is_known_host(self.instance.known_hosts, 'test.minarca.net', 22))
+        self.assertFalse(_is_known_host(self.instance.known_hosts, 'other.com', 22))
+
     def test_forget(self):
         # Mock a configuration
         config = Settings(self.instance.config_file)
@@ -697,6 +892,50 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
             ),
         )
 
+    @mock.patch('minarca_client.core.compat.get_ssh', return_value=_ssh)
+    @mock.patch('minarca_client.core.compat.get_user_agent', return_value='minarca/DEV rdiff-backup/2.0.0 (os info)')
+    def test_remote_schema_with_control_path(self, *unused):
+        # Given a backup instance configured with a remote
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.save()
+        # When generating the remote schema with a multiplexed connection
+        value = self.instance._remote_schema(control_path='/tmp/minarca-ssh-abc/control')
+        # Then the connection is reused
+        self.assertEqual(
+            value,
+            MATCH(
+                _ssh
+                + "* -oControlMaster=no -oControlPath=/tmp/minarca-ssh-abc/control %s 'minarca/DEV rdiff-backup/2.0.0 (os info)'"
+            ),
+        )
+
+    @skipIf(IS_WINDOWS, 'ssh multiplexing not supported on Windows')
+    @mock.patch('minarca_client.core.instance._SSHMaster.start', new_callable=mock.AsyncMock, return_value=True)
+    async def test_start_ssh_master(self, mock_start):
+        # Given a remote backup instance
+        config = self.instance.settings
+        config.remotehost = 'remotehost:2222'
+        config.repositoryname = 'test-repo'
+        config.save()
+        # When starting the multiplexed connection twice
+        await self.instance._start_ssh_master()
+        master = self.instance._ssh_master
+        with mock.patch.object(master, 'is_alive', return_value=True):
+            await self.instance._start_ssh_master()
+            # Then the same connection get reused
+            self.assertIs(master, self.instance._ssh_master)
+            mock_start.assert_called_once()
+            self.assertEqual('minarca@remotehost', master.target)
+            # Then rdiff-backup use the control socket
+            self.assertIn('-oControlPath=%s' % master.control_path, self.instance._destination().remote_schema)
+        # When forgetting the instance
+        self.instance._stop_ssh_master()
+        # Then the temporary directory is removed
+        self.assertIsNone(self.instance._ssh_master)
+        self.assertFalse(os.path.exists(os.path.dirname(master.control_path)))
+
     @mock.patch('minarca_client.core.disk.get_location_info')
     @mock.patch('minarca_client.core.disk.list_disks')
     async def test_get_disk_usage_with_local(self, mock_list_disk, mock_disk_info):
@@ -808,6 +1047,249 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         self.assertEqual('', status.details)
         self.assertEqual('restore', status.action)
 
+    async def test_restore_resolve_destination_once(self):
+        # Given a remote instance
+        self.instance._rdiff_backup = mock.AsyncMock()
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        # When restoring multiple paths
+        paths = (
+            ['C:/path/to/a', 'C:/path/to/b', 'C:/other/c'] if IS_WINDOWS else ['/path/to/a', '/path/to/b', '/other/c']
+        )
+        await self.instance.restore(paths=paths)
+        # Then rdiff-backup is called once per parent directory
+        self.assertEqual(2, self.instance._rdiff_backup.call_count)
+        # Then the remote schema is only built once.
+        self.instance._remote_schema.assert_called_once()
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_multiple_paths_in_place(self):
+        # Given a remote instance
+        self.instance._rdiff_backup = mock.AsyncMock()
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        # When restoring multiple files in place
+        await self.instance.restore(paths=['/home/user/a', '/home/user/b/[1].txt', '/home/user/b/c'])
+        # Then files with the same parent are restored by a single rdiff-backup session with selection patterns
+        self.instance._rdiff_backup.assert_has_calls(
+            [
+                mock.call(
+                    '--force',
+                    '--remote-schema',
+                    'ssh %s',
+                    'restore',
+                    '--at',
+                    'now',
+                    'minarca@remotehost::test-repo/home/user/a',
+                    '/home/user/a',
+                    callback=mock.ANY,
+                ),
+                mock.call(
+                    '--force',
+                    '--remote-schema',
+                    'ssh %s',
+                    'restore',
+                    '--at',
+                    'now',
+                    '--include',
+                    '/home/user/b/[[]1].txt',
+                    '--include',
+                    '/home/user/b/c',
+                    '--exclude',
+                    '/home/user/b/**',
+                    'minarca@remotehost::test-repo/home/user/b',
+                    '/home/user/b',
+                    callback=mock.ANY,
+                ),
+            ],
+            any_order=True,
+        )
+        self.assertEqual(2, self.instance._rdiff_backup.call_count)
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_with_jobs(self):
+        # Given a remote instance
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        running = []
+        peak = []
+
+        async def _rdiff_backup(*args, **kwargs):
+            running.append(args)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(args)
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        # When restoring independent folders with 4 jobs
+        paths = ['/a/1', '/b/2', '/c/3', '/d/4']
+        await self.instance.restore(paths=paths, destination=self.tmp.name, jobs=4)
+        # Then every folder get restored
+        self.assertEqual(4, self.instance._rdiff_backup.call_count)
+        # Then every jobs are used to restore into the same disk.
+        self.assertEqual(4, max(peak))
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_with_jobs_multiple_disks(self):
+        # Given a remote instance
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        running = []
+        peak = collections.defaultdict(int)
+
+        async def _rdiff_backup(*args, **kwargs):
+            disk = args[-1].split('/')[1]
+            running.append(disk)
+            peak[disk] = max(peak[disk], running.count(disk))
+            await asyncio.sleep(0.05)
+            running.remove(disk)
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        # When restoring in place to two disks with 4 jobs
+        paths = ['/a/1', '/a/2/3', '/a/4/5', '/b/6', '/b/7/8', '/b/9/10']
+        with mock.patch('minarca_client.core.instance._device_id', side_effect=lambda path: path.split('/')[1]):
+            await self.instance.restore(paths=paths, jobs=4)
+        # Then every folder get restored
+        self.assertEqual(6, self.instance._rdiff_backup.call_count)
+        # Then jobs are shared between disks.
+        self.assertEqual({'a': 2, 'b': 2}, peak)
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_with_jobs_in_place(self):
+        # Given a remote instance
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+
+        async def _rdiff_backup(*args, callback):
+            callback(b'processing %s\n' % args[-1].encode())
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        # When restoring every folder of the same parent in place with 2 jobs
+        await self.instance.restore(paths=['/home/a', '/home/b', '/home/c', '/home/d'], jobs=2)
+        # Then folders are restored by 2 concurrent sessions
+        self.assertEqual(2, self.instance._rdiff_backup.call_count)
+        # Then output of each session is prefixed in the log
+        data = Path(self.instance.restore_log_file).read_bytes()
+        self.assertIn(b'[1/2] processing /home\n', data)
+        self.assertIn(b'[2/2] processing /home\n', data)
+        self.assertIn(b'[2/2] restore completed\n', data)
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_with_jobs_errors(self):
+        # Given a remote instance
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        # Given two groups failing to be restored
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=[RestoreFileNotFound(), None, RdiffBackupExitError(1)])
+        # When restoring
+        with self.assertRaises(RestoreFail) as context:
+            await self.instance.restore(paths=['/a/1', '/b/2', '/c/3'], destination=self.tmp.name, jobs=2)
+        # Then every groups get restored and errors are aggregated.
+        self.assertEqual(3, self.instance._rdiff_backup.call_count)
+        self.assertEqual(2, len(context.exception.errors))
+        self.assertIn('2 of 3', str(context.exception))
+        # Then status is updated
+        status = self.instance.status
+        status.reload()
+        self.assertEqual('FAILURE', status.lastresult)
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    def test_restore_groups(self):
+        # When restoring into a destination
+        groups = list(restore_groups(['/a/b/c', '/a/b/d', '/a/e', '/a/b/c/f'], destination='/tmp'))
+        # Then paths are grouped by parent directory
+        self.assertEqual([('/a/b', '/tmp', ['/a/b/c', '/a/b/d']), ('/a/e', '/tmp/e', None)], groups)
+        # When restoring in place
+        groups = list(restore_groups(['/a/b/c', '/a/b/d', '/a/e', '/a/b/c/f']))
+        # Then paths are grouped by parent directory
+        self.assertEqual([('/a/b', '/a/b', ['/a/b/c', '/a/b/d']), ('/a/e', '/a/e', None)], groups)
+        # When restoring in place with multiple jobs
+        groups = list(restore_groups(['/a/b', '/a/c', '/a/d'], jobs=2))
+        # Then paths of the same parent are split between jobs
+        self.assertEqual([('/a', '/a', ['/a/b', '/a/c']), ('/a/d', '/a/d', None)], groups)
+        # When restoring a single path
+        groups = list(restore_groups(['/a/b/c']))
+        # Then no selection is required
+        self.assertEqual([('/a/b/c', '/a/b/c', None)], groups)
+
+    def test_restore_groups_windows(self):
+        # Given Windows paths
+        with mock.patch('minarca_client.core.instance.IS_WINDOWS', True), mock.patch(
+            'minarca_client.core.instance.os', types.SimpleNamespace(path=ntpath)
+        ):
+            # When restoring in place
+            groups = list(restore_groups(['C:\\Users\\a\\b', 'C:\\Users\\a\\c']))
+            # Then selection use `/` as separator
+            self.assertEqual([('C:/Users/a', 'C:\\Users\\a', ['C:/Users/a/b', 'C:/Users/a/c'])], groups)
+            # Then the exclude pattern use the same separator as includes
+            source, target, includes = groups[0]
+            self.assertEqual(
+                ['--include', 'C:/Users/a/b', '--include', 'C:/Users/a/c', '--exclude', 'C:/Users/a/**'],
+                _selection_args(target, includes),
+            )
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_restore_to_destination_in_batch(self):
+        # Given a remote instance
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        # Given a destination with an existing file
+        destination = Path(self.tmp.name) / 'restore'
+        destination.mkdir()
+        (destination / 'b.txt').write_text('old')
+        (destination / 'other.txt').write_text('other')
+
+        async def _rdiff_backup(*args, callback):
+            # Restore the selected files into the target
+            target = Path(args[-1])
+            (target / 'a.txt').write_text('a')
+            (target / 'b.txt').write_text('b')
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        # When restoring multiple files of the same folder into the destination
+        await self.instance.restore(paths=['/home/a.txt', '/home/b.txt'], destination=str(destination))
+        # Then files are restored with a single session into a staging folder
+        self.assertEqual(1, self.instance._rdiff_backup.call_count)
+        args = self.instance._rdiff_backup.call_args.args
+        staging = args[-1]
+        self.assertEqual(str(destination), os.path.dirname(staging))
+        self.assertEqual(
+            ('--include', staging + '/a.txt', '--include', staging + '/b.txt', '--exclude', staging + '/**'),
+            args[-8:-2],
+        )
+        self.assertEqual('minarca@remotehost::test-repo/home', args[-2])
+        # Then files are moved into destination
+        self.assertEqual(['a.txt', 'b.txt', 'other.txt'], sorted(os.listdir(destination)))
+        self.assertEqual('b', (destination / 'b.txt').read_text())
+
     @responses.activate
     async def test_save_remote_settings(self):
         # Given a server with a remote backup
@@ -842,6 +1324,45 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         # Then the settings are push to the remote server.
         responses.assert_call_count("http://localhost/api/currentuser/repos/test-repo", 1)
 
+    @responses.activate
+    @mock.patch('minarca_client.core.rdiffweb.REPO_POLL_DELAY', 0.01)
+    async def test_save_remote_settings_wait(self):
+        # Given a server creating the repository after a few checks
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/test-repo", status=404)
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/test-repo", status=404)
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/test-repo", json={'maxage': 1})
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/other", json={'maxage': 1})
+        responses.add(
+            responses.GET,
+            "http://localhost/api/currentuser/",
+            json={'username': 'admin', 'repos': [{'name': 'other'}]},
+        )
+        responses.add(
+            responses.GET,
+            "http://localhost/api/currentuser/",
+            json={'username': 'admin', 'repos': [{'name': 'other'}, {'name': 'test-repo'}]},
+        )
+        responses.add(responses.POST, "http://localhost/api/currentuser/repos/test-repo")
+        # Given a remote backup instance
+        ssh_keygen(self.instance.public_key_file, self.instance.private_key_file)
+        config = self.instance.settings
+        config.remoteurl = 'http://localhost/'
+        config.username = 'admin'
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.save()
+        # When saving settings remotely while the repository get created
+        with mock.patch.object(self.instance, '_remote_repo_name', return_value='test-repo'):
+            await self.instance.save_remote_settings(wait=True)
+        # Then the repository endpoint is checked until found
+        urls = [(c.request.method, c.request.url) for c in responses.calls if 'currentuser' in c.request.url]
+        self.assertEqual(3, urls.count(('GET', 'http://localhost/api/currentuser/repos/test-repo')))
+        # Then full user information is only fetched to detect the repository endpoint and to push the settings
+        self.assertEqual(2, urls.count(('GET', 'http://localhost/api/currentuser/')))
+        # Then the settings are pushed
+        self.assertEqual(1, urls.count(('POST', 'http://localhost/api/currentuser/repos/test-repo')))
+
     @responses.activate
     async def test_load_remote_settings(self):
         # Given a server with a remote backup
@@ -921,6 +1442,86 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
             creationflags=subprocess.CREATE_NO_WINDOW if IS_WINDOWS else 0,
         )
 
+    @mock.patch('minarca_client.core.compat.get_user_agent', return_value='minarca/DEV rdiff-backup/2.0.0 (os info)')
+    @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_echo_list_increments))
+    async def test_list_increments_cached(self, mock_popen, *unused):
+        # Given a backup settings
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        self.instance.patterns.extend(Patterns.defaults())
+        self.instance.patterns.save()
+        # Given increments listed once
+        expected = await self.instance.list_increments()
+        self.assertEqual(1, mock_popen.call_count)
+        # When querying the list of increments again
+        data = await self.instance.list_increments()
+        # Then increments are read from status without calling rdiff-backup
+        self.assertEqual(expected, data)
+        self.assertEqual(1, mock_popen.call_count)
+        # When a new backup is completed
+        self.instance._rdiff_backup = mock.AsyncMock()
+        self.instance.patterns.clear()
+        self.instance.patterns.append(Pattern(True, self.tmp.name, None))
+        self.instance.patterns.save()
+        await self.instance.backup(force=True)
+        self.assertIsNone(self.instance.status.increments)
+        del self.instance._rdiff_backup
+        # Then increments are listed again
+        await self.instance.list_increments()
+        self.assertEqual(2, mock_popen.call_count)
+
+    @parameterized.expand([('[1712947549, 17129',), ('',), ('[1712947549, abc]',)])
+    def test_status_with_invalid_increments(self, value):
+        # Given a status file with invalid list of increments
+        with open(self.instance.status_file, 'w') as f:
+            f.write('lastresult=SUCCESS\nincrements=%s\n' % value)
+        # When loading the status
+        status = self.instance.status
+        status.reload()
+        # Then the cache is ignored
+        self.assertIsNone(status.increments)
+        self.assertEqual('SUCCESS', status.lastresult)
+
+    async def test_list_increments_with_multiple_roots(self):
+        # Given a backup with multiple roots
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        self.instance._remote_schema = mock.MagicMock(return_value='ssh %s')
+        running = []
+        peak = []
+
+        async def _rdiff_backup(*args, callback):
+            running.append(args)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            for epoch in [1712947555, 1712947549] if 'C' in args[-1][-3:] else [1712947549, 1712948833]:
+                callback(b'  time: %d\n' % epoch)
+            running.remove(args)
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        roots = [('C:/', []), ('D:/', [])]
+        with mock.patch.object(Patterns, 'group_by_roots', return_value=roots):
+            # When querying the list of increments
+            data = await self.instance.list_increments()
+        # Then each root is listed concurrently
+        self.assertEqual(2, self.instance._rdiff_backup.call_count)
+        self.assertEqual(2, max(peak))
+        # Then increments are merged
+        self.assertEqual(
+            [
+                datetime.datetime.fromtimestamp(1712947549, tz=datetime.timezone.utc),
+                datetime.datetime.fromtimestamp(1712947555, tz=datetime.timezone.utc),
+                datetime.datetime.fromtimestamp(1712948833, tz=datetime.timezone.utc),
+            ],
+            data,
+        )
+
     @mock.patch('minarca_client.core.compat.get_user_agent', return_value='minarca/DEV rdiff-backup/2.0.0 (os info)')
     @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_echo_list_files))
     async def test_list_files(self, mock_popen, *unused):
@@ -1018,6 +1619,80 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
             creationflags=subprocess.CREATE_NO_WINDOW if IS_WINDOWS else 0,
         )
 
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    @mock.patch('minarca_client.core.compat.get_user_agent', return_value='minarca/DEV rdiff-backup/2.0.0 (os info)')
+    @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_echo_list_files))
+    async def test_list_dir(self, mock_popen, *unused):
+        # Given a backup settings
+        config = self.instance.settings
+        config.remotehost = 'remotehost'
+        config.repositoryname = 'test-repo'
+        config.configured = True
+        config.save()
+        self.instance.patterns.append(Pattern(True, '/home', None))
+        self.instance.patterns.append(Pattern(False, '*.tmp', None))
+        self.instance.patterns.save()
+        increment = datetime.datetime.fromtimestamp(1713195267, tz=datetime.timezone.utc)
+        # When listing top level folders
+        data = await self.instance.list_dir(increment)
+        # Then included folders are returned without calling rdiff-backup
+        self.assertEqual([('/home', True)], data)
+        mock_popen.assert_not_called()
+        # When listing a folder
+        data = await self.instance.list_dir(increment, '/work')
+        # Then the folder content is returned
+        self.assertEqual([('/work/home', True)], data)
+        # Then only the subtree is listed by rdiff-backup
+        mock_popen.assert_called_once_with(
+            mock.ANY,
+            'rdiff-backup',
+            '-v',
+            '5',
+            '--remote-schema',
+            mock.ANY,
+            '--api-version',
+            '201',
+            '--parsable-output',
+            'list',
+            'files',
+            '--at',
+            '1713195267',
+            'minarca@remotehost::test-repo/work',
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=mock.ANY,
+            creationflags=0,
+        )
+        # When listing a sub folder
+        data = await self.instance.list_dir(increment, '/work/home')
+        # Then the content is served from cache
+        self.assertEqual([('/work/home/vmtest', True)], data)
+        mock_popen.assert_called_once()
+        # When listing a deeper folder
+        await self.instance.list_dir(increment, '/work/home/vmtest/Documents/Work/PDF')
+        # Then the folder is listed by rdiff-backup
+        self.assertEqual(2, mock_popen.call_count)
+
+    @skipIf(IS_WINDOWS, 'test paths are posix')
+    async def test_list_dir_with_empty_folder(self):
+        # Given a local backup with an empty folder
+        disk = Path(self.tmp.name) / 'disk'
+        (disk / 'data' / 'empty').mkdir(parents=True)
+        (disk / 'data' / 'file.txt').write_text('data')
+        self.instance._destination = mock.MagicMock(return_value=_Destination(disk=disk))
+
+        async def _rdiff_backup(*args, callback):
+            for line in [b'.\n', b'empty\n', b'file.txt\n', b'*        Cleaning up\n']:
+                callback(line)
+
+        self.instance._rdiff_backup = mock.AsyncMock(side_effect=_rdiff_backup)
+        increment = datetime.datetime.fromtimestamp(1713195267, tz=datetime.timezone.utc)
+        # When listing the folder
+        data = await self.instance.list_dir(increment, '/data')
+        # Then the empty folder is detected from the local mirror
+        self.assertEqual([('/data/empty', True), ('/data/file.txt', False)], data)
+
     @mock.patch('minarca_client.core.status.send_notification', return_value='12345')
     @mock.patch('minarca_client.core.compat.get_user_agent', return_value='minarca/DEV rdiff-backup/2.0.0 (os info)')
     @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_exit_1_cmd))
@@ -1089,6 +1764,7 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
                 '--exclude-symbolic-links',
                 '--create-full-path',
                 '--no-compression',
+                '--print-statistics',
                 '--exclude',
                 tempdir.replace('\\', '/'),  # Exclude local destination
                 '--include',
@@ -1112,6 +1788,7 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
                 'backup',
                 '--exclude-sockets',
                 '--no-compression',
+                '--print-statistics',
                 '--exclude',
                 tempdir,  # Exclude local destination
                 '--include',
@@ -1175,6 +1852,35 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         finally:
             shutil.rmtree(tempdir, onerror=remove_readonly)
 
+    async def test_local_restore_real_in_place(self):
+        # Given a backup of a folder with 3 files
+        tempdir = tempfile.mkdtemp(prefix='minarca-client-test')
+        try:
+            self.instance = await self.backup.configure_local(tempdir, repositoryname='test-repo')
+            source = Path(os.path.realpath(self.tmp.name)) / 'data'
+            source.mkdir()
+            for name in ['a.txt', 'b.txt', 'c.txt']:
+                (source / name).write_text('original')
+            patterns = self.instance.patterns
+            patterns.clear()
+            patterns.append(Pattern(True, str(source), None))
+            patterns.save()
+            await self.instance.backup(force=True)
+            # Given the folder modified after the backup
+            for name in ['a.txt', 'b.txt', 'c.txt']:
+                (source / name).write_text('modified')
+            (source / 'new.txt').write_text('new')
+            # When restoring 2 of the 3 files in place
+            await self.instance.restore(paths=[str(source / 'a.txt'), str(source / 'b.txt')])
+            # Then selected files are restored
+            self.assertEqual('original', (source / 'a.txt').read_text())
+            self.assertEqual('original', (source / 'b.txt').read_text())
+            # Then other content of the folder is untouched
+            self.assertEqual('modified', (source / 'c.txt').read_text())
+            self.assertEqual('new', (source / 'new.txt').read_text())
+        finally:
+            shutil.rmtree(tempdir, onerror=remove_readonly)
+
     @mock.patch('asyncio.create_subprocess_exec', side_effect=mock_subprocess_popen(_echo_foo_cmd))
     async def test_local_backup_with_keepdays(self, mock_popen):
         # Given a backup with local destination
@@ -1247,6 +1953,94 @@ class TestBackupInstance(unittest.IsolatedAsyncioTestCase):
         finally:
             shutil.rmtree(tempdir, onerror=remove_readonly)
 
+    @mock.patch('minarca_client.core.disk.list_disks')
+    def test_find_local_destination(self, mock_list_disks):
+        # Given a local destination on a disk
+        mountpoint = Path(self.tmp.name) / 'disk'
+        (mountpoint / 'minarca' / 'test-repo').mkdir(parents=True)
+        (mountpoint / 'minarca' / '.minarca-id').write_text('e347e062-0912-48f9-a211-12dbe97b1f13')
+        mock_list_disks.return_value = [Path(self.tmp.name) / 'other', mountpoint]
+        # Given a local instance without known mount point
+        self.instance.settings.localuuid = 'e347e062-0912-48f9-a211-12dbe97b1f13'
+        self.instance.settings.localrelpath = 'minarca/test-repo'
+        self.instance.settings.save()
+        # When searching the local destination
+        dest = self.instance.find_local_destination()
+        # Then the destination is found by scanning local disks
+        self.assertEqual(mountpoint / 'minarca' / 'test-repo', dest)
+        mock_list_disks.assert_called_once_with(local_only=True)
+        # When searching again
+        self.assertEqual(dest, self.instance.find_local_destination())
+        # Then the result is reused
+        mock_list_disks.assert_called_once()
+        # When searching from another instance with the same destination
+        other = BackupInstance('2')
+        other.settings.localuuid = 'e347e062-0912-48f9-a211-12dbe97b1f13'
+        other.settings.localrelpath = 'minarca/test-repo'
+        # Then disks are not scanned again
+        self.assertEqual(dest, other.find_local_destination())
+        mock_list_disks.assert_called_once()
+
+    @mock.patch('minarca_client.core.instance.LOCAL_DESTINATION_TIMEOUT', 0.1)
+    @mock.patch.dict('minarca_client.core.instance._local_mountpoints', clear=True)
+    @mock.patch('minarca_client.core.disk.list_disks')
+    def test_find_local_destination_with_hung_disk(self, mock_list_disks):
+        # Given a disk not answering
+        hung = threading.Event()
+        mock_list_disks.return_value = [Path(self.tmp.name) / 'hung']
+        self.instance.settings.localuuid = 'e347e062-0912-48f9-a211-12dbe97b1f13'
+        self.instance.settings.localrelpath = 'minarca/test-repo'
+        try:
+            with mock.patch('minarca_client.core.compat.file_read', side_effect=lambda fn: hung.wait()):
+                # When searching the local destination
+                # Then the search give up after the timeout
+                with self.assertRaises(LocalDestinationNotFound):
+                    self.instance.find_local_destination()
+        finally:
+            hung.set()
+
+    @mock.patch('minarca_client.core.instance.LOCAL_DESTINATION_TIMEOUT', 0.1)
+    @mock.patch.dict('minarca_client.core.instance._local_mountpoints', clear=True)
+    @mock.patch('minarca_client.core.disk.list_disks', return_value=[])
+    def test_find_local_destination_with_slow_known_disk(self, mock_list_disks):
+        # Given a local destination on a known disk slow to answer
+        mountpoint = Path(self.tmp.name) / 'disk'
+        (mountpoint / 'minarca' / 'test-repo').mkdir(parents=True)
+        (mountpoint / 'minarca' / '.minarca-id').write_text('e347e062-0912-48f9-a211-12dbe97b1f13')
+        self.instance.settings.localuuid = 'e347e062-0912-48f9-a211-12dbe97b1f13'
+        self.instance.settings.localrelpath = 'minarca/test-repo'
+        self.instance.settings.localmountpoint = str(mountpoint)
+
+        def _file_read(fn):
+            time.sleep(0.5)
+            return Path(fn).read_text()
+
+        with mock.patch('minarca_client.core.compat.file_read', side_effect=_file_read):
+            # When searching the local destination
+            # Then the known disk is waited for longer than other disks
+            self.assertEqual(mountpoint / 'minarca' / 'test-repo', self.instance.find_local_destination())
+
+    @mock.patch('minarca_client.core.instance.LOCAL_DESTINATION_TIMEOUT', 0.1)
+    @mock.patch.dict('minarca_client.core.instance._local_mountpoints', clear=True)
+    @mock.patch('minarca_client.core.disk.list_disks')
+    def test_find_local_destination_reuse_probe(self, mock_list_disks):
+        # Given a disk not answering
+        hung = threading.Event()
+        mock_list_disks.return_value = [Path(self.tmp.name) / 'hung']
+        self.instance.settings.localuuid = 'e347e062-0912-48f9-a211-12dbe97b1f13'
+        self.instance.settings.localrelpath = 'minarca/test-repo'
+        try:
+            with mock.patch('minarca_client.core.compat.file_read', side_effect=lambda fn: hung.wait()) as mock_read:
+                # When searching the local destination multiple times
+                for unused in range(3):
+                    self.instance._local_destination = None
+                    with self.assertRaises(LocalDestinationNotFound):
+                        self.instance.find_local_destination()
+                # Then the hung disk is only read by a single thread
+                mock_read.assert_called_once()
+        finally:
+            hung.set()
+
     def test_sh_quote(self):
         self.assertEqual(_sh_quote(['a', 'b', 'c']), "a b c")
         self.assertEqual(_sh_quote(['path with space', 'b', 'c']), '"path with space" b c')
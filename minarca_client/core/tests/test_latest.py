@@ -7,15 +7,27 @@ Created on Oct. 22, 2021
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
 
+import datetime
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock
 
 import responses
 
+from minarca_client.core.config import Datetime
 from minarca_client.core.latest import LATEST_VERSION_URL, LatestCheck, LatestCheckFailed
 
 
 class LatestCheckTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.environ['MINARCA_DATA_HOME'] = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        del os.environ['MINARCA_DATA_HOME']
+
     @responses.activate
     def test_get_version_info(self):
         # Given a web server with the latest information
@@ -78,3 +90,75 @@ class LatestCheckTest(unittest.TestCase):
         # When checking if latest version
         # Then it's the NOT latest version.
         self.assertTrue(latest.is_latest())
+
+    @responses.activate
+    def test_get_latest_version_persisted(self):
+        # Given the latest version queried once
+        responses.add(responses.GET, LATEST_VERSION_URL, body='1.2.3', headers={'ETag': '"abc"'})
+        self.assertEqual('1.2.3', LatestCheck().get_latest_version())
+        # When querying the latest version from another process
+        latest = LatestCheck()
+        # Then the version is read from disk without query
+        self.assertFalse(latest.is_stale())
+        self.assertEqual('1.2.3', latest.get_latest_version())
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_get_latest_version_revalidate(self):
+        # Given a latest version queried more than a day ago
+        responses.add(
+            responses.GET,
+            LATEST_VERSION_URL,
+            body='1.2.3',
+            headers={'ETag': '"abc"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'},
+        )
+        latest = LatestCheck()
+        latest.get_latest_version()
+        with latest.status as t:
+            t.lastcheck = Datetime() - datetime.timedelta(days=2)
+        self.assertTrue(latest.is_stale())
+        # When querying the latest version
+        responses.replace(responses.GET, LATEST_VERSION_URL, status=304)
+        # Then a conditional request is sent
+        self.assertEqual('1.2.3', latest.get_latest_version())
+        self.assertEqual('"abc"', responses.calls[1].request.headers['If-None-Match'])
+        self.assertEqual('Mon, 01 Jan 2024 00:00:00 GMT', responses.calls[1].request.headers['If-Modified-Since'])
+        # Then the version is revalidated
+        self.assertFalse(latest.is_stale())
+
+    @responses.activate
+    def test_get_latest_version_failed_with_stale_version(self):
+        # Given a stale latest version
+        responses.add(responses.GET, LATEST_VERSION_URL, body='1.2.3')
+        latest = LatestCheck()
+        latest.get_latest_version()
+        with latest.status as t:
+            t.lastcheck = Datetime() - datetime.timedelta(days=2)
+        # When the web server is not reachable
+        responses.replace(responses.GET, LATEST_VERSION_URL, status=500)
+        # Then previous version is returned
+        self.assertEqual('1.2.3', latest.get_latest_version())
+
+    @responses.activate
+    def test_is_latest_cached(self):
+        # Given no latest version known
+        latest = LatestCheck()
+        latest.get_current_version = MagicMock(return_value='1.2.3')
+        # When checking from cache
+        # Then no query is sent
+        with self.assertRaises(LatestCheckFailed):
+            latest.is_latest(cached=True)
+        self.assertEqual(0, len(responses.calls))
+
+    @responses.activate
+    def test_start_refresh(self):
+        # Given a web server with the latest information
+        responses.add(responses.GET, LATEST_VERSION_URL, body='1.2.3')
+        latest = LatestCheck()
+        # When revalidating in background
+        thread = latest.start_refresh()
+        thread.join()
+        # Then latest version is known
+        self.assertEqual('1.2.3', latest.get_latest_version(cached=True))
+        # Then no revalidation is needed
+        self.assertIsNone(latest.start_refresh())
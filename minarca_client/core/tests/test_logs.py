@@ -0,0 +1,334 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+import asyncio
+import gzip
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from minarca_client.core.logs import (
+    LEVEL_ERROR,
+    LEVEL_WARNING,
+    LogFollower,
+    LogIndex,
+    RunLog,
+    SessionStatistics,
+    append_history,
+    get_log_index,
+    list_archives,
+    read_history,
+)
+
+
+class LogFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'backup.log')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, data, mode='ab'):
+        with open(self.filename, mode) as f:
+            f.write(data)
+
+    def test_read_appended_lines(self):
+        # Given a log file
+        self._write(b'line1\nline2\npart')
+        follower = LogFollower(self.filename)
+        # When reading the file
+        # Then complete lines are returned
+        self.assertEqual((True, ['line1', 'line2']), follower.read())
+        # When more data is appended
+        self._write(b'ial\r\nline4\n')
+        # Then only new lines are returned
+        self.assertEqual((False, ['partial', 'line4']), follower.read())
+        self.assertEqual((False, []), follower.read())
+        self.assertEqual(['line1', 'line2', 'partial', 'line4'], list(follower.lines))
+
+    def test_read_bounded(self):
+        # Given a follower keeping few lines
+        follower = LogFollower(self.filename, max_lines=3)
+        # When many lines are written
+        self._write(b''.join(b'line%d\n' % i for i in range(10)))
+        reset, lines = follower.read()
+        # Then only the last lines are kept
+        self.assertEqual(['line7', 'line8', 'line9'], lines)
+        self.assertEqual(['line7', 'line8', 'line9'], list(follower.lines))
+
+    def test_read_tail(self):
+        # Given a large log file
+        self._write(b''.join(b'line%d\n' % i for i in range(1000)))
+        # When following the file
+        follower = LogFollower(self.filename, tail_size=30)
+        reset, lines = follower.read()
+        # Then only the end of the file is read starting with a complete line
+        self.assertTrue(follower.truncated)
+        self.assertEqual(['line997', 'line998', 'line999'], lines)
+
+    def test_read_truncated_file(self):
+        # Given a follower
+        self._write(b'old1\nold2\n')
+        follower = LogFollower(self.filename)
+        follower.read()
+        # When the file get replaced by a new run
+        self._write(b'new\n', mode='wb')
+        # Then previous lines are discarded
+        self.assertEqual((True, ['new']), follower.read())
+        self.assertEqual(['new'], list(follower.lines))
+
+    def test_read_missing_file(self):
+        # Given a missing file
+        follower = LogFollower(self.filename)
+        # When reading the file
+        # Then nothing is returned
+        self.assertEqual((False, []), follower.read())
+        # When the file get created
+        self._write(b'line1\n')
+        # Then the lines are returned
+        self.assertEqual((True, ['line1']), follower.read())
+
+
+class LogIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'backup.log')
+        with open(self.filename, 'wb') as f:
+            f.write(b'starting backup\n')
+            f.write(b'WARNING: file changed during backup\n')
+            f.write(b'Processing /home/user/Documents\n')
+            f.write(b'ssh: connect to host test.minarca.net port 8976: Connection refused\n')
+            f.write(b'partial')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_update(self):
+        # Given a log file
+        index = LogIndex(self.filename)
+        # When indexing the file
+        self.assertTrue(index.update())
+        # Then complete lines are indexed
+        self.assertEqual(4, len(index))
+        self.assertEqual(['starting backup', 'Processing /home/user/Documents'], index.lines([0, 2]))
+        # Then errors are detected using known exceptions
+        self.assertEqual([3], index.errors())
+        self.assertEqual([1, 3], index.filter(LEVEL_WARNING))
+        # When more data get written
+        with open(self.filename, 'ab') as f:
+            f.write(b' line\nERROR: something wrong\n')
+        # Then only new lines are indexed
+        self.assertFalse(index.update())
+        self.assertEqual(6, len(index))
+        self.assertEqual(['partial line', 'ERROR: something wrong'], index.lines([4, 5]))
+        self.assertEqual([3, 5], index.errors())
+
+    def test_filter_during_update(self):
+        # Given an indexed log file
+        index = LogIndex(self.filename)
+        index.update()
+        with open(self.filename, 'ab') as f:
+            f.write(b'\n' + b'ERROR: something wrong\n' * 10)
+        # Given an update paused while indexing new lines
+        adding = threading.Event()
+        resume = threading.Event()
+        add_line = index._add_line
+
+        def _add_line(offset, line):
+            adding.set()
+            resume.wait(timeout=5)
+            add_line(offset, line)
+
+        index._add_line = _add_line
+        update = threading.Thread(target=index.update)
+        update.start()
+        self.assertTrue(adding.wait(timeout=5))
+        # When filtering the lines from another thread
+        result = []
+        query = threading.Thread(target=lambda: result.append(index.errors()))
+        query.start()
+        query.join(timeout=0.1)
+        resume.set()
+        update.join(timeout=5)
+        query.join(timeout=5)
+        # Then filter wait for the update to complete
+        self.assertEqual([[3] + list(range(5, 15))], result)
+
+    def test_update_replaced_file(self):
+        # Given an indexed log file
+        index = LogIndex(self.filename)
+        index.update()
+        # When file get replaced
+        os.remove(self.filename)
+        with open(self.filename, 'wb') as f:
+            f.write(b'new run\n')
+        # Then index is rebuilt
+        self.assertTrue(index.update())
+        self.assertEqual(['new run'], index.lines(range(len(index))))
+        self.assertEqual([], index.errors())
+
+    def test_update_rewritten_file(self):
+        # Given an indexed log file
+        index = LogIndex(self.filename)
+        index.update()
+        # When file get truncated and rewritten with more data
+        with open(self.filename, 'wb') as f:
+            f.write(b'new run\n' * 20)
+        # Then index is rebuilt
+        self.assertTrue(index.update())
+        self.assertEqual(20, len(index))
+        self.assertEqual(['new run'], index.lines([19]))
+
+    def test_get_log_index(self):
+        # When getting the index of the same file twice
+        # Then the same index is returned
+        self.assertIs(get_log_index(self.filename), get_log_index(Path(self.filename)))
+
+    def test_search(self):
+        # Given an indexed log file
+        index = LogIndex(self.filename)
+        index.update()
+        # When searching text
+        # Then matching lines are returned once
+        self.assertEqual([2], index.search('dOcUmEnTs'))
+        self.assertEqual([2], index.search('/home/user/documents'))
+        self.assertEqual([0, 1], index.search('backup'))
+        self.assertEqual([1], index.search('backup', level=LEVEL_WARNING))
+        self.assertEqual([0], index.search('backup', limit=1))
+        self.assertEqual([3], index.search('connect', level=LEVEL_ERROR))
+        # Then incomplete lines are ignored
+        self.assertEqual([], index.search('partial'))
+
+
+class RunLogTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = Path(self.tmp.name) / 'backup1.log'
+        self.archive_dir = Path(self.tmp.name) / 'logs'
+        self.history_file = Path(self.tmp.name) / 'history1.jsonl'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run_log(self):
+        # Given a previous run
+        with RunLog(self.filename, self.archive_dir, self.history_file, 'backup') as f:
+            f.write(b'first run\n')
+        # When running again
+        with self.assertRaises(ValueError):
+            with RunLog(self.filename, self.archive_dir, self.history_file, 'backup') as f:
+                f.write(b'second run\n')
+                raise ValueError('some error')
+        # Then the current log only contains the last run
+        self.assertEqual(b'second run\n', self.filename.read_bytes())
+        # Then previous log is compressed
+        archives = list(self.archive_dir.glob('backup1-*.log.gz'))
+        self.assertEqual(1, len(archives))
+        with gzip.open(archives[0], 'rb') as f:
+            self.assertEqual(b'first run\n', f.read())
+        # Then each run is recorded in history
+        history = read_history(self.history_file)
+        self.assertEqual(['SUCCESS', 'FAILURE'], [e['result'] for e in history])
+        self.assertEqual('some error', history[1]['details'])
+        self.assertEqual(11, history[1]['log_size'])
+        self.assertLessEqual(history[1]['start'], history[1]['end'])
+
+    def test_run_log_async(self):
+        # Given a previous run
+        self.filename.write_bytes(b'first run\n')
+        events = []
+        release = threading.Event()
+        compress = RunLog._compress
+
+        def _compress(run_log, src, dst):
+            release.wait(timeout=5)
+            events.append('compress')
+            compress(run_log, src, dst)
+
+        async def _run():
+            async with RunLog(self.filename, self.archive_dir, self.history_file, 'backup') as f:
+                events.append('run')
+                release.set()
+                f.write(b'second run\n')
+
+        # When running again with async context manager
+        with mock.patch.object(RunLog, '_compress', _compress):
+            asyncio.run(_run())
+        # Then the run start without waiting for the previous log to be compressed
+        self.assertEqual(['run', 'compress'], events)
+        self.assertEqual(b'second run\n', self.filename.read_bytes())
+        # Then previous log is compressed
+        archives = list(self.archive_dir.glob('backup1-*.log.gz'))
+        self.assertEqual(1, len(archives))
+        with gzip.open(archives[0], 'rb') as f:
+            self.assertEqual(b'first run\n', f.read())
+        self.assertEqual(['backup1.log', 'history1.jsonl', 'logs'], sorted(os.listdir(self.tmp.name)))
+
+    def test_run_log_retention(self):
+        # Given multiple archives of previous runs
+        self.archive_dir.mkdir()
+        for i in range(5):
+            (self.archive_dir / ('backup1-2024010%dT000000.log.gz' % i)).write_bytes(b'')
+        (self.archive_dir / 'restore1-20240101T000000.log.gz').write_bytes(b'')
+        self.filename.write_bytes(b'previous run\n')
+        os.utime(self.filename, (time.time(), time.time()))
+        # When starting a new run
+        with RunLog(self.filename, self.archive_dir, self.history_file, 'backup', keep=3):
+            pass
+        # Then only the most recent archives are kept
+        self.assertEqual(
+            ['backup1-20240103T000000.log.gz', 'backup1-20240104T000000.log.gz'],
+            sorted(fn.name for fn in self.archive_dir.glob('backup1-2024*')),
+        )
+        self.assertEqual(3, len(list(self.archive_dir.glob('backup1-*'))))
+        self.assertTrue((self.archive_dir / 'restore1-20240101T000000.log.gz').exists())
+
+    def test_run_log_same_second(self):
+        # Given a previous run
+        self.filename.write_bytes(b'first run\n')
+        mtime = time.time()
+        os.utime(self.filename, (mtime, mtime))
+        with RunLog(self.filename, self.archive_dir, self.history_file, 'backup'):
+            pass
+        # When another run get archived with the same modification time
+        os.utime(self.filename, (mtime, mtime))
+        with RunLog(self.filename, self.archive_dir, self.history_file, 'backup'):
+            pass
+        # Then both archives are kept
+        archives = list_archives(self.filename, self.archive_dir)
+        self.assertEqual(2, len(archives))
+        self.assertTrue(archives[0].name.endswith('-1.log.gz'))
+        self.assertTrue(archives[1].name.endswith('-2.log.gz'))
+
+    def test_session_statistics(self):
+        # Given statistics printed by rdiff-backup for two sessions
+        statistics = SessionStatistics()
+        for unused in range(2):
+            statistics.parse(b'Processing changed file foo\n')
+            statistics.parse(b'--------------[ Session statistics ]--------------\n')
+            statistics.parse(b'StartTime 1712947549.00 (Fri Apr 12 14:45:49 2024)\n')
+            statistics.parse(b'SourceFiles 10\n')
+            statistics.parse(b'SourceFileSize 10240 (10.0 KB)\n')
+            statistics.parse(b'TotalDestinationSizeChange -1024 (-1.00 KB)\n')
+            statistics.parse(b'--------------------------------------------------\n')
+            statistics.parse(b'Errors 3\n')
+        # Then integer values are added
+        self.assertEqual(
+            {'SourceFiles': 20, 'SourceFileSize': 20480, 'TotalDestinationSizeChange': -2048},
+            statistics.values,
+        )
+
+    def test_history_bounded(self):
+        # Given a full history
+        for i in range(5):
+            append_history(self.history_file, {'action': 'backup', 'start': i}, size=3)
+        append_history(self.history_file, {'action': 'restore', 'start': 5}, size=3)
+        # When reading the history
+        # Then only the most recent entries are kept
+        self.assertEqual([3, 4, 5], [e['start'] for e in read_history(self.history_file)])
+        self.assertEqual([5], [e['start'] for e in read_history(self.history_file, action='restore')])
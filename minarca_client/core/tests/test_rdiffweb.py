@@ -6,13 +6,19 @@ Created on Jun. 7, 2021
 
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
+import asyncio
+import concurrent.futures
 import os
 import tempfile
+import threading
 import unittest
+from unittest import mock
 
+import requests
 import responses  # @UnresolvedImport
 
-from minarca_client.core.rdiffweb import Rdiffweb
+from minarca_client.core import rdiffweb
+from minarca_client.core.rdiffweb import AsyncRdiffweb, Rdiffweb, clear_clients, get_client
 
 IDENTITY = """[test.minarca.net]:2222 ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIK/Qng4S5d75rtYxklVdIkPiz4paf2pdnCEshUoailQO root@sestican
 [test.minarca.net]:2222 ecdsa-sha2-nistp256 AAAAE2VjZHNhLXNoYTItbmlzdHAyNTYAAAAIbmlzdHAyNTYAAABBBCi0uz4rVsLpVl8b6ozYzL+t1Lh9P98a0tY7KqAtzFupjtZivdIYxh6jXPeonYo7egY+mFgMX22Tlrth8woRa2M= root@sestican
@@ -93,3 +99,185 @@ class TestRdiffweb(unittest.TestCase):
         self.assertEqual("3.9.1", data['version'])
         self.assertEqual("test.minarca.net:2222", data['remotehost'])
         self.assertEqual(IDENTITY, data['identity'])
+
+
+class TestGetClient(unittest.TestCase):
+    def tearDown(self):
+        clear_clients()
+
+    @responses.activate
+    def test_get_client(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'username': 'admin'})
+        # Given a client for a server
+        client = get_client('http://localhost/', ('admin', 'admin123'))
+        client.get_current_user_info()
+        # When getting a client with same url and credentials
+        # Then the same client is returned
+        self.assertIs(client, get_client('http://localhost/', ('admin', 'admin123')))
+        # Then the server url is not resolved again.
+        client.get_current_user_info()
+        self.assertEqual(
+            ['http://localhost/api/', 'http://localhost/api/currentuser/', 'http://localhost/api/currentuser/'],
+            [call.request.url for call in responses.calls],
+        )
+        # When using different credentials
+        # Then a different client is returned
+        self.assertIsNot(client, get_client('http://localhost/', ('admin', 'other')))
+        self.assertIs(get_client('http://localhost/', b'private key'), get_client('http://localhost/', b'private key'))
+        self.assertIsNot(client, get_client('http://localhost/', b'private key'))
+
+
+class TestAsyncRdiffweb(unittest.IsolatedAsyncioTestCase):
+    @responses.activate
+    async def test_get_current_user_info(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'username': 'admin'})
+        # Given an asynchronous client
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        conn = AsyncRdiffweb(client)
+        # When making query of current user info
+        data = await conn.get_current_user_info()
+        # Then info is returned
+        self.assertEqual('admin', data['username'])
+        # Then requests are sent with a timeout
+        self.assertEqual(rdiffweb.TIMEOUT, client.timeout)
+
+    @responses.activate
+    async def test_get_current_user_info_coalesced(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'username': 'admin'})
+        # Given an asynchronous client
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        # When multiple callers query current user info concurrently
+        results = await asyncio.gather(*[AsyncRdiffweb(client).get_current_user_info() for _unused in range(5)])
+        # Then a single request is sent to the server
+        self.assertEqual([{'username': 'admin'}] * 5, results)
+        self.assertEqual(1, len([c for c in responses.calls if c.request.url.endswith('/currentuser/')]))
+        # When querying again within the delay
+        await AsyncRdiffweb(client).get_current_user_info()
+        # Then the cached information is returned
+        self.assertEqual(1, len([c for c in responses.calls if c.request.url.endswith('/currentuser/')]))
+        # When asking for fresh information
+        await AsyncRdiffweb(client).get_current_user_info(max_age=0)
+        # Then a new request is sent
+        self.assertEqual(2, len([c for c in responses.calls if c.request.url.endswith('/currentuser/')]))
+
+    @responses.activate
+    async def test_get_current_user_info_invalidated(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'username': 'admin'})
+        responses.add(responses.POST, "http://localhost/api/currentuser/repos/repo1")
+        # Given current user information in cache
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        conn = AsyncRdiffweb(client)
+        await conn.get_current_user_info()
+        # When updating repository settings
+        await conn.post_repo_settings('repo1', maxage=2)
+        # Then next query send a new request
+        await conn.get_current_user_info()
+        self.assertEqual(2, len([c for c in responses.calls if c.request.url.endswith('/currentuser/')]))
+
+    @responses.activate
+    @mock.patch('minarca_client.core.rdiffweb.REPO_POLL_DELAY', 0.01)
+    async def test_wait_for_repo_shared(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'repos': [{'name': 'other'}]})
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/other", json={'maxage': 1})
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/repo1", status=404)
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/repo1", json={'maxage': 1})
+        # Given an asynchronous client
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        # When multiple callers wait for the same repository
+        await asyncio.gather(*[AsyncRdiffweb(client).wait_for_repo('repo1', timeout=5) for _unused in range(3)])
+        # Then the repository is checked only once per attempt
+        responses.assert_call_count("http://localhost/api/currentuser/repos/repo1", 2)
+        # Then the wait is forgotten
+        self.assertEqual({}, client._repo_waits)
+
+    @responses.activate
+    @mock.patch('minarca_client.core.rdiffweb.REPO_POLL_DELAY', 0.01)
+    @mock.patch('minarca_client.core.rdiffweb.REPO_POLL_MAX_DELAY', 0.04)
+    async def test_wait_for_repo_timeout(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'repos': [{'name': 'other'}]})
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/other", json={'maxage': 1})
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/repo1", status=404)
+        # Given an asynchronous client
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        # When waiting for a repository never created
+        # Then a timeout is raised
+        with self.assertRaises(TimeoutError):
+            await AsyncRdiffweb(client).wait_for_repo('repo1', timeout=0.2)
+        # Then the delay between checks increase
+        calls = len([c for c in responses.calls if c.request.url.endswith('/repos/repo1')])
+        self.assertLess(calls, 15)
+
+    @responses.activate
+    @mock.patch('minarca_client.core.rdiffweb.REPO_POLL_DELAY', 0.01)
+    async def test_wait_for_repo_without_endpoint(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'repos': [{'name': 'other'}]})
+        responses.add(responses.GET, "http://localhost/api/currentuser/", json={'repos': [{'name': 'other'}]})
+        responses.add(
+            responses.GET, "http://localhost/api/currentuser/", json={'repos': [{'name': 'other'}, {'name': 'repo1'}]}
+        )
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/repo1", status=404)
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/other", status=404)
+        # Given an older server without repository endpoint
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        # When waiting for a repository
+        await AsyncRdiffweb(client).wait_for_repo('repo1', timeout=5)
+        # Then the user information is used to find the repository
+        self.assertFalse(client._repo_endpoint)
+        responses.assert_call_count("http://localhost/api/currentuser/repos/repo1", 1)
+
+    @responses.activate
+    async def test_wait_for_repo_error(self):
+        responses.add(responses.GET, "http://localhost/api/")
+        responses.add(responses.GET, "http://localhost/api/currentuser/repos/repo1", status=403)
+        # Given an asynchronous client without permissions
+        client = Rdiffweb('http://localhost/')
+        client.auth = ('admin', 'admin123')
+        # When waiting for a repository
+        # Then the error is raised immediately
+        with self.assertRaises(requests.HTTPError):
+            await AsyncRdiffweb(client).wait_for_repo('repo1', timeout=5)
+
+    async def test_cancel(self):
+        # Given a single HTTP worker busy with a request
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        release = threading.Event()
+        client = mock.MagicMock(spec=Rdiffweb)
+        client.get_current_user_info.side_effect = lambda: release.wait(5)
+        client._user_info = client._user_info_task = None
+        client.remoteurl = 'http://localhost/'
+        conn = AsyncRdiffweb.__new__(AsyncRdiffweb)
+        conn.client = client
+        with mock.patch.object(rdiffweb, '_get_executor', return_value=executor):
+            busy = asyncio.create_task(conn.get_current_user_info())
+            await asyncio.sleep(0.05)
+            # When cancelling a request waiting for the worker
+            pending = asyncio.create_task(conn.get_minarca_info())
+            await asyncio.sleep(0.05)
+            pending.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await pending
+            release.set()
+            await busy
+        executor.shutdown(wait=True)
+        # Then the cancelled request is never sent
+        client.get_minarca_info.assert_not_called()
+
+    def test_get_executor(self):
+        # When getting the thread pool of servers
+        # Then each server get its own thread pool
+        executor = rdiffweb._get_executor('https://example.com/')
+        self.assertIs(executor, rdiffweb._get_executor('https://example.com/other'))
+        self.assertIsNot(executor, rdiffweb._get_executor('https://other.example.com/'))
@@ -0,0 +1,66 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+'''
+Benchmark of `reduce_path` with a large selection of files.
+
+The number of paths may be configured using environment variable:
+
+    MINARCA_BENCH_PATHS=1000000 pytest -s minarca_client/core/tests/test_reduce_path_benchmark.py
+'''
+import os
+import random
+import time
+import unittest
+
+from minarca_client.core.instance import reduce_path
+
+
+def _reduce_path_reference(paths):
+    """Previous implementation comparing every path with each other."""
+    reduced_paths = []
+    for path in paths:
+        if not any(os.path.commonpath([path, included]) == included for included in reduced_paths):
+            reduced_paths.append(path)
+    return reduced_paths
+
+
+def _synthetic_paths(count, seed=0):
+    """Generate a random selection of files and folders from a tree of folders."""
+    rnd = random.Random(seed)
+    folders = [os.path.join(os.sep, 'home', 'user')]
+    paths = []
+    while len(paths) < count:
+        parent = rnd.choice(folders)
+        path = os.path.join(parent, 'item%d' % len(paths))
+        if rnd.random() < 0.2:
+            folders.append(path)
+        paths.append(path)
+    rnd.shuffle(paths)
+    return paths
+
+
+class TestReducePathBenchmark(unittest.TestCase):
+
+    def test_same_result_as_reference(self):
+        # Given a selection of paths
+        paths = _synthetic_paths(2000)
+        # When reducing the paths
+        # Then result is identical to the previous implementation
+        self.assertEqual(_reduce_path_reference(paths), reduce_path(paths))
+
+    def test_throughput(self):
+        # Given a large selection of paths
+        paths = _synthetic_paths(int(os.environ.get('MINARCA_BENCH_PATHS', 100000)))
+        # When reducing the paths
+        start = time.perf_counter()
+        reduced = reduce_path(paths)
+        elapsed = time.perf_counter() - start
+        print('reduce_path: %d paths reduced to %d in %.3fs' % (len(paths), len(reduced), elapsed))
+        # Then nested paths are removed
+        self.assertLess(len(reduced), len(paths))
+        self.assertLess(elapsed, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Copyright (C) 2025 IKUS Software. All rights reserved.
+# IKUS Software inc. PROPRIETARY/CONFIDENTIAL.
+# Use is subject to license terms.
+import unittest
+from unittest.case import skipIf
+
+from minarca_client.core.compat import IS_WINDOWS
+from minarca_client.core.selection import PathSelection
+
+
+@skipIf(IS_WINDOWS, 'test paths are posix')
+class PathSelectionTest(unittest.TestCase):
+    def test_select(self):
+        # Given an empty selection
+        selection = PathSelection()
+        self.assertFalse(selection)
+        # When selecting files
+        self.assertTrue(selection.select('/home/user/a.txt'))
+        self.assertTrue(selection.select('/home/user/b.txt'))
+        # Then files are selected
+        self.assertEqual(2, len(selection))
+        self.assertEqual(['/home/user/a.txt', '/home/user/b.txt'], selection.paths())
+        self.assertTrue(selection.is_selected('/home/user/a.txt'))
+        self.assertFalse(selection.is_selected('/home/user'))
+        self.assertNotIn('/home/user/c.txt', selection)
+
+    def test_select_folder(self):
+        # Given a selection with files
+        selection = PathSelection(['/home/user/a.txt', '/tmp/b.txt'])
+        # When selecting the parent folder
+        self.assertTrue(selection.select('/home'))
+        # Then the folder replace the files
+        self.assertEqual(['/tmp/b.txt', '/home'], selection.paths())
+        # Then everything below the folder is selected
+        self.assertIn('/home/user/c.txt', selection)
+        self.assertTrue(selection.is_parent_selected('/home/user/c.txt'))
+        self.assertFalse(selection.is_parent_selected('/home'))
+        # Then files below the folder cannot be selected
+        self.assertFalse(selection.select('/home/user/c.txt'))
+        self.assertEqual(2, len(selection))
+
+    def test_toggle(self):
+        # Given a selection
+        selection = PathSelection()
+        # When toggling a path twice
+        self.assertTrue(selection.toggle('/home/user'))
+        self.assertFalse(selection.toggle('/home/user/'))
+        # Then path is not selected
+        self.assertEqual(0, len(selection))
+        self.assertNotIn('/home/user', selection)
+        # Then path cannot be unselected twice
+        self.assertFalse(selection.unselect('/home/user'))
+
+    def test_paths_with_limit(self):
+        # Given a large selection
+        selection = PathSelection(['/data/%s' % i for i in range(1000)])
+        # When getting the first paths
+        # Then only a subset is returned
+        self.assertEqual(['/data/0', '/data/1'], selection.paths(limit=2))
+        self.assertEqual(1000, len(selection))
@@ -32,6 +32,7 @@ from minarca_client.core.exceptions import (
     RepositoryNameExistsError,
     RunningError,
 )
+from minarca_client.core.instance import PROBE_LEVELS, PROBE_SSH
 from minarca_client.core.settings import Settings
 from minarca_client.locale import _
 
@@ -43,6 +44,9 @@ _ARGS_ALIAS = {
 
 logger = logging.getLogger(__name__)
 
+# Maximum delay in seconds to verify connectivity of each instance.
+STATUS_CHECK_TIMEOUT = 30
+
 
 def _abort(msg=None):
     print(msg or _('Operation aborted by the user.'))
@@ -61,20 +65,26 @@ def _backup(force, instance_id):
     from minarca_client.core.latest import LatestCheck, LatestCheckFailed
 
     signal.signal(signal.SIGINT, signal.default_int_handler)
-    # Check version
+    # Check version using the latest version known and revalidate it in background.
+    latest_check = LatestCheck()
     try:
-        latest_check = LatestCheck()
-        if not latest_check.is_latest():
-            logging.info(_('new version %s available'), latest_check.get_latest_version())
+        if not latest_check.is_latest(cached=True):
+            logging.info(_('new version %s available'), latest_check.get_latest_version(cached=True))
     except LatestCheckFailed:
         logging.info(_('fail to check for latest version'))
-    backup = Backup()
-    for instance in backup[instance_id]:
-        try:
-            asyncio.run(instance.backup(force=force))
-        except NotScheduleError as e:
-            # If one backup is not schedule to run, continue with next backup.
-            logging.info("%s: %s", instance.log_id, e)
+    refresh = latest_check.start_refresh()
+    try:
+        backup = Backup()
+        for instance in backup[instance_id]:
+            try:
+                asyncio.run(instance.backup(force=force))
+            except NotScheduleError as e:
+                # If one backup is not schedule to run, continue with next backup.
+                logging.info("%s: %s", instance.log_id, e)
+    finally:
+        # Give a chance to the revalidation to complete.
+        if refresh:
+            refresh.join(timeout=1)
 
 
 def _forget(instance_id, force=False):
@@ -250,7 +260,7 @@ def _imap_backup(args):
 _imap_backup.configure_log = False
 
 
-def _restore(restore_time, force, paths, instance_id, destination):
+def _restore(restore_time, force, paths, instance_id, destination, jobs=None):
     signal.signal(signal.SIGINT, signal.default_int_handler)
     assert isinstance(paths, list)
     backup = Backup()
@@ -315,7 +325,7 @@ def _restore(restore_time, force, paths, instance_id, destination):
         if not confirm:
             _abort()
     # Execute restore operation.
-    asyncio.run(instance.restore(restore_time=restore_time, paths=paths, destination=destination))
+    asyncio.run(instance.restore(restore_time=restore_time, paths=paths, destination=destination, jobs=jobs))
 
 
 def _stop(force, instance_id):
@@ -351,24 +361,33 @@ def _start(force, instance_id):
     backup.start_all(force=force, instance_id=instance_id.value)
 
 
-def _status(instance_id):
+async def _check_connections(instances, check, timeout):
+    """
+    Check connectivity of every instances concurrently. Return a list of booleans.
+    """
+
+    async def _check(instance):
+        try:
+            await asyncio.wait_for(instance.probe_connection(level=check), timeout)
+            return True
+        except (BackupError, asyncio.TimeoutError):
+            return False
+
+    return await asyncio.gather(*[_check(instance) for instance in instances])
+
+
+def _status(instance_id, check=PROBE_SSH):
     """
     Return status for each backup.
     """
     backup = Backup()
+    instances = list(backup[instance_id])
     # Test connection for all backup.
-    if len(backup):
+    if check and instances:
         print('Verifying connection...')
-    entries = []
-    for instance in backup[instance_id]:
-        status = instance.status
-        settings = instance.settings
-        try:
-            asyncio.run(instance.test_connection())
-            connected = True
-        except BackupError:
-            connected = False
-        entries.append((instance, connected))
+        entries = zip(instances, asyncio.run(_check_connections(instances, check, STATUS_CHECK_TIMEOUT)))
+    else:
+        entries = [(instance, None) for instance in instances]
 
     # Print result.
     for instance, connected in entries:
@@ -383,7 +402,8 @@ def _status(instance_id):
             print(" * " + _("Remote server:          %s") % settings.remotehost)
         elif instance.is_local():
             print(" * " + _("Local device:           %s") % settings.localcaption)
-        print(" * " + _("Connectivity status:    %s") % (_("Connected") if connected else _("Not connected")))
+        if connected is not None:
+            print(" * " + _("Connectivity status:    %s") % (_("Connected") if connected else _("Not connected")))
         print(
             " * "
             + _("Last successful backup: %s") % (status.lastsuccess.strftime() if status.lastsuccess else _('Never'))
@@ -558,6 +578,14 @@ def _parse_args():
         action='store_true',
         help=_("Force execution of restore operation without confirmation from the user."),
     )
+    sub.add_argument(
+        '-j',
+        '--jobs',
+        help=_("Number of files and folders groups to restore concurrently."),
+        type=int,
+        choices=range(1, 17),
+        metavar='{1..16}',
+    )
     sub.add_argument('paths', nargs='*', help=_('files and folders to be restored'))
     sub.set_defaults(func=_restore)
 
@@ -623,6 +651,21 @@ def _parse_args():
         default=InstanceId(None),
         type=InstanceId,
     )
+    sub.add_argument(
+        '--check',
+        choices=PROBE_LEVELS,
+        default=PROBE_SSH,
+        help=_(
+            "Connectivity check to run: a connection to the server, an authenticated connection or a complete test with rdiff-backup."
+        ),
+    )
+    sub.add_argument(
+        '--no-check',
+        dest='check',
+        action='store_const',
+        const=None,
+        help=_("Do not verify connectivity."),
+    )
     sub.set_defaults(func=_status)
 
     # forget
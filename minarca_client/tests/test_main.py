@@ -6,11 +6,13 @@ Created on Jun. 9, 2021
 
 @author: Patrik Dufresne <patrik@ikus-soft.com>
 '''
+import asyncio
 import contextlib
 import io
 import logging
 import os
 import tempfile
+import time
 import unittest
 from pathlib import Path
 from unittest import mock
@@ -196,19 +198,35 @@ class TestMainParseArgs(unittest.TestCase):
         [
             (
                 ['/path/to/file'],
-                {'restore_time': None, 'force': False, 'paths': ['/path/to/file'], 'destination': None},
+                {'restore_time': None, 'force': False, 'paths': ['/path/to/file'], 'destination': None, 'jobs': None},
             ),
             (
                 ['--force', '/path/to/file'],
-                {'restore_time': None, 'force': True, 'paths': ['/path/to/file'], 'destination': None},
+                {'restore_time': None, 'force': True, 'paths': ['/path/to/file'], 'destination': None, 'jobs': None},
             ),
             (
                 ['--destination', '/dest/path/', '/path/to/file'],
-                {'restore_time': None, 'force': False, 'paths': ['/path/to/file'], 'destination': '/dest/path/'},
+                {
+                    'restore_time': None,
+                    'force': False,
+                    'paths': ['/path/to/file'],
+                    'destination': '/dest/path/',
+                    'jobs': None,
+                },
             ),
             (
                 ['--restore-time', '2024-01-13', '/path/to/file'],
-                {'restore_time': '2024-01-13', 'force': False, 'paths': ['/path/to/file'], 'destination': None},
+                {
+                    'restore_time': '2024-01-13',
+                    'force': False,
+                    'paths': ['/path/to/file'],
+                    'destination': None,
+                    'jobs': None,
+                },
+            ),
+            (
+                ['--jobs', '4', '/path/to/file'],
+                {'restore_time': None, 'force': False, 'paths': ['/path/to/file'], 'destination': None, 'jobs': 4},
             ),
         ]
     )
@@ -240,7 +258,19 @@ class TestMainParseArgs(unittest.TestCase):
     @mock.patch('minarca_client.main._status')
     def test_args_status(self, mock_status):
         main.main(['status'])
-        mock_status.assert_called_once_with(instance_id=InstanceId(None))
+        mock_status.assert_called_once_with(instance_id=InstanceId(None), check='ssh')
+
+    @parameterized.expand(
+        [
+            (['--check', 'tcp'], 'tcp'),
+            (['--check', 'full'], 'full'),
+            (['--no-check'], None),
+        ]
+    )
+    @mock.patch('minarca_client.main._status')
+    def test_args_status_check(self, args, expected, mock_status):
+        main.main(['status'] + args)
+        mock_status.assert_called_once_with(instance_id=InstanceId(None), check=expected)
 
     @mock.patch('minarca_client.main._forget')
     def test_args_forget(self, mock_forget):
@@ -407,7 +437,9 @@ class TestMainParseArgs(unittest.TestCase):
         # When calling restore
         main.main(['restore', '--force', './test'])
         # Then the first instance is used for restore.
-        instance.restore.assert_called_once_with(restore_time=None, paths=[MATCH('*/test')], destination=None)
+        instance.restore.assert_called_once_with(
+            restore_time=None, paths=[MATCH('*/test')], destination=None, jobs=None
+        )
 
     @mock.patch('minarca_client.main.Backup')
     def test_restore_with_destination(self, mock_backup):
@@ -417,7 +449,9 @@ class TestMainParseArgs(unittest.TestCase):
         # When calling restore
         main.main(['restore', '--force', '--destination', '/tmp', './test'])
         # Then the first instance is used for restore.
-        instance.restore.assert_called_once_with(restore_time=None, paths=[MATCH('*/test')], destination='/tmp')
+        instance.restore.assert_called_once_with(
+            restore_time=None, paths=[MATCH('*/test')], destination='/tmp', jobs=None
+        )
 
     @mock.patch('minarca_client.main.Backup')
     def test_start(self, mock_backup):
@@ -483,6 +517,60 @@ class TestMainParseArgs(unittest.TestCase):
         self.assertIn('Last backup date:', f.getvalue())
         self.assertIn('Last backup status:', f.getvalue())
 
+    @mock.patch('minarca_client.core.instance.BackupInstance.probe_connection')
+    def test_status_no_check(self, mock_probe_connection):
+        # Given a backup instance
+        instance = BackupInstance('')
+        instance.settings.configured = True
+        instance.settings.save()
+        # When calling status without connectivity check
+        f = io.StringIO()
+        with contextlib.redirect_stdout(f):
+            main.main(['status', '--no-check'])
+        # Then status get printed without connectivity
+        self.assertIn('Backup Instance:', f.getvalue())
+        self.assertNotIn('Connectivity status:', f.getvalue())
+        mock_probe_connection.assert_not_called()
+
+    def test_status_check_concurrently(self):
+        # Given multiple backup instances with slow connectivity check
+        for i in range(3):
+            instance = BackupInstance(i + 1)
+            instance.settings.configured = True
+            instance.settings.save()
+
+        async def slow_probe(*args, **kwargs):
+            await asyncio.sleep(0.5)
+
+        # When calling status with a quick check
+        f = io.StringIO()
+        with mock.patch('minarca_client.core.instance.BackupInstance.probe_connection', side_effect=slow_probe):
+            with contextlib.redirect_stdout(f):
+                start = time.time()
+                main.main(['status', '--check', 'tcp'])
+                elapsed = time.time() - start
+        # Then checks are executed concurrently
+        self.assertEqual(3, f.getvalue().count('Connectivity status:    Connected'))
+        self.assertLess(elapsed, 1.5)
+
+    @mock.patch('minarca_client.main.STATUS_CHECK_TIMEOUT', 0.1)
+    def test_status_check_timeout(self):
+        # Given a backup instance with a connectivity check never completing
+        instance = BackupInstance('')
+        instance.settings.configured = True
+        instance.settings.save()
+
+        async def hang(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        # When calling status
+        f = io.StringIO()
+        with mock.patch('minarca_client.core.instance.BackupInstance.probe_connection', side_effect=hang):
+            with contextlib.redirect_stdout(f):
+                main.main(['status'])
+        # Then instance is reported as not connected
+        self.assertIn('Connectivity status:    Not connected', f.getvalue())
+
     def test_forget(self):
         # Given a backup instance
         instance = BackupInstance('')
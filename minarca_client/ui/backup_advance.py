@@ -6,13 +6,14 @@ import logging
 
 from kivy.app import App
 from kivy.lang import Builder
-from kivy.properties import BooleanProperty, StringProperty
+from kivy.properties import BooleanProperty, NumericProperty, StringProperty
 from kivymd.uix.boxlayout import MDBoxLayout
 
 from minarca_client.core import BackupInstance
 from minarca_client.dialogs import warning_dialog
 from minarca_client.locale import _
 from minarca_client.ui.spinner_overlay import SpinnerOverlay  # noqa
+from minarca_client.ui.utils import alias_property
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +64,21 @@ Builder.load_string(
                     active: root.ignore_hook_errors
                     on_active: root.ignore_hook_errors = self.active
 
+                CLabel:
+                    text: _('Restore')
+                    font_style: "Title"
+                    role: "small"
+                    text_color: self.theme_cls.primaryColor
+
+                CLabel:
+                    text: _("Restore multiple folders concurrently to reduce the time required to recover your data.")
+
+                CDropDown:
+                    name: _('Concurrent restore operations')
+                    value: root.restore_jobs
+                    on_value: root.restore_jobs = self.value
+                    data: root.restore_jobs_choices
+
                 MDBoxLayout:
                     orientation: "horizontal"
                     spacing: "10dp"
@@ -96,6 +112,7 @@ class BackupAdvanceSettings(MDBoxLayout):
     pre_hook_command = StringProperty()
     post_hook_command = StringProperty()
     ignore_hook_errors = BooleanProperty(False)
+    restore_jobs = NumericProperty(1)
     working = StringProperty()
 
     def __init__(self, backup=None, instance=None, create=False):
@@ -112,10 +129,15 @@ class BackupAdvanceSettings(MDBoxLayout):
         self.pre_hook_command = settings.pre_hook_command or ""
         self.post_hook_command = settings.post_hook_command or ""
         self.ignore_hook_errors = settings.ignore_hook_errors
+        self.restore_jobs = settings.restore_jobs or 1
 
         # Create the view
         super().__init__()
 
+    @alias_property()
+    def restore_jobs_choices(self):
+        return {1: _("One at a time"), 2: _("2 at a time"), 4: _("4 at a time"), 8: _("8 at a time")}
+
     def cancel(self):
         # Go to dashboard view.
         App.get_running_app().set_active_view('dashboard.DashboardView')
@@ -134,6 +156,7 @@ class BackupAdvanceSettings(MDBoxLayout):
             settings.pre_hook_command = self.pre_hook_command
             settings.post_hook_command = self.post_hook_command
             settings.ignore_hook_errors = self.ignore_hook_errors
+            settings.restore_jobs = self.restore_jobs
             settings.save()
             # Redirect user to dashboard.
             App.get_running_app().set_active_view('dashboard.DashboardView')
@@ -262,9 +262,9 @@ class BackupCard(CCard):
         return 0
 
     async def _test_connection(self, instance):
-        # Test connectivity with remote server every 5 secs
+        # Test connectivity with remote server. Result is shared with other views for a short period.
         try:
-            await instance.test_connection()
+            await instance.probe_connection()
             self.test_connection = True
         except Exception as e:
             # Exception raise - either server is not responding or disk is not connected.
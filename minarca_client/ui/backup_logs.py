@@ -4,27 +4,38 @@
 import asyncio
 import logging
 
-import aiofiles
 from kivy.app import App
 from kivy.lang import Builder
-from kivy.properties import BooleanProperty, ObjectProperty
+from kivy.properties import BooleanProperty, NumericProperty, ObjectProperty, StringProperty
 from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.textinput import TextInput
 from kivymd.uix.boxlayout import MDBoxLayout
 
 from minarca_client.core import BackupInstance
 from minarca_client.core.compat import open_file_with_default_app, watch_file
+from minarca_client.core.logs import LEVEL_ERROR, LEVEL_INFO, LEVEL_WARNING, LOG_MAX_LINES, LogFollower, get_log_index
 from minarca_client.dialogs import error_dialog, question_dialog
 from minarca_client.locale import _
 from minarca_client.ui.utils import alias_property
 
 logger = logging.getLogger(__name__)
 
-MAX_FILE_SIZE = 1024 * 10  # Max size to process (e.g., 10 KB)
 UPDATE_INTERVAL = 1  # Update interval in seconds
+ERROR_CONTEXT_LINES = 50  # Number of lines displayed before and after an error
 
 Builder.load_string(
     '''
+<LogLine>:
+    font_name: "monospace"
+    readonly: True
+    multiline: False
+    padding: ("6dp", "2dp")
+    # Change style of TextInput.
+    background_color: app.theme_cls.surfaceColor
+    foreground_color: app.theme_cls.onSurfaceColor
+    background_normal: ""
+    background_active: ""
+
 <BackupLogs>:
     orientation: "horizontal"
     md_bg_color: self.theme_cls.backgroundColor
@@ -100,8 +111,34 @@ Builder.load_string(
             padding: ("15dp", "12dp")
             display: root.error_message
 
-        CScrollView:
-            id: scrollv
+        MDBoxLayout:
+            orientation: "horizontal"
+            spacing: "15dp"
+            adaptive_height: True
+
+            CTextField:
+                id: search_field
+                name: _("Search in the logs")
+                on_text_validate: root.search_text = self.text
+
+            CDropDown:
+                name: _("Show")
+                value: root.level_filter
+                on_value: root.level_filter = self.value
+                data: root.level_filter_choices
+                size_hint_x: None
+                width: "220dp"
+
+        RecycleView:
+            id: logview
+            viewclass: "LogLine"
+            do_scroll_x: False
+            canvas.before:
+                Color:
+                    rgba: app.theme_cls.surfaceColor
+                Rectangle:
+                    pos: self.pos
+                    size: self.size
             canvas.after:
                 Color:
                     rgba: app.theme_cls.onSurfaceColor
@@ -109,17 +146,12 @@ Builder.load_string(
                     rectangle: [self.x, self.y, self.width, self.height]
                     width: 1
 
-            TextInput:
-                id: logview
-                size_hint: 1, None
-                height: max(self.minimum_height, scrollv.height)
-                font_name: "monospace"
-                readonly: True
-                # Change style of TextInput.
-                background_color: app.theme_cls.surfaceColor
-                text_color: app.theme_cls.onSurfaceColor
-                background_normal: ""
-                background_active: ""
+            RecycleBoxLayout:
+                default_size: None, "20dp"
+                default_size_hint: 1, None
+                orientation: 'vertical'
+                size_hint_y: None
+                height: self.minimum_height
 
         MDBoxLayout:
             orientation: "horizontal"
@@ -140,6 +172,12 @@ Builder.load_string(
                 on_release: root.open_log_file()
                 disabled: not root.filename
 
+            CButton:
+                style: "text"
+                text: _("Next error")
+                on_release: root.next_error()
+                disabled: not root.filename
+
             CButton:
                 style: "text"
                 text: _("Scroll to bottom")
@@ -162,9 +200,19 @@ class BackupLogs(MDBoxLayout):
     instance = None
     is_remote = BooleanProperty()
     status = ObjectProperty()
+    search_text = StringProperty()
+    level_filter = NumericProperty(LEVEL_INFO)
     _status_task = None
     _readlogs_task = None
+    _index_task = None
+    _filter_task = None
     _stop_task = None
+    _follower = None
+    _index = None
+    # Line number of the error displayed by next_error()
+    _error_lineno = -1
+    # True when the view display lines from the index instead of following the file.
+    _frozen = False
 
     def __init__(self, backup=None, instance=None):
         assert backup
@@ -188,6 +236,10 @@ class BackupLogs(MDBoxLayout):
         """On destroy, make sure to delete task."""
         if self._readlogs_task:
             self._readlogs_task.cancel()
+        if self._index_task:
+            self._index_task.cancel()
+        if self._filter_task:
+            self._filter_task.cancel()
         if self._status_task:
             self._status_task.cancel()
         if self._stop_task:
@@ -212,48 +264,151 @@ class BackupLogs(MDBoxLayout):
             logger.exception('problem occured while watching status')
 
     async def _readlogs(self, instance):
+        if self._index_task:
+            self._index_task.cancel()
         if not self.filename:
             return
         try:
-            # Due to Kivy limitation of TextInput updating all the lines at once. We need to
-            # Reload the logs less often and limit the number of lines to keep the interface responsible.
-            logview = self.ids.logview
-            logview.text = await self.read_file_tail(self.filename)
-            logview.parent.scroll_y = 0
+            # Only the lines appended to the file are read and only the visible lines are rendered.
+            self._follower = follower = LogFollower(self.filename)
+            self._index = None
+            self._error_lineno = -1
+            loop = asyncio.get_running_loop()
+            unused, lines = await loop.run_in_executor(None, follower.read)
+            self._update_logview(follower, True, lines)
+            # The full file is indexed in background to search and filter it.
+            index = get_log_index(self.filename)
+            self._index_task = asyncio.create_task(self._update_index(index))
             async for unused in watch_file(self.filename, poll_delay=UPDATE_INTERVAL):
-                logview.text = await self.read_file_tail(self.filename)
+                self._update_logview(follower, *await loop.run_in_executor(None, follower.read))
+                if self._index_task.done():
+                    self._index_task = asyncio.create_task(self._update_index(index))
         except Exception:
             logger.exception('problem occured while reading backup logs')
 
-    async def read_file_tail(self, file_path):
+    async def _update_index(self, index):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, index.update)
+        except Exception:
+            logger.exception('problem occured while indexing backup logs')
+            return
+        if self._index is None:
+            # Search and filters become available once the file is indexed.
+            self._index = index
+            if self.search_text or self.level_filter > LEVEL_INFO:
+                self._start_filter()
+
+    def _update_logview(self, follower, reset, lines):
+        if self._frozen:
+            # Lines from the index are displayed.
+            return
+        logview = self.ids.logview
+        # Keep following the end of the file unless the user scrolled up.
+        follow = logview.scroll_y <= 0 or not logview.data
+        if reset:
+            if follower.lines:
+                logview.data = [{'text': line} for line in follower.lines]
+            else:
+                logview.data = [{'text': _('No log')}]
+        elif lines:
+            data = logview.data
+            data.extend({'text': line} for line in lines)
+            # Drop the oldest lines similar to the follower buffer.
+            overflow = len(data) - follower.lines.maxlen
+            if overflow > 0:
+                del data[:overflow]
+        if follow:
+            logview.scroll_y = 0
+
+    @alias_property()
+    def level_filter_choices(self):
+        return {LEVEL_INFO: _("All lines"), LEVEL_WARNING: _("Warnings and errors"), LEVEL_ERROR: _("Errors only")}
+
+    def on_search_text(self, widget, value):
+        self._start_filter()
+
+    def on_level_filter(self, widget, value):
+        self._start_filter()
+
+    def _start_filter(self):
+        if self._filter_task:
+            self._filter_task.cancel()
+        self._filter_task = asyncio.create_task(self._apply_filter())
+
+    async def _apply_filter(self):
         """
-        Read the last part of the file if its size exceeds MAX_FILE_SIZE.
+        Display the lines matching the search text and the level from the full file.
         """
+        index = self._index
+        if index is None:
+            return
+        if not self.search_text and self.level_filter <= LEVEL_INFO:
+            self._follow()
+            return
+
+        def _task():
+            if self.search_text:
+                linenos = index.search(self.search_text, level=self.level_filter, limit=LOG_MAX_LINES)
+            else:
+                linenos = index.filter(self.level_filter)[-LOG_MAX_LINES:]
+            return [{'text': '%d: %s' % (n + 1, line)} for n, line in zip(linenos, index.lines(linenos))]
+
         try:
-            async with aiofiles.open(file_path, "rb") as f:
-                await f.seek(0, 2)  # Move to the end of the file
-                file_size = await f.tell()
-
-                if file_size > MAX_FILE_SIZE:
-                    # Read only the last MAX_FILE_SIZE bytes
-                    await f.seek(-MAX_FILE_SIZE, 2)
-                    content = '<Log truncated>\n...'
-                    data = await f.read()
-                    # Try to cut the data at line ending.
-                    try:
-                        idx = data.index(b'\n')
-                        data = data[idx:]
-                    except ValueError:
-                        pass
-                    content += data.decode("utf-8", errors="replace")
-                else:
-                    # Read the entire file
-                    await f.seek(0)
-                    data = await f.read()
-                    content = data.decode("utf-8", errors="replace")
-            return content
-        except FileNotFoundError:
-            return _('No log')
+            data = await asyncio.get_running_loop().run_in_executor(None, _task)
+        except Exception:
+            logger.exception('problem occured while searching backup logs')
+            return
+        self._frozen = True
+        logview = self.ids.logview
+        logview.data = data or [{'text': _('No matching lines')}]
+        logview.scroll_y = 1
+
+    def next_error(self):
+        """
+        Display the lines around the next error of the full file.
+        """
+        if self._filter_task:
+            self._filter_task.cancel()
+        self._filter_task = asyncio.create_task(self._show_next_error())
+
+    async def _show_next_error(self):
+        index = self._index
+        if index is None:
+            return
+
+        def _task():
+            errors = index.errors()
+            if not errors:
+                return None, []
+            lineno = next((n for n in errors if n > self._error_lineno), errors[0])
+            start = max(0, lineno - ERROR_CONTEXT_LINES)
+            linenos = range(start, min(len(index), lineno + ERROR_CONTEXT_LINES + 1))
+            return lineno, [{'text': '%d: %s' % (n + 1, line)} for n, line in zip(linenos, index.lines(linenos))]
+
+        try:
+            lineno, data = await asyncio.get_running_loop().run_in_executor(None, _task)
+        except Exception:
+            logger.exception('problem occured while searching backup logs')
+            return
+        logview = self.ids.logview
+        if lineno is None:
+            self._follow()
+            return
+        self._error_lineno = lineno
+        self._frozen = True
+        logview.data = data
+        # Scroll to the error line.
+        position = min(lineno, ERROR_CONTEXT_LINES)
+        logview.scroll_y = 1 - position / max(1, len(data) - 1)
+
+    def _follow(self):
+        """
+        Go back to display the end of the file as it get written.
+        """
+        self._frozen = False
+        if self._follower:
+            self._update_logview(self._follower, True, [])
+        self.ids.logview.scroll_y = 0
 
     @alias_property(bind=['status'])
     def title_text(self):
@@ -323,7 +478,13 @@ class BackupLogs(MDBoxLayout):
 
     def scroll_down(self):
         # Jump directly to the end of the log file.
-        self.ids.logview.parent.scroll_y = 0
+        self.ids.search_field.text = ''
+        if self.search_text or self.level_filter > LEVEL_INFO:
+            # Clearing the filter display the end of the file.
+            self.search_text = ''
+            self.level_filter = LEVEL_INFO
+        else:
+            self._follow()
 
     def stop(self):
         async def _stop():
@@ -4,38 +4,43 @@
 import asyncio
 import datetime
 import logging
+import os
 
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.lang import Builder
-from kivy.properties import BooleanProperty, ListProperty, StringProperty
+from kivy.properties import BooleanProperty, ListProperty, NumericProperty, StringProperty
 from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivymd.uix.boxlayout import MDBoxLayout
 from kivymd.uix.list import MDListItem
 
 from minarca_client.core.exceptions import BackupError
-from minarca_client.core.instance import BackupInstance, reduce_path
+from minarca_client.core.instance import BackupInstance
+from minarca_client.core.selection import PathSelection
 from minarca_client.dialogs import folder_dialog, question_dialog
 from minarca_client.locale import _, ngettext
 from minarca_client.ui.date_picker import CDatePicker  # noqa
 from minarca_client.ui.spinner_overlay import SpinnerOverlay  # noqa
 from minarca_client.ui.theme import CButton  # noqa
-from minarca_client.ui.utils import alias_property
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of paths displayed in the selection summary.
+SUMMARY_LIMIT = 5
+
 
 Builder.load_string(
     '''
 <FileItem>
     divider: True
     ripple_effect: False
+    on_release: root.open_folder()
 
     MDListItemLeadingIcon:
         icon: root.icon
 
     MDListItemSupportingText:
-        text: root.text
+        text: root.name or root.text
 
     MDListItemTrailingCheckbox:
         id: stored_state
@@ -89,11 +94,30 @@ Builder.load_string(
                 MDTextFieldTrailingIcon:
                     icon: "magnify"
 
+            MDBoxLayout:
+                orientation: "horizontal"
+                spacing: "10dp"
+                adaptive_height: True
+
+                MDIconButton:
+                    id: btn_parent
+                    icon: "arrow-up"
+                    on_release: root.open_parent()
+                    disabled: root.working or not root.current_path
+                    theme_icon_color: "Custom"
+                    icon_color: app.theme_cls.onSurfaceColor
+
+                CLabel:
+                    text: root.current_path or _("Backed up folders")
+                    shorten: True
+                    shorten_from: 'left'
+                    pos_hint: {"center_y": .5}
+
             RecycleView:
                 id: availables
                 data: root.file_items
                 viewclass: "FileItem"
-                selected_files: root.selected_files
+                restore_view: root
                 canvas.after:
                     Color:
                         rgba: app.theme_cls.onSurfaceColor
@@ -133,7 +157,7 @@ Builder.load_string(
                 CButton:
                     text: _('Restore...')
                     on_release: root.save()
-                    disabled: root.working or not root.selected_files
+                    disabled: root.working or not root.selected_count
 
                 CLabel:
                     text: root.selected_files_summary
@@ -153,16 +177,17 @@ class FileItem(RecycleDataViewBehavior, MDListItem):
     data = None
     icon = StringProperty()
     text = StringProperty()
+    name = StringProperty()
+    is_dir = BooleanProperty(False)
     selected = BooleanProperty(False)
     parent_selected = BooleanProperty(False)
 
     def refresh_view_attrs(self, rv, index, data):
         self.rv = rv
         self.data = data
-        self.parent_selected = any(
-            data['text'].startswith(item.get('text', '') + '/') for item in self.rv.selected_files
-        )
-        self.selected = data in self.rv.selected_files
+        selection = self.rv.restore_view.selection
+        self.parent_selected = selection.is_parent_selected(data['text'])
+        self.selected = selection.is_selected(data['text'])
         return super().refresh_view_attrs(rv, index, data)
 
     def toggle_checkbox_state(self):
@@ -171,15 +196,16 @@ class FileItem(RecycleDataViewBehavior, MDListItem):
         if self.parent_selected:
             # Do nothing if already included by parent.
             return
-        # Store selection in selected_files
-        self.selected = not self.selected
-        if self.selected:
-            self.rv.selected_files.append(self.data)
-        elif self.data in self.rv.selected_files:
-            self.rv.selected_files.remove(self.data)
+        # Store selection in the view.
+        self.selected = self.rv.restore_view.toggle_selection(self.data['text'])
         # Force refresh to account for parent_selected
         self.rv.refresh_from_data()
 
+    def open_folder(self):
+        if self.rv is None or not self.is_dir:
+            return
+        self.rv.restore_view.open_folder(self.data['text'])
+
 
 class BackupRestoreFiles(MDBoxLayout):
     instance = None
@@ -190,8 +216,11 @@ class BackupRestoreFiles(MDBoxLayout):
     working = StringProperty()
     search = StringProperty()
     file_items = ListProperty()
-    # Item selected by the user.
-    selected_files = ListProperty()
+    # Folder currently displayed. Empty for the top level.
+    current_path = StringProperty()
+    # Number of files and folders selected by the user.
+    selected_count = NumericProperty(0)
+    selected_files_summary = StringProperty()
     # True to restore at same location
     in_place = BooleanProperty(False)
 
@@ -205,27 +234,35 @@ class BackupRestoreFiles(MDBoxLayout):
         self.instance = instance
         self.increment = increment
         self.is_remote = self.instance.is_remote()
+        # Files and folders selected by the user.
+        self.selection = PathSelection()
+        self.selected_files_summary = _('No item selected')
+        # Folders opened by the user to reach the current folder.
+        self._history = []
         # Create the view
         super().__init__()
-        # Start task to get increments list.
+        # Start task to get top level folders.
         self.working = _('Please wait. Getting file list...')
         self._fetch_files_task = asyncio.create_task(self._fetch_files(instance))
 
         # Debounce timer
         self.filter_event = None
 
-    async def _fetch_files(self, instance):
+    async def _fetch_files(self, instance, path=None):
         try:
-            file_list = await instance.list_files(self.increment)
+            file_list = await instance.list_dir(self.increment, path)
             file_items = []
-            for fn in file_list:
+            for fn, is_dir in file_list:
                 file_items.append(
                     {
                         'text': fn,
-                        'icon': 'file-outline',
+                        'name': os.path.basename(fn) if path else fn,
+                        'icon': 'folder-outline' if is_dir else 'file-outline',
+                        'is_dir': is_dir,
                     }
                 )
             self.file_items = file_items
+            self.current_path = path or ''
         except BackupError as e:
             logger.warning(str(e), exc_info=1)
             self.error_message = _('Failed to retrieve available files.')
@@ -251,13 +288,51 @@ class BackupRestoreFiles(MDBoxLayout):
         else:
             self.ids.availables.data = self.file_items[:100]
 
-    @alias_property(bind=['selected_files'])
-    def selected_files_summary(self):
-        if self.selected_files:
-            paths = reduce_path([item['text'] for item in self.selected_files])
-            count = len(paths)
-            return ngettext('%s item selected: %s', '%s items selected: %s', count) % (count, ', '.join(paths))
-        return _('No item selected')
+    def open_folder(self, path):
+        """
+        Display the content of the given folder. Content is fetched on first access.
+        """
+        if self.working:
+            return
+        if self.current_path:
+            self._history.append(self.current_path)
+        self._open(path)
+
+    def open_parent(self):
+        """
+        Go back to the folder previously displayed.
+        """
+        if self.working or not self.current_path:
+            return
+        self._open(self._history.pop() if self._history else None)
+
+    def _open(self, path):
+        if self._fetch_files_task:
+            self._fetch_files_task.cancel()
+        self.search = ''
+        self.error_message = ''
+        self.error_detail = ''
+        self.working = _('Please wait. Getting file list...')
+        self._fetch_files_task = asyncio.create_task(self._fetch_files(self.instance, path))
+
+    def toggle_selection(self, path):
+        """
+        Select or unselect the given path. Return True if selected.
+        """
+        selected = self.selection.toggle(path)
+        # Update summary without enumerating the whole selection.
+        count = self.selected_count = len(self.selection)
+        if count:
+            summary = ', '.join(self.selection.paths(limit=SUMMARY_LIMIT))
+            if count > SUMMARY_LIMIT:
+                summary += ', ...'
+            self.selected_files_summary = ngettext('%s item selected: %s', '%s items selected: %s', count) % (
+                count,
+                summary,
+            )
+        else:
+            self.selected_files_summary = _('No item selected')
+        return selected
 
     def on_parent(self, widget, value):
         if value is None:
@@ -300,8 +375,9 @@ class BackupRestoreFiles(MDBoxLayout):
             # Trigger restore process of the given file to selected folder.
             self.instance.start_restore(
                 restore_time=int(self.increment.timestamp()),
-                paths=[item['text'] for item in self.selected_files],
+                paths=self.selection.paths(),
                 destination=folder,
+                jobs=self.instance.settings.restore_jobs,
             )
             # Go to Logs
             App.get_running_app().set_active_view('backup_logs.BackupLogs', instance=self.instance)
@@ -34,6 +34,7 @@ class BackupAdvanceSettingsTest(BaseAppTest):
         # Given the user enter new commands
         self.view.pre_hook_command = "echo foo"
         self.view.ignore_hook_errors = True
+        self.view.restore_jobs = 4
         # When user click save
         btn_save = self.view.ids.btn_save
         btn_save.dispatch('on_release')
@@ -43,3 +44,4 @@ class BackupAdvanceSettingsTest(BaseAppTest):
         # Then the command is save into the settings
         self.assertEqual(self.instance.settings.pre_hook_command, "echo foo")
         self.assertTrue(self.instance.settings.ignore_hook_errors)
+        self.assertEqual(self.instance.settings.restore_jobs, 4)
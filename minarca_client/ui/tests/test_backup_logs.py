@@ -5,6 +5,7 @@ import asyncio
 import time
 
 from minarca_client.core.backup import BackupInstance
+from minarca_client.core.logs import LEVEL_ERROR, LEVEL_INFO
 from minarca_client.ui.backup_logs import BackupLogs
 from minarca_client.ui.dashboard import DashboardView
 from minarca_client.ui.tests import BaseAppTest
@@ -35,7 +36,60 @@ class BackupLogsTest(BaseAppTest):
         # Then the view get updated (within 2 sec) with 2 lines of text.
         await self.pump_events()
         await asyncio.sleep(2)
-        self.assertEqual(self.view.ids.logview.text, 'first line of logs\nsecond line of text\n')
+        self.assertEqual(
+            ['first line of logs', 'second line of text'], [item['text'] for item in self.view.ids.logview.data]
+        )
+        # When more lines are written
+        with open(self.instance.backup_log_file, 'a') as f:
+            f.write('third line\n')
+        # Then the lines are appended to the view
+        await asyncio.sleep(2)
+        self.assertEqual('third line', self.view.ids.logview.data[-1]['text'])
+        self.assertEqual(3, len(self.view.ids.logview.data))
+        # Cleanup
+        _readlogs_task = self.view._readlogs_task
+        self.app.set_active_view('dashboard.DashboardView')
+        try:
+            await _readlogs_task
+        except asyncio.CancelledError:
+            pass
+
+    async def test_search_logs(self):
+        # Given user display backup logs with errors
+        status = self.instance.status
+        status.action = 'backup'
+        status.lastdate = int(time.time())
+        status.save()
+        with open(self.instance.backup_log_file, 'w+') as f:
+            f.write('starting backup\n')
+            f.write('ERROR: something wrong\n')
+            f.write('backup completed\n')
+        await self.pump_events()
+        await asyncio.sleep(2)
+        # When searching text
+        self.view.search_text = 'BACKUP'
+        await self.view._filter_task
+        # Then matching lines are displayed with line number
+        self.assertEqual(
+            ['1: starting backup', '3: backup completed'], [item['text'] for item in self.view.ids.logview.data]
+        )
+        # When filtering errors
+        self.view.search_text = ''
+        self.view.level_filter = LEVEL_ERROR
+        await self.view._filter_task
+        # Then error lines are displayed
+        self.assertEqual(['2: ERROR: something wrong'], [item['text'] for item in self.view.ids.logview.data])
+        # When jumping to next error
+        self.view.level_filter = LEVEL_INFO
+        await self.view._filter_task
+        self.view.next_error()
+        await self.view._filter_task
+        # Then lines around the error are displayed
+        self.assertEqual(3, len(self.view.ids.logview.data))
+        # When scrolling to bottom
+        self.view.scroll_down()
+        # Then the end of file is displayed
+        self.assertEqual('backup completed', self.view.ids.logview.data[-1]['text'])
         # Cleanup
         _readlogs_task = self.view._readlogs_task
         self.app.set_active_view('dashboard.DashboardView')
@@ -99,4 +99,22 @@ class BackupRestoreFilesTest2(BaseAppTest):
             data = dict(rv.children[0].data)
             file_item.toggle_checkbox_state()
             await self.pump_events()
-            self.assertEqual(self.view.selected_files, [data])
+            self.assertEqual(self.view.selection.paths(), [data['text']])
+            self.assertEqual(self.view.selected_count, 1)
+
+    async def test_open_folder(self):
+        # Given a view displaying the top level folders
+        await self.view._fetch_files_task
+        folder = self.view.file_items[0]['text']
+        self.assertTrue(self.view.file_items[0]['is_dir'])
+        # When user open a folder
+        self.view.open_folder(folder)
+        await self.view._fetch_files_task
+        # Then the folder content is displayed
+        self.assertEqual(folder, self.view.current_path)
+        self.assertTrue(all(os.path.dirname(item['text']) == folder for item in self.view.file_items))
+        # When user go back to parent folder
+        self.view.open_parent()
+        await self.view._fetch_files_task
+        # Then top level folders are displayed
+        self.assertEqual('', self.view.current_path)